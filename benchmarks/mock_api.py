@@ -0,0 +1,207 @@
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.bot.api.flow_parser import COUNT_TYPES
+
+
+def location_codes(count):
+    """合成馆区：{代码: 名称}"""
+    return {f"BENCH-{i:04d}": f"基准馆{i:04d}" for i in range(count)}
+
+
+def _base_count(code):
+    # 按馆区代码固定的规模，重启服务后保持一致
+    return 200 + zlib.crc32(code.encode()) % 3000
+
+
+def location_record(code, name, moment):
+    """GetBigFlowByLocations 单个馆区的返回结构，日计数随当天时间递增"""
+    base = _base_count(code)
+    progress = (moment.hour * 60 + moment.minute) / (24 * 60)
+    daily = int(base * progress)
+    counts = {"日": daily, "周": base * 5, "月": base * 22, "年": base * 260, "总": base * 2600}
+    return {
+        "orgLocation": code,
+        "orgLocationName": name,
+        "statisticsTime": moment.strftime("%Y-%m-%d %H:%M:%S"),
+        "fCount": [
+            {"countType": count_type, "dateType": date_type, "personCount": counts[count_type]}
+            for count_type in COUNT_TYPES
+            for date_type in (0, 1)
+        ],
+    }
+
+
+def build_response(locations, org_locations=None, moment=None, success=True):
+    moment = moment or datetime.now()
+    wanted = locations if org_locations is None else org_locations
+    data = [
+        location_record(code, locations.get(code, code), moment)
+        for code in wanted
+    ]
+    return {"isSuccess": success, "message": "" if success else "mock failure", "data": data}
+
+
+class MockFlowAPI:
+    """本地 GetBigFlowByLocations 替身：可注入延迟、HTTP 错误、isSuccess=false 与超时
+
+    每个请求按 seed 决定是否注入故障，同样的参数得到同样的故障序列。
+    """
+
+    def __init__(
+        self,
+        locations=500,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        invalid_rate=0.0,
+        timeout_rate=0.0,
+        hang_seconds=60.0,
+        seed=0,
+    ):
+        self.locations = location_codes(locations) if isinstance(locations, int) else dict(locations)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.invalid_rate = invalid_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.stats = {"requests": 0, "errors": 0, "invalid": 0, "timeouts": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/alvarainflow/api/WwStatisticsLog/GetBigFlowByLocations"
+
+    def _decide(self):
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self._random.random()
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if roll < self.timeout_rate:
+                outcome = "timeouts"
+            elif roll < self.timeout_rate + self.error_rate:
+                outcome = "errors"
+            elif roll < self.timeout_rate + self.error_rate + self.invalid_rate:
+                outcome = "invalid"
+            else:
+                outcome = None
+            if outcome:
+                self.stats[outcome] += 1
+        return outcome, delay
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    payload = {}
+                outcome, delay = api._decide()
+                if outcome == "timeouts":
+                    api._stopped.wait(api.hang_seconds)
+                    self.close_connection = True
+                    return
+                if delay:
+                    time.sleep(delay)
+                if outcome == "errors":
+                    self._reply(500, b'{"message": "mock error"}')
+                    return
+                body = build_response(
+                    api.locations,
+                    payload.get("orgLocations"),
+                    success=outcome != "invalid",
+                )
+                self._reply(200, json.dumps(body, ensure_ascii=False).encode("utf-8"))
+
+            def _reply(self, status, body):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="mock-flow-api", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地人流接口替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--locations", type=int, default=500, help="合成馆区数")
+    parser.add_argument("--latency", type=float, default=0.0, help="固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="附加 0~N 秒随机延迟")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 HTTP 500 的比例")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="返回 isSuccess=false 的比例")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="挂起不返回的比例")
+    parser.add_argument("--hang-seconds", type=float, default=60.0, help="挂起时长（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    api = MockFlowAPI(
+        locations=args.locations,
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        invalid_rate=args.invalid_rate,
+        timeout_rate=args.timeout_rate,
+        hang_seconds=args.hang_seconds,
+        seed=args.seed,
+    ).start()
+    logging.info("接口替身已启动 %s 馆区数=%s", api.url, len(api.locations))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.stop()
+        logging.info("接口替身已停止 %s", api.stats)
+
+
+if __name__ == "__main__":
+    main()
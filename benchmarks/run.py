@@ -0,0 +1,375 @@
+import argparse
+import contextlib
+import io
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from benchmarks.mock_api import MockFlowAPI, build_response, location_codes
+from benchmarks.synthetic import DEFAULT_WORKDIR, generate_history, prepare_workdir
+from src.bot.api.flow_parser import StreamingFlowParser
+from src.bot.service.traffic_service import LibraryFlowMonitor
+from src.bot.storage.database import Database
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RESULT_VERSION = 1
+SYNTHETIC_META = "data/synthetic.json"
+
+
+def measure(func, repeat, warmup=1):
+    """执行 warmup 次预热后计时 repeat 次，返回耗时统计（秒）"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return {
+        "runs": repeat,
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextlib.contextmanager
+def _quiet(verbose):
+    if verbose:
+        yield
+        return
+    logging.disable(logging.ERROR)
+    try:
+        yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def _chunks(body, size=64 * 1024):
+    return (body[i:i + size] for i in range(0, len(body), size))
+
+
+def _random_ranges(first_date, last_date, count, seed):
+    """按周报、月度、年度、节假日长度混合抽取的查询区间"""
+    rng = random.Random(seed)
+    span = (last_date - first_date).days
+    ranges = []
+    for index in range(count):
+        days = (7, 31, 365, 8)[index % 4]
+        start = first_date + timedelta(days=rng.randint(0, max(span - days, 0)))
+        end = start + timedelta(days=days - 1)
+        ranges.append((start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")))
+    return ranges
+
+
+class BenchmarkSuite:
+    def __init__(self, args):
+        self.args = args
+        self.results = {}
+        self.db = None
+        self.locations = None
+        self.history_range = None
+
+    def record(self, name, stats, **extra):
+        stats.update(extra)
+        self.results[name] = stats
+        print(
+            f"{name:<28} median={stats['median'] * 1000:10.2f}ms "
+            f"min={stats['min'] * 1000:10.2f}ms runs={stats['runs']}",
+            file=sys.stderr,
+        )
+
+    def setup_history(self):
+        args = self.args
+        self.db = Database()
+        meta_path = Path(SYNTHETIC_META)
+        params = {"years": args.years, "locations": args.locations, "seed": args.seed}
+        if args.reuse and meta_path.exists():
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if meta.get("params") == params:
+                self.locations = location_codes(args.locations)
+                self.history_range = tuple(
+                    datetime.strptime(x, "%Y-%m-%d").date() for x in meta["range"]
+                )
+                print(f"复用合成数据库 {meta['range'][0]} ~ {meta['range'][1]}", file=sys.stderr)
+                return
+
+        started = time.perf_counter()
+        loaded, self.locations, self.history_range = generate_history(
+            self.db, args.years, args.locations, seed=args.seed
+        )
+        elapsed = time.perf_counter() - started
+        self.record(
+            "synthetic_bulk_load",
+            {"runs": 1, "min": elapsed, "median": elapsed, "mean": elapsed, "max": elapsed},
+            rows=loaded,
+        )
+        meta_path.write_text(
+            json.dumps(
+                {"params": params, "range": [x.strftime("%Y-%m-%d") for x in self.history_range]}
+            ),
+            encoding="utf-8",
+        )
+
+    def bench_parse(self):
+        args = self.args
+        data = build_response(self.locations)
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        parser = StreamingFlowParser(self.locations)
+        monitor = LibraryFlowMonitor(library_codes=self.locations, detect_anomalies=False)
+        try:
+            self.record(
+                "stream_parse",
+                measure(lambda: parser(_chunks(body)), args.repeat),
+                response_bytes=len(body),
+            )
+            self.record(
+                "parse_daily_flow",
+                measure(lambda: monitor.service.parse_daily_flow(data), args.repeat),
+                locations=len(self.locations),
+            )
+        finally:
+            monitor.close()
+
+    def bench_insert(self):
+        stat_date = (self.history_range[1] + timedelta(days=1)).strftime("%Y-%m-%d")
+        flow_data = {
+            code: {"name": name, "daily_in": 0, "daily_out": 0}
+            for code, name in self.locations.items()
+        }
+
+        def insert():
+            # 每次都是新的日内快照：所有馆区计数增加，走完整写入路径
+            for item in flow_data.values():
+                item["daily_in"] += 7
+            self.db.insert_daily_flow(stat_date, flow_data)
+
+        self.record(
+            "insert_daily_flow",
+            measure(insert, self.args.repeat),
+            locations=len(flow_data),
+        )
+
+    def bench_queries(self):
+        # 关闭查询缓存，测量的是 SQL 本身
+        db = Database(cache_size=0)
+        try:
+            ranges = _random_ranges(*self.history_range, count=20, seed=self.args.seed)
+            self.record(
+                "get_flow_between",
+                measure(lambda: [db.get_flow_between(*x) for x in ranges], self.args.repeat),
+                queries=len(ranges),
+            )
+        finally:
+            db.close()
+
+    def bench_render(self):
+        monitor = LibraryFlowMonitor(
+            db=self.db, library_codes=self.locations, detect_anomalies=False
+        )
+        try:
+            end_date = self.history_range[1]
+            start_date = end_date - timedelta(days=6)
+            start, end = start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
+            current = self.db.get_flow_between(start, end)
+            previous = self.db.get_flow_between(
+                (start_date - timedelta(days=7)).strftime("%Y-%m-%d"),
+                (end_date - timedelta(days=7)).strftime("%Y-%m-%d"),
+            )
+            self.record(
+                "format_output_for_dingtalk",
+                measure(
+                    lambda: monitor.format_output_for_dingtalk(
+                        current, "weekly", start, end, comparison_flow_data=previous
+                    ),
+                    self.args.repeat,
+                ),
+                locations=len(current),
+            )
+
+            def trend():
+                series = monitor._load_series(start, end)
+                return monitor._trend_lines(series, "weekly", start, end, current)
+
+            self.record("trend_analytics", measure(trend, self.args.repeat))
+        finally:
+            monitor.close()
+
+    def _bench_run_once(self, name, api_options, timeout=None):
+        args = self.args
+        primary = MockFlowAPI(self.locations, seed=args.seed, **api_options).start()
+        backup = MockFlowAPI(self.locations, seed=args.seed + 1, latency=args.latency).start()
+        monitor = LibraryFlowMonitor(
+            db=self.db,
+            primary_url=primary.url,
+            backup_url=backup.url,
+            library_codes=self.locations,
+            batch_size=args.batch_size,
+            max_workers=args.workers,
+        )
+        if timeout is not None:
+            monitor.service.api.timeout = timeout
+        try:
+            # 没有配置机器人时报告打印到标准输出，注入的故障也会记错误日志，计时期间都丢弃
+            with contextlib.redirect_stdout(io.StringIO()), _quiet(args.verbose):
+                stats = measure(monitor.run_once, args.run_once_repeat)
+        finally:
+            monitor.close()
+            primary.stop()
+            backup.stop()
+        self.record(name, stats, primary=primary.stats, backup=backup.stats)
+
+    def bench_run_once(self):
+        args = self.args
+        self._bench_run_once("run_once", {"latency": args.latency})
+        self._bench_run_once(
+            "run_once_degraded",
+            {
+                "latency": args.latency,
+                "jitter": args.latency,
+                "error_rate": 0.3,
+                "invalid_rate": 0.1,
+                "timeout_rate": 0.1,
+                "hang_seconds": 3,
+            },
+            timeout=1,
+        )
+
+    def run(self, only=None):
+        steps = [
+            ("parse", self.bench_parse),
+            ("insert", self.bench_insert),
+            ("queries", self.bench_queries),
+            ("render", self.bench_render),
+            ("run_once", self.bench_run_once),
+        ]
+        self.setup_history()
+        try:
+            for name, step in steps:
+                if only and name not in only:
+                    continue
+                step()
+        finally:
+            self.db.close()
+        return self.results
+
+
+def compare(results, baseline, threshold):
+    """与基线比较中位数，返回变慢超过 threshold 的项"""
+    regressions = []
+    print(f"{'benchmark':<28} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, stats in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous.get("median"):
+            print(f"{name:<28} {'-':>12} {stats['median'] * 1000:10.2f}ms {'new':>8}")
+            continue
+        change = stats["median"] / previous["median"] - 1
+        flag = " !" if change > threshold else ""
+        print(
+            f"{name:<28} {previous['median'] * 1000:10.2f}ms {stats['median'] * 1000:10.2f}ms "
+            f"{change:+8.1%}{flag}"
+        )
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="人流监控基准测试")
+    parser.add_argument("--years", type=float, default=2, help="合成历史年数，全量规模可用 10")
+    parser.add_argument("--locations", type=int, default=100, help="合成馆区数，全量规模可用 500")
+    parser.add_argument("--repeat", type=int, default=20, help="各微基准的计时次数")
+    parser.add_argument("--run-once-repeat", type=int, default=3, help="run_once 的计时次数")
+    parser.add_argument("--latency", type=float, default=0.05, help="接口替身的基础延迟（秒）")
+    parser.add_argument("--batch-size", type=int, default=50, help="分片大小，与 --batch-size 含义相同")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--only",
+        action="append",
+        choices=["parse", "insert", "queries", "render", "run_once"],
+        help="只运行指定的基准，可重复",
+    )
+    parser.add_argument("--workdir", default=str(DEFAULT_WORKDIR), help="合成数据库所在工作目录")
+    parser.add_argument(
+        "--reuse",
+        action="store_true",
+        help="工作目录中已有相同参数生成的数据库时直接复用，跳过生成（不输出 synthetic_bulk_load）",
+    )
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--compare", help="基线结果 JSON，中位数变慢超过 --threshold 时退出码为 1")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="输出应用 INFO 日志")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+    output = Path(args.output).resolve() if args.output else None
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+    prepare_workdir(args.workdir, fresh=not args.reuse)
+
+    results = BenchmarkSuite(args).run(only=args.only)
+    report = {
+        "version": RESULT_VERSION,
+        "commit": _git_commit(),
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "years": args.years,
+            "locations": args.locations,
+            "repeat": args.repeat,
+            "run_once_repeat": args.run_once_repeat,
+            "latency": args.latency,
+            "batch_size": args.batch_size,
+            "workers": args.workers,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if baseline is not None:
+        if baseline.get("params") != report["params"]:
+            print("注意：基线参数与本次不同，比较结果仅供参考", file=sys.stderr)
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            print(f"性能回退: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
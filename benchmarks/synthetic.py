@@ -0,0 +1,94 @@
+import argparse
+import logging
+import math
+import os
+import random
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from benchmarks.mock_api import _base_count, location_codes
+from src.bot.storage.database import DB_PATH, Database
+
+DEFAULT_WORKDIR = Path(__file__).resolve().parent / ".work"
+
+
+def _season(day):
+    # 寒暑假高、开学季低，周末比工作日高约三成
+    seasonal = 1.0 + 0.25 * math.cos((day.timetuple().tm_yday - 200) / 365 * 2 * math.pi)
+    return seasonal * (1.3 if day.weekday() >= 5 else 1.0)
+
+
+def iter_history(locations, start_date, end_date, seed=0):
+    """按日产出 (stat_date, area_code, area_name, in_count, fetched_at)，与 backfill.read_records 一致"""
+    rng = random.Random(seed)
+    bases = [(code, name, _base_count(code)) for code, name in locations.items()]
+    day = start_date
+    while day <= end_date:
+        stat_date = day.strftime("%Y-%m-%d")
+        fetched_at = f"{stat_date} 21:00:00"
+        factor = _season(day)
+        for code, name, base in bases:
+            yield stat_date, code, name, int(base * factor * rng.uniform(0.85, 1.15)), fetched_at
+        day += timedelta(days=1)
+
+
+def generate_history(db, years=10, locations=500, end_date=None, seed=0, chunk_size=20000):
+    """向 db 批量写入 years 年 × locations 个馆区的合成日数据，返回 (行数, 馆区字典, 起止日期)"""
+    codes = location_codes(locations) if isinstance(locations, int) else dict(locations)
+    end_date = end_date or date.today() - timedelta(days=1)
+    start_date = end_date - timedelta(days=round(365.25 * years) - 1)
+    started = time.perf_counter()
+    loaded = db.bulk_load_daily_flow(
+        iter_history(codes, start_date, end_date, seed), chunk_size=chunk_size
+    )
+    logging.info(
+        "合成历史数据完成 rows=%s 区间=%s~%s 耗时=%.2fs",
+        loaded,
+        start_date,
+        end_date,
+        time.perf_counter() - started,
+    )
+    return loaded, codes, (start_date, end_date)
+
+
+def prepare_workdir(workdir, fresh=True):
+    """数据库路径固定为相对当前目录的 data/bot.db，基准测试在独立工作目录中运行，不碰真实数据"""
+    workdir = Path(workdir).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+    if fresh:
+        for suffix in ("", "-wal", "-shm"):
+            path = Path(f"data/bot.db{suffix}")
+            if path.exists():
+                path.unlink()
+    return workdir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成的多年人流历史数据库")
+    parser.add_argument("--years", type=float, default=10)
+    parser.add_argument("--locations", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=20000)
+    parser.add_argument(
+        "--workdir",
+        default=str(DEFAULT_WORKDIR),
+        help="工作目录，数据库写入其下的 data/bot.db（会先删除已有文件）",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    prepare_workdir(args.workdir)
+    db = Database()
+    try:
+        loaded, _, (start_date, end_date) = generate_history(
+            db, args.years, args.locations, seed=args.seed, chunk_size=args.chunk_size
+        )
+    finally:
+        db.close()
+    print(f"已生成 {loaded} 行（{start_date} ~ {end_date}）: {Path(DB_PATH).resolve()}")
+
+
+if __name__ == "__main__":
+    main()
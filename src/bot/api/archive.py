@@ -0,0 +1,95 @@
+import hashlib
+import logging
+import threading
+import zlib
+from datetime import datetime
+
+CODEC_ZLIB = "zlib"
+
+
+class ResponseCapture:
+    """包装响应块迭代器：边读边计算 sha256 并压缩，不额外保留原文"""
+
+    def __init__(self, chunks, level=6):
+        self._chunks = chunks
+        self._hash = hashlib.sha256()
+        self._compressor = zlib.compressobj(level)
+        self._parts = []
+        self.raw_size = 0
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            self.feed(chunk)
+            yield chunk
+
+    def feed(self, chunk):
+        self._hash.update(chunk)
+        self._parts.append(self._compressor.compress(chunk))
+        self.raw_size += len(chunk)
+
+    def finish(self):
+        self._parts.append(self._compressor.flush())
+        return self._hash.hexdigest(), b"".join(self._parts)
+
+
+class ResponseArchive:
+    """原始响应归档：按内容哈希去重，相同响应只存一份正文，每次请求只记一条引用
+
+    与 EndpointHealthTracker 一样，请求线程只在内存中暂存，由调用方线程 flush 写库。
+    """
+
+    def __init__(self, store=None, level=6, now_func=None):
+        self.store = store
+        self.level = level
+        self.now_func = now_func or datetime.now
+        # 由 TrafficService.begin_collection 设置，同一次采集的各分片响应与写库共用该时间戳
+        self.collected_at = None
+        self._pending = []
+        self._last_digest = None
+        self._lock = threading.Lock()
+
+    def capture(self, chunks):
+        return ResponseCapture(chunks, self.level)
+
+    def record(self, endpoint, capture):
+        digest, body = capture.finish()
+        fetched_at = self.collected_at or self.now_func().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            # 与上一条相同的响应不再携带正文，写库时只追加引用；
+            # 上一条仍在暂存时与它同一事务写入，否则须是已写入库中的正文
+            previous = self._pending[-1][2] if self._pending else self._last_digest
+            if digest == previous:
+                body = None
+            self._pending.append((fetched_at, endpoint, digest, CODEC_ZLIB, body, capture.raw_size))
+
+    def flush(self):
+        """写库失败时暂存的记录放回队首，下次 flush 连同正文一起重试"""
+        if self.store is None:
+            return
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return
+        try:
+            self.store.archive_responses(rows)
+        except Exception as exc:
+            with self._lock:
+                self._pending[:0] = rows
+            logging.error("原始响应归档写库失败，%s 条待下次重试: %s", len(rows), exc)
+            return
+        with self._lock:
+            self._last_digest = rows[-1][2]
+
+
+def iter_body(codec, body, chunk_size=64 * 1024):
+    """按块解压归档正文"""
+    if codec != CODEC_ZLIB:
+        raise ValueError(f"不支持的归档编码: {codec}")
+    decompressor = zlib.decompressobj()
+    for offset in range(0, len(body), chunk_size):
+        data = decompressor.decompress(body[offset:offset + chunk_size])
+        if data:
+            yield data
+    tail = decompressor.flush()
+    if tail:
+        yield tail
@@ -0,0 +1,202 @@
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, math.ceil(percentile * len(values)) - 1))
+    return values[index]
+
+
+class EndpointHealth:
+    def __init__(self, endpoint, window=50):
+        self.endpoint = endpoint
+        self.samples = deque(maxlen=window)
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_success_at = None
+        self.probing = False
+
+    def latencies(self):
+        return [latency for ok, latency, _ in self.samples if ok]
+
+    def error_rate(self):
+        if not self.samples:
+            return 0.0
+        return sum(1 for ok, _, _ in self.samples if not ok) / len(self.samples)
+
+    def to_row(self):
+        return {
+            "endpoint": self.endpoint,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_at": self.opened_at,
+            "last_success_at": self.last_success_at,
+            "samples": json.dumps([list(x) for x in self.samples]),
+        }
+
+    @classmethod
+    def from_row(cls, row, window=50):
+        health = cls(row["endpoint"], window=window)
+        health.state = row["state"]
+        health.consecutive_failures = int(row["consecutive_failures"])
+        health.opened_at = row["opened_at"]
+        health.last_success_at = row["last_success_at"]
+        try:
+            for ok, latency, ts in json.loads(row["samples"] or "[]"):
+                health.samples.append((bool(ok), float(latency), float(ts)))
+        except (TypeError, ValueError):
+            logging.warning("接口健康度样本损坏，已忽略: %s", row["endpoint"])
+        if health.state == STATE_HALF_OPEN:
+            health.state = STATE_OPEN
+        return health
+
+
+class EndpointHealthTracker:
+    """记录各接口近期耗时、错误率与最近成功时间，并按熔断状态与 p50 耗时排序"""
+
+    def __init__(self, store=None, window=50, failure_threshold=3, open_seconds=300):
+        self.store = store
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._endpoints = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+        if store is not None:
+            for row in store.load_endpoint_health():
+                health = EndpointHealth.from_row(row, window=window)
+                self._endpoints[health.endpoint] = health
+
+    def _get(self, endpoint):
+        health = self._endpoints.get(endpoint)
+        if health is None:
+            health = EndpointHealth(endpoint, window=self.window)
+            self._endpoints[endpoint] = health
+        return health
+
+    def allow_request(self, endpoint):
+        with self._lock:
+            health = self._get(endpoint)
+            if health.state == STATE_CLOSED:
+                return True
+            if health.state == STATE_OPEN:
+                if not self._probe_due(health):
+                    return False
+                health.state = STATE_HALF_OPEN
+                health.probing = False
+                self._dirty.add(endpoint)
+                logging.info("接口熔断进入半开状态，允许探测: %s", endpoint)
+            if health.probing:
+                return False
+            health.probing = True
+            return True
+
+    def record_success(self, endpoint, latency):
+        with self._lock:
+            health = self._get(endpoint)
+            now = time.time()
+            health.samples.append((True, latency, now))
+            health.consecutive_failures = 0
+            health.last_success_at = now
+            if health.state != STATE_CLOSED:
+                logging.info("接口恢复，关闭熔断: %s", endpoint)
+            health.state = STATE_CLOSED
+            health.opened_at = None
+            health.probing = False
+            self._dirty.add(endpoint)
+
+    def record_failure(self, endpoint, latency):
+        with self._lock:
+            health = self._get(endpoint)
+            now = time.time()
+            health.samples.append((False, latency, now))
+            health.consecutive_failures += 1
+            health.probing = False
+            if health.state == STATE_HALF_OPEN or (
+                health.state == STATE_CLOSED
+                and health.consecutive_failures >= self.failure_threshold
+            ):
+                health.state = STATE_OPEN
+                health.opened_at = now
+                logging.warning(
+                    "接口熔断打开: %s 连续失败=%s", endpoint, health.consecutive_failures
+                )
+            self._dirty.add(endpoint)
+
+    def latency_percentile(self, endpoint, percentile):
+        with self._lock:
+            return _percentile(self._get(endpoint).latencies(), percentile)
+
+    def sample_count(self, endpoint):
+        with self._lock:
+            return len(self._get(endpoint).latencies())
+
+    def _probe_due(self, health):
+        return (
+            health.state == STATE_OPEN
+            and time.time() - (health.opened_at or 0) >= self.open_seconds
+        )
+
+    def rank(self, endpoints):
+        """按可用性与近期 p50 耗时排序；熔断中的接口排最后，无耗时样本的接口按传入顺序靠后"""
+        with self._lock:
+            keys = {}
+            for endpoint in endpoints:
+                health = self._get(endpoint)
+                blocked = health.state == STATE_OPEN and not self._probe_due(health)
+                p50 = _percentile(health.latencies(), 0.5)
+                keys[endpoint] = (blocked, p50 if p50 is not None else math.inf)
+        return sorted(endpoints, key=lambda x: keys[x])
+
+    def is_available(self, endpoint):
+        with self._lock:
+            health = self._get(endpoint)
+            if health.state == STATE_CLOSED:
+                return True
+            if health.state == STATE_OPEN:
+                return self._probe_due(health)
+            return not health.probing
+
+    def is_probing(self, endpoint):
+        with self._lock:
+            return self._get(endpoint).state == STATE_HALF_OPEN
+
+    def fallback(self, endpoints):
+        """全部接口熔断时，返回最早熔断、最接近恢复的接口用于强制探测"""
+        with self._lock:
+            return min(endpoints, key=lambda x: self._get(x).opened_at or 0)
+
+    def stats(self, endpoint):
+        with self._lock:
+            health = self._get(endpoint)
+            latencies = health.latencies()
+            return {
+                "state": health.state,
+                "p50": _percentile(latencies, 0.5),
+                "p95": _percentile(latencies, 0.95),
+                "error_rate": health.error_rate(),
+                "last_success_at": health.last_success_at,
+                "consecutive_failures": health.consecutive_failures,
+            }
+
+    def flush(self):
+        if self.store is None:
+            return
+        with self._lock:
+            rows = [self._endpoints[x].to_row() for x in self._dirty]
+            self._dirty.clear()
+        if rows:
+            self.store.save_endpoint_health(rows)
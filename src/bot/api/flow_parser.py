@@ -0,0 +1,253 @@
+import codecs
+import json
+import re
+
+COUNT_TYPES = {"日": "daily", "周": "weekly", "月": "monthly", "年": "yearly", "总": "total"}
+DATE_TYPES = {0: "in", 1: "out"}
+
+# (countType, dateType) -> 结果字段名，解析时一次字典查找代替逐个字符串比较
+COUNT_FIELDS = {
+    (count_type, date_type): f"{prefix}_{suffix}"
+    for count_type, prefix in COUNT_TYPES.items()
+    for date_type, suffix in DATE_TYPES.items()
+}
+
+# 一次匹配跳过括号之间的所有内容（含完整字符串），只有括号需要逐个处理
+_SKIP_RUN = re.compile(r'[^"{}\[\]]*(?:"(?:[^"\\]|\\.)*"[^"{}\[\]]*)*')
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+_SCALAR_END = re.compile(r"[,\]}\s]")
+_WHITESPACE = " \t\n\r"
+_COMPACT_AT = 64 * 1024
+_DECODER = json.JSONDecoder()
+
+
+class FlowParseError(ValueError):
+    pass
+
+
+def empty_counts():
+    return dict.fromkeys(COUNT_FIELDS.values(), 0)
+
+
+def summarize_location(name, f_counts):
+    """把一个馆区的 fCount 列表汇总为 {name, daily_in, daily_out, weekly_in, ...}"""
+    summary = {"name": name}
+    summary.update(empty_counts())
+    for item in f_counts:
+        field = COUNT_FIELDS.get((item.get("countType"), item.get("dateType")))
+        if field:
+            summary[field] = int(item.get("personCount", 0) or 0)
+    return summary
+
+
+class _Reader:
+    """按块读取响应文本，只保留尚未消费的部分"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        while not self.eof:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.eof = True
+                text = self._decoder.decode(b"", final=True)
+            elif isinstance(chunk, str):
+                text = chunk
+            else:
+                text = self._decoder.decode(chunk)
+            if text:
+                self.buf += text
+                return True
+        return False
+
+    def peek(self):
+        """跳过空白并返回下一个字符，结尾时返回空串"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                if self.pos > _COMPACT_AT:
+                    self.buf = self.buf[self.pos:]
+                    self.pos = 0
+                return self.buf[self.pos]
+            self.buf = ""
+            self.pos = 0
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise FlowParseError(f"响应格式错误：期望 {char!r}")
+        self.pos += 1
+
+    def next_member(self, closing, first):
+        """对象或数组中是否还有下一个成员，遇到 closing 时消费它并返回 False"""
+        char = self.peek()
+        if char == closing:
+            self.pos += 1
+            return False
+        if not first:
+            if char != ",":
+                raise FlowParseError(f"响应格式错误：期望 ',' 或 {closing!r}")
+            self.pos += 1
+        return True
+
+    def _scan_end(self, depth=0):
+        """扫描到当前值的结束位置，已扫过的内容随即丢弃，不构建任何对象"""
+        self.peek()
+        i = self.pos
+        if depth == 0 and self.buf[i:i + 1] not in ('"', "{", "["):
+            while True:
+                match = _SCALAR_END.search(self.buf, i)
+                if match:
+                    return match.start()
+                self.buf = ""
+                self.pos = 0
+                i = 0
+                if not self._fill():
+                    return len(self.buf)
+
+        if depth == 0 and self.buf[i] == '"':
+            while True:
+                match = _STRING.match(self.buf, i)
+                if match:
+                    return match.end()
+                self.buf = self.buf[i:]
+                self.pos = i = 0
+                if not self._fill():
+                    raise FlowParseError("响应意外结束")
+
+        while True:
+            i = _SKIP_RUN.match(self.buf, i).end()
+            if i >= len(self.buf) or self.buf[i] == '"':
+                # 字符串被块边界截断，保留未完成部分再读一块
+                self.buf = self.buf[i:]
+                self.pos = i = 0
+                if not self._fill():
+                    raise FlowParseError("响应意外结束")
+                continue
+            char = self.buf[i]
+            i += 1
+            if char in "{[":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return i
+
+    def skip(self):
+        self.pos = self._scan_end()
+
+    def skip_rest(self):
+        """跳过当前对象剩余的成员（含结尾的 '}'）"""
+        self.pos = self._scan_end(depth=1)
+
+    def value(self):
+        """解码当前值；值不完整时再读入一块重试，数字需确认其后已有分隔符"""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except ValueError as exc:
+                # 值不完整：读到已缓存长度翻倍再重试，避免按块反复解码
+                target = len(self.buf) + max(len(self.buf) - self.pos, 1)
+                if not self._fill():
+                    raise FlowParseError(f"响应格式错误: {exc}") from exc
+                while len(self.buf) < target and self._fill():
+                    pass
+                continue
+            if end < len(self.buf) or not self._fill():
+                self.pos = end
+                return value
+
+    def key(self):
+        if self.peek() != '"':
+            raise FlowParseError("响应格式错误：期望字段名")
+        key = self.value()
+        self.expect(":")
+        return key
+
+
+class StreamingFlowParser:
+    """增量解析人流接口响应：不在 library_codes 内的馆区直接跳过，不构建其对象，内存占用与馆区数量无关
+
+    返回 {"isSuccess": bool, "flow": {orgLocation: summarize_location 结果}}
+    """
+
+    def __init__(self, library_codes=None):
+        self.library_codes = library_codes
+
+    def __call__(self, chunks):
+        return self.parse(chunks)
+
+    def _wanted(self, code):
+        return self.library_codes is None or code in self.library_codes
+
+    def parse(self, chunks):
+        reader = _Reader(chunks)
+        result = {"isSuccess": False, "flow": {}}
+        reader.expect("{")
+        first = True
+        while reader.next_member("}", first):
+            first = False
+            key = reader.key()
+            if key == "isSuccess":
+                result["isSuccess"] = bool(reader.value())
+            elif key == "data" and reader.peek() == "[":
+                self._parse_locations(reader, result["flow"])
+            else:
+                reader.skip()
+        return result
+
+    def _parse_locations(self, reader, flow):
+        reader.expect("[")
+        first = True
+        while reader.next_member("]", first):
+            first = False
+            if reader.peek() != "{":
+                reader.skip()
+                continue
+            location = self._parse_location(reader)
+            if location is not None:
+                flow[location[0]] = location[1]
+
+    def _parse_location(self, reader):
+        reader.expect("{")
+        code = None
+        name = None
+        counts = None
+        first = True
+        while reader.next_member("}", first):
+            first = False
+            key = reader.key()
+            if key == "orgLocation":
+                code = reader.value()
+                if not self._wanted(code):
+                    reader.skip_rest()
+                    return None
+            elif key == "orgLocationName":
+                name = reader.value()
+            elif key == "fCount":
+                counts = self._parse_counts(reader)
+            else:
+                reader.skip()
+
+        if code is None:
+            return None
+        summary = {"name": name}
+        summary.update(counts or empty_counts())
+        return code, summary
+
+    def _parse_counts(self, reader):
+        """fCount 只对需要的馆区解码，单个馆区的计数列表很小，交给 json 的 C 实现一次解出"""
+        f_counts = reader.value()
+        if not isinstance(f_counts, list):
+            return empty_counts()
+        summary = summarize_location(None, (x for x in f_counts if isinstance(x, dict)))
+        del summary["name"]
+        return summary
@@ -1,6 +1,36 @@
 import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from src.bot.api.endpoint_health import EndpointHealthTracker
+from src.bot.api.flow_parser import FlowParseError
+from src.bot.metrics import METRICS
+
+
+def _is_valid_response(data):
+    return bool(data) and bool(data.get("isSuccess"))
+
+
+class _ChunkTimer:
+    """累计从响应读取各块所花的时间，用于从解析总耗时中扣除网络等待"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self.waited = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return next(self._chunks)
+        finally:
+            self.waited += time.perf_counter() - started
 
 
 class TrafficAPI:
@@ -11,30 +41,221 @@ class TrafficAPI:
         payload,
         headers,
         timeout=30,
+        hedge=False,
+        hedge_delay=2.0,
+        hedge_percentile=0.95,
+        pool_size=4,
+        health=None,
+        probe_timeout=5,
+        parser=None,
+        chunk_size=64 * 1024,
+        archive=None,
     ):
         self.primary_url = primary_url
         self.backup_url = backup_url
         self.payload = payload
         self.headers = headers
         self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.pool_size = pool_size
+        self.health = health or EndpointHealthTracker()
+        self.probe_timeout = probe_timeout
+        self.parser = parser
+        self.chunk_size = chunk_size
+        self.archive = archive
+
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _session(self, url):
+        with self._lock:
+            session = self._sessions.get(url)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update(self.headers)
+                self._sessions[url] = session
+            return session
+
+    def _label(self, url):
+        return "(主接口)" if url == self.primary_url else "(备用接口)"
+
+    def _endpoint_name(self, url):
+        return "primary" if url == self.primary_url else "backup"
+
+    def hedge_budget(self, url=None):
+        """主接口在该时长内未返回即并发请求备用接口：取近期主接口耗时的分位数"""
+        url = url or self.primary_url
+        if self.health.sample_count(url) < 5:
+            return self.hedge_delay
+        return self.health.latency_percentile(url, self.hedge_percentile)
+
+    def _fetch_url(self, url, payload=None, timeout=None):
+        if timeout is None:
+            timeout = self.probe_timeout if self.health.is_probing(url) else self.timeout
+        started = time.perf_counter()
+        try:
+            response = self._session(url).post(
+                url,
+                json=payload if payload is not None else self.payload,
+                timeout=timeout,
+                stream=self.parser is not None,
+            )
+            with response:
+                response.raise_for_status()
+                capture = None
+                if self.parser is not None:
+                    chunks = response.iter_content(self.chunk_size)
+                    if self.archive is not None:
+                        chunks = capture = self.archive.capture(chunks)
+                    if METRICS.enabled:
+                        # 流式解析与读取响应交替进行，只统计解析本身的耗时
+                        chunks = _ChunkTimer(chunks)
+                        parse_started = time.perf_counter()
+                        data = self.parser(chunks)
+                        METRICS.observe(
+                            "parse_daily_flow",
+                            time.perf_counter() - parse_started - chunks.waited,
+                            self._endpoint_name(url),
+                        )
+                    else:
+                        data = self.parser(chunks)
+                else:
+                    data = response.json()
+                    if self.archive is not None:
+                        capture = self.archive.capture(())
+                        capture.feed(response.content)
+        except (requests.exceptions.RequestException, FlowParseError) as exc:
+            elapsed = time.perf_counter() - started
+            self.health.record_failure(url, elapsed)
+            METRICS.observe("fetch_flow_data", elapsed, self._endpoint_name(url))
+            logging.error("请求失败 %s: %s", self._label(url), exc)
+            return None
+
+        elapsed = time.perf_counter() - started
+        METRICS.observe("fetch_flow_data", elapsed, self._endpoint_name(url))
+        if _is_valid_response(data):
+            self.health.record_success(url, elapsed)
+            if capture is not None:
+                self.archive.record(url, capture)
+        else:
+            self.health.record_failure(url, elapsed)
+        return data
 
     def fetch_flow_data(self, use_backup=False):
         """获取人流数据"""
         url = self.backup_url if use_backup else self.primary_url
+        return self._fetch_url(url)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=2 * self.pool_size, thread_name_prefix="traffic-api"
+                )
+            return self._executor
+
+    def _fetch_hedged(self, first_url, second_url, payload=None):
+        executor = self._get_executor()
+        budget = self.hedge_budget(first_url)
+
+        first = executor.submit(self._fetch_url, first_url, payload)
+        done, _ = wait([first], timeout=budget)
+        if done:
+            data = first.result()
+            if _is_valid_response(data) or not self.health.allow_request(second_url):
+                return data
+            logging.warning("%s返回无效，切换%s", self._label(first_url), self._label(second_url))
+            return self._fetch_url(second_url, payload)
 
+        if not self.health.allow_request(second_url):
+            return first.result()
+
+        logging.warning(
+            "%s超过延迟预算 %.2fs，并发请求%s",
+            self._label(first_url),
+            budget,
+            self._label(second_url),
+        )
+        second = executor.submit(self._fetch_url, second_url, payload)
+        pending = {first, second}
+        data = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                data = future.result()
+                if _is_valid_response(data):
+                    for other in pending:
+                        other.cancel()
+                    logging.info(
+                        "对冲请求命中 %s",
+                        self._label(first_url if future is first else second_url),
+                    )
+                    return data
+        return data
+
+    def fetch_flow_data_hedged(self):
+        """对冲请求：主接口超出延迟预算后并发请求备用接口，取最先返回的有效结果"""
         try:
-            response = requests.post(
-                url,
-                json=self.payload,
-                headers=self.headers,
-                timeout=self.timeout,
-            )
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as exc:
-            logging.error(
-                "请求失败 %s: %s",
-                "(备用接口)" if use_backup else "(主接口)",
-                exc,
+            return self._fetch_hedged(self.primary_url, self.backup_url)
+        finally:
+            self.flush()
+
+    def fetch(self, payload=None, flush=True):
+        """按接口健康度排序请求，跳过熔断中的接口；开启对冲时在前两个可用接口间对冲
+
+        payload 为空时使用构造时的请求体；多线程并发调用时传 flush=False，由调用方统一 flush
+        """
+        ranked = self.health.rank([self.primary_url, self.backup_url])
+        candidates = [url for url in ranked if self.health.is_available(url)]
+        if len(candidates) < len(ranked):
+            logging.info(
+                "跳过熔断中的接口: %s",
+                ",".join(self._label(x) for x in ranked if x not in candidates),
             )
-            return None
+
+        data = None
+        try:
+            if not candidates:
+                fallback = self.health.fallback(ranked)
+                logging.warning("所有接口均处于熔断状态，强制探测%s", self._label(fallback))
+                # 强制探测的接口仍处于熔断（非半开）状态，需显式使用探测超时
+                return self._fetch_url(fallback, payload, timeout=self.probe_timeout)
+
+            if self.hedge and len(candidates) > 1 and self.health.allow_request(candidates[0]):
+                return self._fetch_hedged(candidates[0], candidates[1], payload)
+
+            previous_url = None
+            for url in candidates:
+                if not self.health.allow_request(url):
+                    continue
+                if previous_url:
+                    logging.warning("%s失败，尝试%s", self._label(previous_url), self._label(url))
+                data = self._fetch_url(url, payload)
+                if _is_valid_response(data):
+                    return data
+                previous_url = url
+            return data
+        finally:
+            if flush:
+                self.flush()
+
+    def flush(self):
+        """把请求线程暂存的接口健康度与原始响应归档写库，只在持有数据库连接的线程调用"""
+        self.health.flush()
+        if self.archive is not None:
+            self.archive.flush()
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            sessions, self._sessions = list(self._sessions.values()), {}
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        for session in sessions:
+            session.close()
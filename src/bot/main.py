@@ -1,11 +1,31 @@
+import argparse
+import asyncio
+import functools
+import json
 import logging
+import sys
+from datetime import datetime
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
 from dingtalkchatbot.chatbot import DingtalkChatbot
 
+from src.bot.metrics import METRICS
+from src.bot.service.async_monitor import AsyncLibraryFlowMonitor
+from src.bot.service.holiday_calendar import HolidayCalendar
+from src.bot.service.outbox import OutboxSender
+from src.bot.service.query_server import serve
+from src.bot.service.replay import SOURCES as REPLAY_SOURCES
+from src.bot.service.replay import replay
+from src.bot.service.scheduler import DailyTrigger, IntervalTrigger, Scheduler
+from src.bot.service.subscriptions import SubscriptionRegistry
 from src.bot.service.traffic_service import LibraryFlowMonitor
-from src.bot.storage.database import Database
+from src.bot.storage.backfill import read_records
+from src.bot.storage.connections import ConnectionManager
+from src.bot.storage.database import DB_PATH, Database
+from src.bot.storage.export import FORMATS as EXPORT_FORMATS
+from src.bot.storage.export import GRANULARITIES, export_history
+from src.bot.storage.migrations import LATEST_VERSION
 
 
 LOG_DIR = Path("logs")
@@ -37,7 +57,7 @@ def setup_logging():
 setup_logging()
 
 
-def main():
+def build_chatbot():
     webhook = (
         "https://openplatform-pro.ding.zj.gov.cn/robot/send?"
         "access_token=1bb3c90d0d1e1855e4851b9d30080bbb5763e173433512ebd6a66722d55625c9"
@@ -47,20 +67,465 @@ def main():
     try:
         if "YOUR_REAL_WEBHOOK_URL" in webhook:
             print("\u9519\u8bef\uff1a\u8bf7\u5c06 webhook \u66ff\u6362\u4e3a\u771f\u5b9e\u9489\u9489\u673a\u5668\u4eba\u5730\u5740")
-            chatbot = None
-        else:
-            chatbot = DingtalkChatbot(webhook, secret=secret)
+            return None
+        return DingtalkChatbot(webhook, secret=secret)
     except Exception as exc:
         logging.error("\u521d\u59cb\u5316\u9489\u9489\u673a\u5668\u4eba\u5931\u8d25: %s", exc)
-        chatbot = None
+        return None
+
+
+def load_locations(path):
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        locations = json.loads(path.read_text(encoding="utf-8"))
+    except Exception as exc:
+        logging.exception("读取馆区配置失败: %s", exc)
+        return None
+    if not isinstance(locations, dict) or not locations:
+        logging.warning("馆区配置为空或格式错误: %s", path)
+        return None
+    logging.info("馆区配置加载完成，馆区数=%s", len(locations))
+    return locations
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="浙图人流数据监控机器人")
+    parser.add_argument(
+        "--db-path",
+        default=str(DB_PATH),
+        help="SQLite 数据库路径，默认 data/bot.db；各子命令共用",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="常驻进程模式，由内置调度器定时执行，替代 cron 冷启动",
+    )
+    parser.add_argument(
+        "--daily-at",
+        default="21:00",
+        help="每日报告（含周报、节假日报判断）的执行时间，默认 21:00",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=int,
+        default=0,
+        help="日内采集间隔（分钟），0 表示关闭",
+    )
+    parser.add_argument(
+        "--collector",
+        action="store_true",
+        help="仅运行日内采集（常驻模式），按 --poll-interval 追加快照，不发送报告",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="主接口超出延迟预算时并发请求备用接口，取先返回的有效结果",
+    )
+    parser.add_argument(
+        "--locations",
+        default="config/locations.json",
+        help="馆区配置文件（{馆区代码: 名称}），不存在时使用内置的三个馆区",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=50,
+        help="每次请求的馆区数，馆区更多时分片并发请求，0 表示不分片",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="分片并发请求的线程数",
+    )
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        help="使用 asyncio 流水线：分片请求并发执行，写库由独立写线程完成",
+    )
+    parser.add_argument(
+        "--no-anomaly",
+        action="store_true",
+        help="关闭日内异常检测（计数停滞、突增、回退）与告警",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="记录各阶段耗时（接口、解析、写库、查询、渲染、发送），每次运行写入 run_metrics 表",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        help="同时把耗时直方图写成 Prometheus textfile（供 node_exporter 采集），指定时自动开启 --metrics",
+    )
+    parser.add_argument(
+        "--sync-send",
+        action="store_true",
+        help="在任务内同步发送钉钉消息，不经过发件箱与后台发送线程",
+    )
+    parser.add_argument(
+        "--subscriptions",
+        default="config/subscriptions.json",
+        help="多群订阅配置文件，不存在时只发送到默认机器人",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=int,
+        default=0,
+        help="每次调度附加的随机延迟上限（秒）",
+    )
+    parser.add_argument(
+        "--misfire-grace",
+        type=int,
+        default=3600,
+        help="错过执行时间后仍允许补跑的窗口（秒）",
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    migrate_parser = subparsers.add_parser("migrate", help="查看并执行待处理的数据库迁移")
+    migrate_parser.add_argument(
+        "--status",
+        action="store_true",
+        help="仅显示当前版本与待执行的迁移，不执行",
+    )
+    reprocess_parser = subparsers.add_parser(
+        "reprocess", help="把归档的原始响应重新解析写库，重建派生表"
+    )
+    reprocess_parser.add_argument("--start", help="起始采集日期 YYYY-MM-DD（含），默认不限")
+    reprocess_parser.add_argument("--end", help="结束采集日期 YYYY-MM-DD（含），默认不限")
+    reprocess_parser.add_argument(
+        "--batch-size",
+        dest="read_batch",
+        type=int,
+        default=100,
+        help="每批从归档读取的响应数",
+    )
+    backfill_parser = subparsers.add_parser(
+        "backfill", help="从 CSV/JSONL 批量导入历史人流数据"
+    )
+    backfill_parser.add_argument("path", help="导入文件路径")
+    backfill_parser.add_argument(
+        "--format",
+        choices=["csv", "jsonl"],
+        help="文件格式，默认按扩展名判断",
+    )
+    backfill_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=5000,
+        help="每个事务写入的行数",
+    )
+    export_parser = subparsers.add_parser(
+        "export", help="流式导出历史人流数据（CSV/JSONL/列式二进制）"
+    )
+    export_parser.add_argument(
+        "--format",
+        choices=list(EXPORT_FORMATS),
+        default="csv",
+        help="导出格式，默认 csv",
+    )
+    export_parser.add_argument(
+        "--output",
+        default="-",
+        help="输出文件，默认标准输出（columnar 必须指定文件）",
+    )
+    export_parser.add_argument(
+        "--granularity",
+        choices=list(GRANULARITIES),
+        default="day",
+        help="snapshot 为日内原始快照，day 为每日按馆区数据，week/month/year 为周期汇总",
+    )
+    export_parser.add_argument("--start", help="起始日期 YYYY-MM-DD（含）")
+    export_parser.add_argument("--end", help="结束日期 YYYY-MM-DD（含）")
+    export_parser.add_argument(
+        "--area",
+        action="append",
+        help="只导出指定馆区代码，可重复",
+    )
+    export_parser.add_argument(
+        "--batch-size",
+        dest="read_batch",
+        type=int,
+        default=1000,
+        help="每批读取的行数",
+    )
+    replay_parser = subparsers.add_parser(
+        "replay", help="在临时库上按日快进回放 run_once，校验日报、周报、节假日报的触发"
+    )
+    replay_parser.add_argument("--start", required=True, help="起始日期 YYYY-MM-DD（含）")
+    replay_parser.add_argument("--end", required=True, help="结束日期 YYYY-MM-DD（含）")
+    replay_parser.add_argument(
+        "--source",
+        choices=list(REPLAY_SOURCES),
+        default="synthetic",
+        help="synthetic 为确定性合成数据，history 取源库的按馆区日表，archive 重放源库归档的原始响应",
+    )
+    replay_parser.add_argument(
+        "--source-db",
+        help="history/archive 的源数据库（只读打开），默认为 --db-path 指定的正式库",
+    )
+    replay_parser.add_argument(
+        "--db",
+        default=":memory:",
+        help="回放写入的临时库，默认在内存中；不能是正式库",
+    )
+    replay_parser.add_argument("--seed", type=int, default=0, help="合成数据的随机种子")
+    replay_parser.add_argument("--verbose", action="store_true", help="输出 INFO 日志")
+    replay_parser.add_argument(
+        "--output",
+        help="把回放产生的全部消息按 JSONL 写入文件（sent_at、title、text），可跨版本 diff",
+    )
+    serve_parser = subparsers.add_parser(
+        "serve", help="启动只读 HTTP 查询接口，供看板轮询最新数据、区间合计、日序列与发送记录"
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--db", help="查询的数据库，以只读方式打开，默认为 --db-path")
+    serve_parser.add_argument(
+        "--readers", type=int, help="只读连接数，默认为 CPU 核数（最多 8）"
+    )
+    serve_parser.add_argument(
+        "--cache-size", type=int, default=512, help="响应缓存条数，数据写入后整体失效"
+    )
+    return parser
+
+
+def run_coroutine(coroutine_func):
+    """调度器按同步函数调用任务，每次在新的事件循环中执行协程"""
+    return asyncio.run(coroutine_func())
+
+
+def run_daemon(run_once, collect_intraday, db, args):
+    scheduler = Scheduler(state_store=db)
+    if args.collector:
+        args.poll_interval = args.poll_interval or 5
+    else:
+        scheduler.add_job(
+            "daily_report",
+            run_once,
+            DailyTrigger(args.daily_at),
+            jitter=args.jitter,
+            misfire_grace=args.misfire_grace,
+        )
+    if args.poll_interval > 0:
+        scheduler.add_job(
+            "intraday_poll",
+            collect_intraday,
+            IntervalTrigger(args.poll_interval),
+            jitter=args.jitter,
+            misfire_grace=args.poll_interval * 60,
+            catch_up=False,
+        )
+    scheduler.install_signal_handlers()
+    logging.info("常驻模式启动")
+    scheduler.run_forever()
+
+
+def run_migrate(args):
+    db = Database(auto_migrate=False, path=args.db_path)
+    try:
+        pending = db.pending_migrations()
+        print(f"当前数据库版本: {db.schema_version}，最新版本: {LATEST_VERSION}")
+        for version, description, _ in pending:
+            print(f"  待执行 {version}: {description}")
+        if not pending:
+            print("数据库结构已是最新")
+            return
+        if args.status:
+            return
+        for version, description in db.create_tables():
+            print(f"  已执行 {version}: {description}")
+    finally:
+        db.close()
+
+
+def run_reprocess(args):
+    db = Database(path=args.db_path)
+    monitor = LibraryFlowMonitor(
+        db=db, library_codes=load_locations(args.locations), detect_anomalies=False
+    )
+    try:
+        stats = monitor.service.reprocess_archive(args.start, args.end, args.read_batch)
+        if stats is not None:
+            print(
+                f"重放响应 {stats['responses']} 条，写入 {stats['written']} 行，"
+                f"未变化 {stats['skipped']} 行，失败 {stats['failed']} 条"
+            )
+    finally:
+        monitor.close()
+        db.close()
+
+
+def run_backfill(args):
+    db = Database(path=args.db_path)
+    try:
+        db.set_holiday_ranges(HolidayCalendar("config/holiday_ranges.json").ranges())
+        stats = {}
+        loaded = db.bulk_load_daily_flow(
+            read_records(args.path, args.format, stats), chunk_size=args.chunk_size
+        )
+        print(f"导入 {loaded} 行，跳过无效记录 {stats.get('invalid', 0)} 行")
+    finally:
+        db.close()
 
-    db = Database()
-    monitor = LibraryFlowMonitor(dingtalk_bot=chatbot, db=db)
 
+def run_export(args):
+    # 导出全程只读：不创建数据库文件，也不执行迁移
+    if not Path(args.db_path).is_file():
+        raise SystemExit(f"数据库不存在: {args.db_path}")
+    db = Database(path=args.db_path, cache_size=0, readonly=True)
     try:
-        monitor.run_once()
+        if db.schema_version < LATEST_VERSION:
+            raise SystemExit(
+                f"数据库版本 {db.schema_version} 低于最新版本 {LATEST_VERSION}，请先执行 migrate"
+            )
     finally:
         db.close()
+    options = dict(
+        fmt=args.format,
+        granularity=args.granularity,
+        start_date=args.start,
+        end_date=args.end,
+        area_codes=args.area,
+        batch_size=args.read_batch,
+    )
+    if args.output == "-":
+        if args.format == "columnar":
+            raise SystemExit("columnar 格式需要通过 --output 指定文件")
+        count = export_history(args.db_path, sys.stdout, **options)
+    else:
+        mode = "wb" if args.format == "columnar" else "w"
+        encoding = None if args.format == "columnar" else "utf-8"
+        with open(args.output, mode, encoding=encoding, newline="" if encoding else None) as handle:
+            count = export_history(args.db_path, handle, **options)
+    logging.info("导出完成 rows=%s format=%s", count, args.format)
+
+
+def run_replay(args):
+    if args.db != ":memory:" and Path(args.db).resolve() == Path(args.db_path).resolve():
+        raise SystemExit("回放不能写入正式库，请通过 --db 指定临时库")
+    # 回放每天都会走完整的写库与报告流程，INFO 日志会淹没结果
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    messages, stats = replay(
+        datetime.strptime(args.start, "%Y-%m-%d").date(),
+        datetime.strptime(args.end, "%Y-%m-%d").date(),
+        source=args.source,
+        source_db=(args.source_db or args.db_path) if args.source != "synthetic" else None,
+        library_codes=load_locations(args.locations) if args.source == "synthetic" else None,
+        db_path=args.db,
+        daily_at=args.daily_at,
+        seed=args.seed,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            for message in messages:
+                handle.write(json.dumps(message, ensure_ascii=False) + "\n")
+
+    by_title = {}
+    for message in messages:
+        by_title[message["title"]] = by_title.get(message["title"], 0) + 1
+    print(
+        f"回放 {stats['days']} 天，失败 {stats['failed']} 天，消息 {stats['messages']} 条，"
+        f"耗时 {stats['elapsed']:.2f}s"
+    )
+    for title, count in sorted(by_title.items(), key=lambda x: -x[1]):
+        print(f"  {title}: {count}")
+
+
+def run_serve(args):
+    # 只读连接不会建表，先用读写连接把表结构迁移到最新
+    db_path = args.db or args.db_path
+    Database(path=db_path).close()
+    serve(
+        db_path=db_path,
+        host=args.host,
+        port=args.port,
+        readers=args.readers,
+        cache_size=args.cache_size,
+    )
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.command == "migrate":
+        run_migrate(args)
+        return
+    if args.command == "reprocess":
+        run_reprocess(args)
+        return
+    if args.command == "backfill":
+        run_backfill(args)
+        return
+    if args.command == "export":
+        run_export(args)
+        return
+    if args.command == "replay":
+        run_replay(args)
+        return
+    if args.command == "serve":
+        run_serve(args)
+        return
+
+    if args.metrics or args.metrics_textfile:
+        METRICS.configure(enabled=True, textfile=args.metrics_textfile)
+
+    chatbot = build_chatbot()
+    # 采集、发件箱、调度器的写入都经由同一个写线程，避免多个读写连接互相等锁；
+    # 报告数据与发件箱轮询从只读连接池读取，不在写线程排队
+    connections = ConnectionManager(args.db_path)
+    db = connections.db()
+    outbox = None
+    subscriptions = None
+    if not args.sync_send:
+        subscriptions = SubscriptionRegistry.load(
+            args.subscriptions,
+            chatbot_factory=lambda webhook, secret: DingtalkChatbot(webhook, secret=secret),
+            default_chatbot=chatbot,
+        )
+        if len(subscriptions):
+            outbox = OutboxSender(
+                subscriptions.chatbots(), db_factory=connections.db, reader=connections.reader
+            )
+    monitor = LibraryFlowMonitor(
+        dingtalk_bot=chatbot,
+        db=db,
+        hedge=args.hedge,
+        outbox=outbox,
+        subscriptions=subscriptions,
+        library_codes=load_locations(args.locations),
+        batch_size=args.batch_size,
+        max_workers=args.workers,
+        detect_anomalies=not args.no_anomaly,
+        reader=connections.reader,
+    )
+
+    if args.asyncio:
+        runner = AsyncLibraryFlowMonitor(monitor, connections.writer, max_workers=args.workers)
+        run_once = functools.partial(run_coroutine, runner.run_once)
+        collect_intraday = functools.partial(run_coroutine, runner.collect_intraday)
+    else:
+        runner = monitor
+        run_once = monitor.run_once
+        collect_intraday = monitor.collect_intraday
+
+    try:
+        if args.daemon or args.collector:
+            if outbox:
+                outbox.start()
+            run_daemon(run_once, collect_intraday, db, args)
+        else:
+            run_once()
+            if outbox:
+                outbox.drain(db)
+                # 发件箱在 run_once 之后才发送，webhook 耗时补记到同一次运行
+                monitor.record_metrics(monitor.last_run_id)
+    finally:
+        if outbox:
+            outbox.stop()
+        runner.close()
+        connections.close()
 
 
 if __name__ == "__main__":
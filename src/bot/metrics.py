@@ -0,0 +1,138 @@
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+# 秒，覆盖从缓存命中的毫秒级查询到分钟级的接口超时
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+METRIC_NAME = "library_flow_stage_seconds"
+
+_NULL_TIMER = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+
+class StageMetrics:
+    """按阶段与接口统计耗时直方图；关闭时计时器与装饰器直接透传，只多一次属性判断
+
+    累计直方图用于导出 Prometheus textfile，另有一份按次运行的直方图供写入 run_metrics 表后清空。
+    """
+
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS, textfile=None):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.textfile = Path(textfile) if textfile else None
+        self._totals = {}
+        self._run = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled=True, textfile=None):
+        self.enabled = enabled
+        self.textfile = Path(textfile) if textfile else None
+
+    def observe(self, stage, seconds, endpoint=""):
+        if not self.enabled:
+            return
+        key = (stage, endpoint)
+        with self._lock:
+            for histograms in (self._totals, self._run):
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histogram = histograms[key] = Histogram(self.buckets)
+                histogram.observe(seconds)
+
+    @contextmanager
+    def _timer(self, stage, endpoint):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, endpoint)
+
+    def timer(self, stage, endpoint=""):
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timer(stage, endpoint)
+
+    def timed(self, stage, endpoint=""):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(stage, time.perf_counter() - started, endpoint)
+
+            return wrapper
+
+        return decorator
+
+    def take_run(self):
+        """取出并清空本次运行的统计：[{stage, endpoint, count, total_seconds, max_seconds, buckets}]"""
+        with self._lock:
+            run, self._run = self._run, {}
+        return [
+            {
+                "stage": stage,
+                "endpoint": endpoint,
+                "count": histogram.count,
+                "total_seconds": histogram.sum,
+                "max_seconds": histogram.max,
+                "buckets": json.dumps(histogram.counts),
+            }
+            for (stage, endpoint), histogram in sorted(run.items())
+        ]
+
+    def render(self):
+        """Prometheus 文本格式，bucket 为累计计数"""
+        lines = [
+            f"# HELP {METRIC_NAME} 各阶段耗时（秒）",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        with self._lock:
+            items = sorted(self._totals.items())
+            for (stage, endpoint), histogram in items:
+                labels = f'stage="{_escape(stage)}",endpoint="{_escape(endpoint)}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{METRIC_NAME}_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"{METRIC_NAME}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path=None):
+        """写入 node_exporter textfile 目录：先写临时文件再替换，避免被读到半个文件"""
+        path = Path(path or self.textfile)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = StageMetrics()
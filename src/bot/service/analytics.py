@@ -0,0 +1,200 @@
+import calendar
+from array import array
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+from src.bot.storage.database import SUMMARY_AREA_CODE
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def shift_years(day, years):
+    """按年平移日期，2 月 29 日平移到非闰年时取 2 月 28 日"""
+    day = _to_date(day)
+    try:
+        return day.replace(year=day.year + years)
+    except ValueError:
+        return day.replace(year=day.year + years, day=28)
+
+
+def shift_months(day, months):
+    """按月平移日期，目标月份天数不足时取月末"""
+    day = _to_date(day)
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    month += 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def ratio(current, previous):
+    """增长率，previous 为 0 时返回 None"""
+    if not previous:
+        return None
+    return (current - previous) / previous
+
+
+class FlowSeries:
+    """按馆区的日人流序列：下标为距 start 的天数，每个馆区一列 array('q')，区间合计用前缀和 O(1) 求出
+
+    一次从数据库载入后，均值、同比/环比、排名都在内存数组上计算，不再逐个区间查询。
+    """
+
+    def __init__(self, start_date, days, names=None):
+        self.start = _to_date(start_date)
+        self.days = days
+        self.names = dict(names or {})
+        self.columns = {}
+        self._prefix = {}
+        self._merged = set()
+
+    @classmethod
+    def load(cls, db, start_date, end_date, area_codes=None):
+        start = _to_date(start_date)
+        end = _to_date(end_date)
+        series = cls(start, max((end - start).days + 1, 0))
+        base = start.toordinal()
+        wanted = set(area_codes) if area_codes else None
+        total = series._column(SUMMARY_AREA_CODE)
+        indexes = {}
+        for stat_date, area_code, area_name, in_count in db.get_daily_series(
+            start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+        ):
+            if wanted is not None and area_code not in wanted:
+                continue
+            index = indexes.get(stat_date)
+            if index is None:
+                index = indexes[stat_date] = date.fromisoformat(stat_date).toordinal() - base
+            series._column(area_code)[index] = int(in_count)
+            series.names[area_code] = area_name
+            total[index] += int(in_count)
+        return series
+
+    def _column(self, area_code):
+        column = self.columns.get(area_code)
+        if column is None:
+            column = self.columns[area_code] = array("q", bytes(8 * self.days))
+            self._prefix.pop(area_code, None)
+        return column
+
+    def areas(self):
+        return [x for x in self.columns if x != SUMMARY_AREA_CODE and x not in self._merged]
+
+    def merge(self, area_codes):
+        """把若干馆区逐日相加为一列并返回列名，订阅只含部分馆区时趋势按合并列计算"""
+        area_codes = sorted(area_codes)
+        if area_codes == sorted(self.areas()):
+            return SUMMARY_AREA_CODE
+        key = "+".join(area_codes)
+        if key not in self.columns:
+            merged = self._column(key)
+            self._merged.add(key)
+            for area_code in area_codes:
+                column = self.columns.get(area_code)
+                if column is None:
+                    continue
+                for index, count in enumerate(column):
+                    merged[index] += count
+        return key
+
+    def index(self, day):
+        return _to_date(day).toordinal() - self.start.toordinal()
+
+    def covers(self, start_date, end_date):
+        return self.index(start_date) >= 0 and self.index(end_date) < self.days
+
+    def prefix(self, area_code):
+        prefix = self._prefix.get(area_code)
+        if prefix is None:
+            column = self.columns.get(area_code) or array("q", bytes(8 * self.days))
+            prefix = self._prefix[area_code] = array("q", accumulate(column, initial=0))
+        return prefix
+
+    def total(self, area_code, start_date, end_date):
+        """区间合计，超出载入范围的部分按 0 计"""
+        first = max(self.index(start_date), 0)
+        last = min(self.index(end_date), self.days - 1)
+        if first > last:
+            return 0
+        prefix = self.prefix(area_code)
+        return prefix[last + 1] - prefix[first]
+
+    def totals(self, start_date, end_date, area_codes=None):
+        return {
+            x: self.total(x, start_date, end_date)
+            for x in (area_codes if area_codes is not None else self.areas())
+        }
+
+    def moving_average(self, area_code, window):
+        """滑动均值，结果第 i 项对应 start + i 天，前 window-1 天按已有天数平均"""
+        prefix = self.prefix(area_code)
+        return array(
+            "d",
+            (
+                (prefix[i + 1] - prefix[max(i + 1 - window, 0)]) / min(i + 1, window)
+                for i in range(self.days)
+            ),
+        )
+
+    def average(self, area_code, start_date, end_date):
+        days = (_to_date(end_date) - _to_date(start_date)).days + 1
+        return self.total(area_code, start_date, end_date) / days if days > 0 else 0.0
+
+    def period_ratio(self, area_code, start_date, end_date, previous_start, previous_end):
+        return ratio(
+            self.total(area_code, start_date, end_date),
+            self.total(area_code, previous_start, previous_end),
+        )
+
+    def yoy(self, area_code, start_date, end_date):
+        """同比：与去年同日期区间比较"""
+        return self.period_ratio(
+            area_code,
+            start_date,
+            end_date,
+            shift_years(start_date, -1),
+            shift_years(end_date, -1),
+        )
+
+    def mom(self, area_code, start_date, end_date):
+        """环比（月）：与上个月同日期区间比较"""
+        return self.period_ratio(
+            area_code,
+            start_date,
+            end_date,
+            shift_months(start_date, -1),
+            shift_months(end_date, -1),
+        )
+
+    def holiday_yoy(self, area_code, holiday, holiday_ranges):
+        """与去年同名节假日比较，找不到去年同名区间时返回 None"""
+        previous = last_year_holiday(holiday, holiday_ranges)
+        if previous is None:
+            return None
+        return self.period_ratio(
+            area_code,
+            holiday["start_date"],
+            holiday["end_date"],
+            previous["start_date"],
+            previous["end_date"],
+        )
+
+    def ranking(self, start_date, end_date, area_codes=None):
+        """区间合计从高到低排序：[(area_code, total)]"""
+        totals = self.totals(start_date, end_date, area_codes)
+        return sorted(totals.items(), key=lambda x: (-x[1], x[0]))
+
+
+def last_year_holiday(holiday, holiday_ranges):
+    name = holiday.get("name", "")
+    if not name:
+        return None
+    year = int(holiday["start_date"][:4]) - 1
+    for item in holiday_ranges:
+        if item.get("name", "") == name and int(item["start_date"][:4]) == year:
+            return item
+    return None
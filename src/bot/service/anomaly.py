@@ -0,0 +1,281 @@
+import json
+import logging
+import math
+import threading
+from datetime import datetime
+
+HOURS_PER_WEEK = 7 * 24
+
+KIND_STUCK = "stuck"
+KIND_SPIKE = "spike"
+KIND_RESET = "reset"
+KIND_LABELS = {
+    KIND_STUCK: "计数停滞",
+    KIND_SPIKE: "计数突增",
+    KIND_RESET: "计数回退",
+}
+
+
+def hour_of_week(moment):
+    return moment.weekday() * 24 + moment.hour
+
+
+class LocationState:
+    """单个馆区的检测状态，大小固定：EWMA 均值/方差、按周内小时的季节基线、停滞累计"""
+
+    def __init__(self, area_code, area_name=""):
+        self.area_code = area_code
+        self.area_name = area_name or area_code
+        self.stat_date = None
+        self.last_count = None
+        self.last_seen = None
+        self.samples = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.seasonal = [0.0] * HOURS_PER_WEEK
+        self.seasonal_samples = [0] * HOURS_PER_WEEK
+        self.stuck_since = None
+        self.stuck_expected = 0.0
+        # 停滞期间暂存的静止区间数 {周内小时: 区间数}，最多 168 项，不持久化
+        self.stuck_pending = {}
+        self.alerted = {}
+
+    def mark(self, stat_date, count, seen):
+        self.stat_date = stat_date
+        self.last_count = count
+        self.last_seen = seen
+
+    def clear_stuck(self):
+        self.stuck_since = None
+        self.stuck_expected = 0.0
+        self.stuck_pending = {}
+
+    def resume(self, stuck_min_expected, alpha, seasonal_alpha):
+        """计数恢复：未达到停滞阈值的静止区间补记入基线，达到阈值的视为故障丢弃"""
+        if self.stuck_expected < stuck_min_expected:
+            for slot, intervals in self.stuck_pending.items():
+                for _ in range(intervals):
+                    self.update(0.0, slot, alpha, seasonal_alpha)
+        self.clear_stuck()
+
+    def expected_rate(self, slot, seasonal_warmup):
+        if self.seasonal_samples[slot] >= seasonal_warmup:
+            return self.seasonal[slot]
+        return None
+
+    def update(self, rate, slot, alpha, seasonal_alpha):
+        # EWMA 方差的增量形式，只保留两个数
+        diff = rate - self.mean
+        increment = alpha * diff
+        self.mean += increment
+        self.var = (1 - alpha) * (self.var + diff * increment)
+        self.samples += 1
+
+        if self.seasonal_samples[slot]:
+            self.seasonal[slot] += seasonal_alpha * (rate - self.seasonal[slot])
+        else:
+            self.seasonal[slot] = rate
+        self.seasonal_samples[slot] = min(self.seasonal_samples[slot] + 1, 255)
+
+    def to_row(self):
+        return {
+            "area_code": self.area_code,
+            "area_name": self.area_name,
+            "stat_date": self.stat_date,
+            "last_count": self.last_count,
+            "last_seen": self.last_seen,
+            "samples": self.samples,
+            "mean": self.mean,
+            "var": self.var,
+            "seasonal": json.dumps(
+                [[round(x, 4) for x in self.seasonal], self.seasonal_samples]
+            ),
+            "stuck_since": self.stuck_since,
+            "stuck_expected": self.stuck_expected,
+            "alerted": json.dumps(self.alerted),
+        }
+
+    @classmethod
+    def from_row(cls, row):
+        state = cls(row["area_code"], row["area_name"])
+        state.stat_date = row["stat_date"]
+        state.last_count = row["last_count"]
+        state.last_seen = row["last_seen"]
+        state.samples = int(row["samples"])
+        state.mean = float(row["mean"])
+        state.var = float(row["var"])
+        state.stuck_since = row["stuck_since"]
+        state.stuck_expected = float(row["stuck_expected"] or 0)
+        try:
+            seasonal, samples = json.loads(row["seasonal"])
+            if len(seasonal) == HOURS_PER_WEEK and len(samples) == HOURS_PER_WEEK:
+                state.seasonal = [float(x) for x in seasonal]
+                state.seasonal_samples = [int(x) for x in samples]
+            state.alerted = {k: float(v) for k, v in json.loads(row["alerted"] or "{}").items()}
+        except (TypeError, ValueError):
+            logging.warning("异常检测状态损坏，已重置基线: %s", row["area_code"])
+        return state
+
+
+class AnomalyDetector:
+    """日内快照的在线异常检测：每次采集按馆区增量更新状态，发现停滞、突增、回退时限频告警
+
+    速率单位为人次/分钟。状态与 EndpointHealthTracker 一样持久化到数据库，重启后基线不丢失。
+    """
+
+    def __init__(
+        self,
+        store=None,
+        alert=None,
+        alpha=0.1,
+        seasonal_alpha=0.3,
+        warmup=12,
+        seasonal_warmup=2,
+        spike_z=6.0,
+        spike_min_count=200,
+        stuck_min_expected=60,
+        max_gap_minutes=180,
+        alert_interval=3600,
+    ):
+        self.store = store
+        self.alert = alert
+        self.alpha = alpha
+        self.seasonal_alpha = seasonal_alpha
+        self.warmup = warmup
+        self.seasonal_warmup = seasonal_warmup
+        self.spike_z = spike_z
+        self.spike_min_count = spike_min_count
+        self.stuck_min_expected = stuck_min_expected
+        self.max_gap_minutes = max_gap_minutes
+        self.alert_interval = alert_interval
+        self._states = {}
+        self._lock = threading.Lock()
+
+        if store is not None:
+            for row in store.load_anomaly_state():
+                state = LocationState.from_row(row)
+                self._states[state.area_code] = state
+            if self._states:
+                logging.info("异常检测状态已恢复，馆区数=%s", len(self._states))
+
+    def state(self, area_code):
+        return self._states.get(area_code)
+
+    def observe(self, flow_data, observed_at=None):
+        """喂入一次采集结果 {area_code: {"name", "daily_in", ...}}，返回本次发现的全部异常"""
+        observed_at = observed_at or datetime.now()
+        anomalies = []
+        with self._lock:
+            for area_code, item in flow_data.items():
+                state = self._states.get(area_code)
+                if state is None:
+                    state = self._states[area_code] = LocationState(area_code, item.get("name"))
+                state.area_name = item.get("name") or state.area_name
+                anomalies.extend(self._observe_location(state, int(item.get("daily_in", 0)), observed_at))
+
+            to_alert = [x for x in anomalies if self._should_alert(x, observed_at)]
+            rows = [self._states[x].to_row() for x in flow_data if x in self._states]
+
+        for item in anomalies:
+            logging.warning(
+                "人流异常 %s %s %s%s",
+                item["area_name"],
+                KIND_LABELS[item["kind"]],
+                item["detail"],
+                "" if item in to_alert else "（限频，未告警）",
+            )
+        if self.store is not None and rows:
+            self.store.save_anomaly_state(rows)
+        if to_alert and self.alert is not None:
+            self.alert(to_alert)
+        return anomalies
+
+    def _observe_location(self, state, count, observed_at):
+        stat_date = observed_at.strftime("%Y-%m-%d")
+        seen = observed_at.timestamp()
+        if state.stat_date != stat_date or state.last_count is None:
+            # 跨日后计数从 0 重新累计，只记录起点
+            state.mark(stat_date, count, seen)
+            state.clear_stuck()
+            return []
+
+        elapsed = (seen - state.last_seen) / 60
+        if elapsed <= 0:
+            return []
+        if elapsed > self.max_gap_minutes:
+            # 采集中断太久，区间速率没有意义，重新起算
+            state.mark(stat_date, count, seen)
+            state.clear_stuck()
+            return []
+
+        slot = hour_of_week(observed_at)
+        expected = state.expected_rate(slot, self.seasonal_warmup)
+        delta = count - state.last_count
+        anomalies = []
+
+        if delta < 0:
+            anomalies.append(
+                self._anomaly(state, KIND_RESET, observed_at, count, f"由 {state.last_count} 降至 {count}")
+            )
+        elif delta == 0:
+            if state.stuck_since is None:
+                state.stuck_since = state.last_seen
+            if not expected:
+                # 往常就没有人流的时段（如闭馆）照常学习
+                state.update(0.0, slot, self.alpha, self.seasonal_alpha)
+            else:
+                state.stuck_expected += expected * elapsed
+                if state.stuck_expected < self.stuck_min_expected:
+                    # 往常应有人流：先暂存，计数恢复时再决定是否计入基线，避免故障拉低基线
+                    state.stuck_pending[slot] = state.stuck_pending.get(slot, 0) + 1
+                else:
+                    state.stuck_pending = {}
+                    minutes = (seen - state.stuck_since) / 60
+                    anomalies.append(
+                        self._anomaly(
+                            state,
+                            KIND_STUCK,
+                            observed_at,
+                            count,
+                            f"{minutes:.0f} 分钟未变化（停在 {count}），按往常应增加约 {state.stuck_expected:.0f} 人次",
+                        )
+                    )
+        else:
+            state.resume(self.stuck_min_expected, self.alpha, self.seasonal_alpha)
+            rate = delta / elapsed
+            baseline = state.mean if expected is None else expected
+            threshold = baseline + self.spike_z * max(math.sqrt(state.var), 1.0)
+            if state.samples >= self.warmup and delta >= self.spike_min_count and rate > threshold:
+                anomalies.append(
+                    self._anomaly(
+                        state,
+                        KIND_SPIKE,
+                        observed_at,
+                        count,
+                        f"{elapsed:.0f} 分钟内增加 {delta} 人次（{rate:.1f}/分钟，往常约 {baseline:.1f}/分钟）",
+                    )
+                )
+            else:
+                state.update(rate, slot, self.alpha, self.seasonal_alpha)
+
+        state.mark(stat_date, count, seen)
+        return anomalies
+
+    def _anomaly(self, state, kind, observed_at, count, detail):
+        return {
+            "area_code": state.area_code,
+            "area_name": state.area_name,
+            "kind": kind,
+            "observed_at": observed_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "count": count,
+            "detail": detail,
+        }
+
+    def _should_alert(self, anomaly, observed_at):
+        state = self._states[anomaly["area_code"]]
+        seen = observed_at.timestamp()
+        last = state.alerted.get(anomaly["kind"])
+        if last is not None and seen - last < self.alert_interval:
+            return False
+        state.alerted[anomaly["kind"]] = seen
+        return True
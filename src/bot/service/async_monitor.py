@@ -0,0 +1,152 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from src.bot.metrics import METRICS
+
+
+class AsyncTrafficService:
+    """TrafficService 的 asyncio 版本：各分片请求放到线程池并发执行，单个分片慢或失败不拖住其他分片"""
+
+    def __init__(self, service, executor):
+        self.service = service
+        self.executor = executor
+
+    @property
+    def api(self):
+        return self.service.api
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def _fetch_batch(self, index, locations):
+        service = self.service
+        payload = dict(self.api.payload, orgLocations=locations)
+        for attempt in range(service.batch_retries + 1):
+            if attempt:
+                await asyncio.sleep(service.retry_delay * attempt)
+                logging.warning("分片 %s 第%s次重试", index, attempt)
+            data = await self._run(self.api.fetch, payload=payload, flush=False)
+            flow_data = service.parse_daily_flow(data)
+            if flow_data is not None:
+                return flow_data
+        return None
+
+    async def fetch_and_parse_daily_flow(self):
+        logging.info("开始获取人流数据")
+        service = self.service
+        service.begin_collection()
+        locations = list(self.api.payload.get("orgLocations", []))
+        batch_size = service.batch_size or len(locations) or 1
+        batches = [locations[i:i + batch_size] for i in range(0, len(locations), batch_size)]
+
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                asyncio.wait_for(self._fetch_batch(index, batch), service.collect_timeout)
+                for index, batch in enumerate(batches)
+            ),
+            return_exceptions=True,
+        )
+        await self._run(self.api.flush)
+
+        flow_summary = {}
+        failed = []
+        for index, result in enumerate(results):
+            if isinstance(result, asyncio.TimeoutError):
+                logging.error("分片 %s 超过 %ss 未返回，本次跳过", index, service.collect_timeout)
+                failed.append(index)
+            elif isinstance(result, BaseException):
+                logging.error("分片 %s 采集异常: %s", index, result)
+                failed.append(index)
+            elif result is None:
+                failed.append(index)
+            else:
+                flow_summary.update(result)
+
+        logging.info(
+            "分片采集完成，分片数=%s，失败=%s，馆区数=%s，耗时=%.2fs",
+            len(batches),
+            len(failed),
+            len(flow_summary),
+            time.perf_counter() - started,
+        )
+        if not flow_summary:
+            logging.error("所有接口均失败")
+            return None
+
+        total_in = sum(int(v.get("daily_in", 0)) for v in flow_summary.values())
+        logging.info("人流数据获取完成，馆区数=%s，总进馆=%s", len(flow_summary), total_in)
+        await self._run(service.detect_anomalies, flow_summary)
+        return flow_summary
+
+
+class AsyncLibraryFlowMonitor:
+    """LibraryFlowMonitor 的 asyncio 流水线：采集、写库、出报告各自让出事件循环
+
+    monitor.db 应为 DatabaseWriter.proxy()，写库经 writer 的写线程完成，报告生成在线程池中执行。
+    """
+
+    def __init__(self, monitor, writer, max_workers=8):
+        self.monitor = monitor
+        self.writer = writer
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="async-monitor")
+        self.service = AsyncTrafficService(monitor.service, self.executor)
+
+    async def _save(self, flow_data, date_str):
+        try:
+            return await self.writer.acall(
+                "insert_daily_flow",
+                date_str,
+                flow_data,
+                fetched_at=self.monitor.service.collected_at,
+            )
+        except Exception as exc:
+            logging.exception("保存人流数据失败: %s", exc)
+            return None
+
+    async def run_once(self):
+        run_id = self.monitor.last_run_id = uuid4().hex[:8]
+        logging.info("任务开始 run_id=%s", run_id)
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            daily_flow = await self.service.fetch_and_parse_daily_flow()
+            if not daily_flow:
+                logging.error("任务失败 run_id=%s，日报数据为空", run_id)
+                return None
+
+            today = self.monitor.now_func().date()
+            await self._save(daily_flow, today.strftime("%Y-%m-%d"))
+            await loop.run_in_executor(
+                self.executor, self.monitor.send_reports, today, daily_flow, run_id
+            )
+            return daily_flow
+        finally:
+            METRICS.observe("run_once", time.perf_counter() - started)
+            await loop.run_in_executor(self.executor, self.monitor.record_metrics, run_id)
+
+    async def collect_intraday(self):
+        run_id = uuid4().hex[:8]
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            flow_data = await self.service.fetch_and_parse_daily_flow()
+            if not flow_data:
+                logging.warning("日内采集失败，本次跳过 run_id=%s", run_id)
+                return None
+
+            await loop.run_in_executor(self.executor, self.monitor.sync_holiday_rollups)
+            await self._save(flow_data, self.monitor.now_func().strftime("%Y-%m-%d"))
+            return flow_data
+        finally:
+            METRICS.observe("collect_intraday", time.perf_counter() - started)
+            await loop.run_in_executor(self.executor, self.monitor.record_metrics, run_id)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.monitor.close()
@@ -0,0 +1,124 @@
+import json
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from pathlib import Path
+
+
+def _to_date_str(value):
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    return value
+
+
+def _valid_date(value):
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+class HolidayCalendar:
+    """节假日区间索引：按开始日期排序后二分查找，配置文件 mtime 变化时才重新加载"""
+
+    def __init__(self, config_path):
+        self.config_path = Path(config_path)
+        self.version = 0
+        self._mtime = None
+        self._loaded = False
+        self._index = ([], [], [], [], [])
+        self._lock = threading.Lock()
+
+    def _parse(self):
+        try:
+            payload = json.loads(self.config_path.read_text(encoding="utf-8"))
+        except Exception as exc:
+            logging.exception("读取节假日配置失败: %s", exc)
+            return []
+
+        ranges = payload.get("ranges", []) if isinstance(payload, dict) else []
+        valid = []
+        for item in ranges:
+            if not isinstance(item, dict):
+                continue
+            start_date = item.get("start_date")
+            end_date = item.get("end_date")
+            if not start_date or not end_date:
+                continue
+            if not _valid_date(start_date) or not _valid_date(end_date) or start_date > end_date:
+                logging.warning("忽略无效的节假日区间: %s", item)
+                continue
+            valid.append(
+                {
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "name": item.get("name", ""),
+                }
+            )
+        return valid
+
+    def _build_index(self, ranges):
+        ranges = sorted(ranges, key=lambda x: (x["start_date"], x["end_date"]))
+        starts = [x["start_date"] for x in ranges]
+        max_ends = []
+        max_end = ""
+        for item in ranges:
+            max_end = max(max_end, item["end_date"])
+            max_ends.append(max_end)
+        by_end = sorted(ranges, key=lambda x: x["end_date"])
+        ends = [x["end_date"] for x in by_end]
+        self._index = (ranges, starts, max_ends, by_end, ends)
+        self.version += 1
+
+    def refresh(self):
+        with self._lock:
+            try:
+                mtime = self.config_path.stat().st_mtime_ns
+            except OSError:
+                mtime = None
+
+            if self._loaded and mtime == self._mtime:
+                return False
+
+            if mtime is None:
+                logging.info("节假日配置文件不存在: %s", self.config_path)
+                ranges = []
+            else:
+                ranges = self._parse()
+            self._mtime = mtime
+            self._loaded = True
+            self._build_index(ranges)
+            logging.info("节假日配置加载完成，条数=%s", len(ranges))
+            return True
+
+    def ranges(self):
+        self.refresh()
+        return list(self._index[0])
+
+    def ranges_containing(self, day):
+        self.refresh()
+        ranges, starts, max_ends, _, _ = self._index
+        day_str = _to_date_str(day)
+        matched = []
+        index = bisect_right(starts, day_str) - 1
+        while index >= 0 and max_ends[index] >= day_str:
+            if ranges[index]["end_date"] >= day_str:
+                matched.append(ranges[index])
+            index -= 1
+        matched.reverse()
+        return matched
+
+    def holiday_containing(self, day):
+        matched = self.ranges_containing(day)
+        return matched[-1] if matched else None
+
+    def is_holiday(self, day):
+        return self.holiday_containing(day) is not None
+
+    def ranges_ending_on(self, day):
+        self.refresh()
+        _, _, _, by_end, ends = self._index
+        day_str = _to_date_str(day)
+        return by_end[bisect_left(ends, day_str):bisect_right(ends, day_str)]
@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from src.bot.metrics import METRICS
+from src.bot.service.subscriptions import DEFAULT_CHANNEL
+
+AGGREGATED_REPORT_TYPES = {"weekly", "holiday"}
+
+
+class SlidingWindowLimiter:
+    """钉钉自定义机器人每分钟最多 20 条：记录最近 window 秒内的发送时刻，任意一个窗口内都不超过上限"""
+
+    def __init__(self, rate_per_minute=20, window=60.0, clock=None):
+        self.limit = rate_per_minute
+        self.window = window
+        self.clock = clock or time.monotonic
+        self._sent = deque()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """可以发送时记下本次时刻并返回 0，否则返回还需等待的秒数"""
+        with self._lock:
+            now = self.clock()
+            while self._sent and now - self._sent[0] >= self.window:
+                self._sent.popleft()
+            if len(self._sent) < self.limit:
+                self._sent.append(now)
+                return 0
+            return self._sent[0] + self.window - now
+
+    def acquire(self, stop_event=None):
+        while True:
+            wait_seconds = self.try_acquire()
+            if wait_seconds == 0:
+                return True
+            if stop_event is not None:
+                if stop_event.wait(wait_seconds):
+                    return False
+            else:
+                time.sleep(wait_seconds)
+
+
+def delivery_error(result):
+    """钉钉拒绝时不抛异常，只在返回值中给出非 0 的 errcode；送达返回 None，否则返回错误描述"""
+    if isinstance(result, dict) and result.get("errcode", 0) != 0:
+        return f"errcode={result.get('errcode')} errmsg={result.get('errmsg', '')}"
+    return None
+
+
+class OutboxSender:
+    """后台发送线程：从 report_outbox 取出到期消息，各机器人并发、分别限速发送，失败按指数退避重试"""
+
+    def __init__(
+        self,
+        chatbots,
+        db_factory,
+        rate_per_minute=20,
+        max_attempts=8,
+        base_delay=5,
+        max_delay=600,
+        poll_interval=5,
+        batch_size=200,
+        max_workers=8,
+        now_func=None,
+        reader=None,
+    ):
+        if not isinstance(chatbots, dict):
+            chatbots = {DEFAULT_CHANNEL: chatbots}
+        self.chatbots = chatbots
+        self.db_factory = db_factory
+        self.limiters = {channel: SlidingWindowLimiter(rate_per_minute) for channel in chatbots}
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.now_func = now_func or datetime.now
+        self.reader = reader
+        self._executor = None
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread = None
+
+    @contextmanager
+    def _reading(self, db):
+        """轮询到期消息用只读连接，写线程只处理发送结果的写入"""
+        if self.reader is None:
+            yield db
+            return
+        with self.reader() as reader:
+            yield reader
+
+    def notify(self):
+        self._wake_event.set()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-sender", daemon=True)
+        self._thread.start()
+        logging.info("消息发送线程已启动")
+
+    def stop(self, timeout=10):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        logging.info("消息发送线程已停止")
+
+    def _run(self):
+        db = self.db_factory()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    processed = self.process_due(db)
+                except Exception as exc:
+                    logging.exception("消息发送线程异常: %s", exc)
+                    processed = 0
+                if processed == 0:
+                    self._wake_event.wait(self.poll_interval)
+                    self._wake_event.clear()
+        finally:
+            db.close()
+
+    def drain(self, db, timeout=60):
+        """在当前线程内发送所有到期消息，用于单次运行模式退出前"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not self._stop_event.is_set():
+            if self.process_due(db) == 0:
+                break
+        with self._reading(db) as reader:
+            pending = reader.count_outbox_pending()
+        if pending:
+            logging.warning("仍有 %s 条消息待发送，将在下次运行时重试", pending)
+        return pending
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="outbox-send"
+            )
+        return self._executor
+
+    def process_due(self, db):
+        """取出到期消息按机器人分组并发发送；发送在线程池内完成，写库只在调用线程进行"""
+        now = self.now_func()
+        with self._reading(db) as reader:
+            rows = reader.fetch_due_outbox(now.strftime("%Y-%m-%d %H:%M:%S"), self.batch_size)
+        if not rows:
+            return 0
+
+        by_channel = {}
+        for row in rows:
+            by_channel.setdefault(row["channel"], []).append(row)
+
+        executor = self._get_executor()
+        futures = [
+            executor.submit(self._send_channel, channel, channel_rows)
+            for channel, channel_rows in by_channel.items()
+        ]
+        processed = 0
+        for future in as_completed(futures):
+            for row, error in future.result():
+                self._record(db, row, error)
+                processed += 1
+        return processed
+
+    def _send_channel(self, channel, rows):
+        chatbot = self.chatbots.get(channel)
+        limiter = self.limiters.get(channel)
+        results = []
+        for row in rows:
+            if chatbot is None:
+                results.append((row, f"未配置机器人: {channel}"))
+                continue
+            if not limiter.acquire(self._stop_event):
+                break
+            try:
+                with METRICS.timer("webhook", channel):
+                    result = chatbot.send_markdown(
+                        title=row["title"], text=row["text"], is_at_all=False
+                    )
+                error = delivery_error(result)
+            except Exception as exc:
+                error = str(exc) or exc.__class__.__name__
+            results.append((row, error))
+        return results
+
+    def _record(self, db, row, error):
+        now = self.now_func()
+        if error is None:
+            db.mark_outbox_sent(row["id"], now.strftime("%Y-%m-%d %H:%M:%S"))
+            if row["report_type"] in AGGREGATED_REPORT_TYPES:
+                # 分发到多个群的报告要所有群都送达后才算已发送
+                report = (row["report_type"], row["start_date"], row["end_date"])
+                if db.count_undelivered_channels(*report) == 0:
+                    db.mark_report_sent(*report)
+            logging.info("发送钉钉消息成功: %s -> %s", row["title"], row["channel"])
+            return True
+
+        attempts = int(row["attempts"]) + 1
+        if attempts >= self.max_attempts:
+            db.mark_outbox_retry(row["id"], attempts, None, error, failed=True)
+            logging.error(
+                "钉钉消息发送失败，已放弃: %s -> %s %s", row["title"], row["channel"], error
+            )
+            return False
+
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        next_attempt_at = (now + timedelta(seconds=delay)).strftime("%Y-%m-%d %H:%M:%S")
+        db.mark_outbox_retry(row["id"], attempts, next_attempt_at, error)
+        logging.warning(
+            "钉钉消息发送失败，%ss 后重试(第%s次): %s -> %s %s",
+            delay,
+            attempts,
+            row["title"],
+            row["channel"],
+            error,
+        )
+        return False
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from src.bot.storage.connections import ConnectionManager
+
+MAX_SERIES_DAYS = 3660
+
+
+class QueryError(ValueError):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _date_param(params, name, required=True):
+    value = params.get(name, [None])[-1]
+    if not value:
+        if required:
+            raise QueryError(400, f"缺少参数 {name}")
+        return None
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise QueryError(400, f"日期格式应为 YYYY-MM-DD: {name}={value}") from None
+    return value
+
+
+def _range_params(params):
+    start_date = _date_param(params, "start")
+    end_date = _date_param(params, "end")
+    if start_date > end_date:
+        raise QueryError(400, "start 不能晚于 end")
+    return start_date, end_date
+
+
+class QueryService:
+    """看板查询：响应按 (路径, 参数) 缓存，数据版本取自最近一次写入与历史数据的覆盖计数，版本不变时直接返回缓存与 ETag"""
+
+    def __init__(
+        self,
+        db_path=None,
+        readers=None,
+        cache_size=512,
+        check_interval=1.0,
+    ):
+        # 只借用只读连接，不会启动写线程
+        self.connections = ConnectionManager(db_path, readers=readers)
+        self.cache_size = cache_size
+        self.check_interval = check_interval
+        self.routes = {
+            "/api/latest": self._latest,
+            "/api/flow": self._flow,
+            "/api/series": self._series,
+            "/api/reports": self._reports,
+        }
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._key_locks = {}
+        self._version = None
+        self._marker = {}
+        self._checked_at = 0.0
+        self._version_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0}
+
+    def version(self):
+        """当前数据版本：最多每 check_interval 秒查询一次写入标记"""
+        with self._version_lock:
+            now = time.monotonic()
+            if self._version is None or now - self._checked_at >= self.check_interval:
+                with self.connections.reader() as db:
+                    self._marker = db.get_ingest_marker()
+                self._version = "{snapshot_id}:{last_ingest}:{report_id}:{data_version}".format(**self._marker)
+                self._checked_at = now
+            return self._version, self._marker.get("last_ingest")
+
+    def _key_lock(self, key):
+        with self._cache_lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _drop_key_lock(self, key):
+        # 失败的请求不进缓存，锁也随之去掉，避免任意参数撑大 _key_locks
+        with self._cache_lock:
+            self._key_locks.pop(key, None)
+
+    def _count(self, name):
+        with self._cache_lock:
+            self.stats[name] += 1
+
+    def handle(self, target, if_none_match=None):
+        """返回 (status, headers, body)；数据未变化且 ETag 匹配时返回 304"""
+        parts = urlsplit(target)
+        if parts.path == "/api/health":
+            version, last_ingest = self.version()
+            with self._cache_lock:
+                stats = dict(self.stats)
+            body = {"version": version, "last_ingest": last_ingest, "cache": stats}
+            return 200, {}, json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+        handler = self.routes.get(parts.path)
+        if handler is None:
+            return 404, {}, json.dumps({"error": "not found"}).encode("utf-8")
+
+        params = parse_qs(parts.query)
+        key = parts.path + "?" + "&".join(
+            f"{name}={','.join(params[name])}" for name in sorted(params)
+        )
+        version, last_ingest = self.version()
+        etag = '"' + hashlib.sha1(f"{version}|{key}".encode("utf-8")).hexdigest()[:20] + '"'
+        headers = {"ETag": etag, "X-Last-Ingest": last_ingest or ""}
+        if if_none_match and etag in [x.strip() for x in if_none_match.split(",")]:
+            self._count("not_modified")
+            return 304, headers, b""
+
+        body = self._cached(key, version)
+        if body is None:
+            # 同一个键只让一个线程查库，其余线程等它写入缓存
+            with self._key_lock(key):
+                body = self._cached(key, version)
+                if body is None:
+                    self._count("misses")
+                    try:
+                        with self.connections.reader() as db:
+                            payload = handler(db, params)
+                    except QueryError as exc:
+                        self._drop_key_lock(key)
+                        return exc.status, {}, json.dumps(
+                            {"error": str(exc)}, ensure_ascii=False
+                        ).encode("utf-8")
+                    except Exception:
+                        self._drop_key_lock(key)
+                        raise
+                    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                    self._store(key, version, body)
+                    return 200, headers, body
+        self._count("hits")
+        return 200, headers, body
+
+    def _cached(self, key, version):
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._cache.move_to_end(key)
+            return entry[1]
+
+    def _store(self, key, version, body):
+        with self._cache_lock:
+            self._cache[key] = (version, body)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                evicted, _ = self._cache.popitem(last=False)
+                self._key_locks.pop(evicted, None)
+
+    def _latest(self, db, params):
+        stat_date, rows = db.get_latest_flow()
+        return {
+            "stat_date": stat_date,
+            "total_in": sum(in_count for _, _, in_count, _ in rows),
+            "areas": [
+                {"area_code": code, "name": name, "in_count": in_count, "fetched_at": fetched_at}
+                for code, name, in_count, fetched_at in rows
+            ],
+        }
+
+    def _flow(self, db, params):
+        start_date, end_date = _range_params(params)
+        wanted = set(params.get("area", []))
+        # 节假日区间取自库中的登记表，与节假日完全重合的区间直接读节假日汇总
+        flow = db.get_flow_between(start_date, end_date)
+        areas = [
+            {"area_code": code, "name": item["name"], "in_count": item["daily_in"]}
+            for code, item in flow.items()
+            if not wanted or code in wanted
+        ]
+        return {
+            "start": start_date,
+            "end": end_date,
+            "total_in": sum(x["in_count"] for x in areas),
+            "areas": areas,
+        }
+
+    def _series(self, db, params):
+        start_date, end_date = _range_params(params)
+        days = (
+            datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")
+        ).days
+        if days >= MAX_SERIES_DAYS:
+            raise QueryError(400, f"区间过长，最多 {MAX_SERIES_DAYS} 天")
+        wanted = set(params.get("area", []))
+        areas = {}
+        for stat_date, code, name, in_count in db.get_daily_series(start_date, end_date):
+            if wanted and code not in wanted:
+                continue
+            entry = areas.get(code)
+            if entry is None:
+                entry = areas[code] = {"name": name, "dates": [], "counts": []}
+            entry["dates"].append(stat_date)
+            entry["counts"].append(in_count)
+        return {"start": start_date, "end": end_date, "areas": areas}
+
+    def _reports(self, db, params):
+        try:
+            limit = min(max(int(params.get("limit", ["50"])[-1]), 1), 1000)
+        except ValueError:
+            raise QueryError(400, "limit 应为整数") from None
+        report_type = params.get("type", [None])[-1]
+        return {"reports": db.get_report_history(limit, report_type)}
+
+    def close(self):
+        self.connections.close()
+
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service, host="127.0.0.1", port=8080):
+        self.service = service
+        super().__init__((host, port), QueryRequestHandler)
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        try:
+            status, headers, body = self.server.service.handle(
+                self.path, self.headers.get("If-None-Match")
+            )
+        except Exception as exc:
+            logging.exception("查询接口异常 %s: %s", self.path, exc)
+            status, headers, body = 500, {}, b'{"error": "internal error"}'
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("查询接口 %s %s", self.address_string(), format % args)
+
+
+def serve(db_path=None, host="127.0.0.1", port=8080, readers=None, cache_size=512):
+    service = QueryService(db_path=db_path, readers=readers, cache_size=cache_size)
+    server = QueryServer(service, host, port)
+    logging.info(
+        "查询接口已启动 http://%s:%s 只读连接数=%s",
+        host,
+        server.server_port,
+        service.connections.readers,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        logging.info("查询接口已停止 缓存统计=%s", service.stats)
@@ -0,0 +1,226 @@
+import logging
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from src.bot.api.archive import iter_body
+from src.bot.api.flow_parser import FlowParseError, StreamingFlowParser
+from src.bot.service.traffic_service import DEFAULT_LIBRARY_CODES, LibraryFlowMonitor
+from src.bot.storage.database import Database, connect
+
+SOURCES = ("synthetic", "history", "archive")
+
+
+class ReplayClock:
+    """可注入的时钟：作为各组件的 now_func，由回放循环手动拨动"""
+
+    def __init__(self, start=None):
+        self.now = start or datetime.now()
+
+    def __call__(self):
+        return self.now
+
+    def set(self, moment):
+        self.now = moment
+        return moment
+
+    def advance(self, **kwargs):
+        self.now += timedelta(**kwargs)
+        return self.now
+
+
+class NullChatbot:
+    """不发送任何消息，只按时钟记录，供回放比对"""
+
+    def __init__(self, now_func=None):
+        self.now_func = now_func or datetime.now
+        self.messages = []
+
+    def send_markdown(self, title, text, is_at_all=False):
+        self.messages.append(
+            {"sent_at": self.now_func().strftime("%Y-%m-%d %H:%M:%S"), "title": title, "text": text}
+        )
+        return {"errcode": 0, "errmsg": "ok"}
+
+
+class ReplayAPI:
+    """替代 TrafficAPI：按时钟当天的日期从数据源取人流，返回流式解析器同样的结构"""
+
+    def __init__(self, source, library_codes, now_func):
+        self.source = source
+        self.payload = {"orgLocations": list(library_codes)}
+        self.now_func = now_func
+
+    def fetch(self, payload=None, flush=True):
+        flow = self.source(self.now_func().date())
+        if not flow:
+            return None
+        wanted = set((payload or self.payload).get("orgLocations") or ())
+        return {
+            "isSuccess": True,
+            "flow": {code: dict(item) for code, item in flow.items() if code in wanted},
+        }
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def synthetic_source(library_codes, seed=0):
+    """确定性的合成日人流：同一 seed、日期、馆区总是得到同一个数"""
+
+    def source(day):
+        weekend = 1.4 if day.weekday() >= 5 else 1.0
+        flow = {}
+        for code, name in library_codes.items():
+            rng = random.Random(f"{seed}:{code}:{day.isoformat()}")
+            flow[code] = {"name": name, "daily_in": int(rng.randint(800, 4000) * weekend), "daily_out": 0}
+        return flow
+
+    return source
+
+
+def _connect_readonly(db_path):
+    conn = connect(db_path, readonly=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def history_source(db_path, start_date, end_date):
+    """按日读取已有库中 traffic_daily_by_location 的记录作为接口返回"""
+    by_date = {}
+    conn = _connect_readonly(db_path)
+    try:
+        for row in conn.execute(
+            """
+            SELECT stat_date, area_code, area_name, in_count
+            FROM traffic_daily_by_location
+            WHERE stat_date >= ? AND stat_date <= ?
+            """,
+            (start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")),
+        ):
+            by_date.setdefault(row["stat_date"], {})[row["area_code"]] = {
+                "name": row["area_name"],
+                "daily_in": int(row["in_count"]),
+                "daily_out": 0,
+            }
+    finally:
+        conn.close()
+    return lambda day: by_date.get(day.strftime("%Y-%m-%d"))
+
+
+def archive_source(db_path, start_date, end_date, library_codes):
+    """重放已有库中归档的原始响应：每天取最后一次成功采集的响应重新解析"""
+    parser = StreamingFlowParser(library_codes)
+    by_date = {}
+    conn = _connect_readonly(db_path)
+    try:
+        cursor = conn.execute(
+            """
+            SELECT l.fetched_at, b.codec, b.body
+            FROM raw_response_log l
+            JOIN raw_response_bodies b ON b.digest = l.digest
+            WHERE l.fetched_at >= ? AND l.fetched_at < ?
+            ORDER BY l.fetched_at, l.id
+            """,
+            (start_date.strftime("%Y-%m-%d"), (end_date + timedelta(days=1)).strftime("%Y-%m-%d")),
+        )
+        last = None
+        for row in cursor:
+            # 同一天只保留最后一条，日期切换时才解析上一天的
+            if last is not None and last["fetched_at"][:10] != row["fetched_at"][:10]:
+                _parse_archived(parser, last, by_date)
+            last = row
+        if last is not None:
+            _parse_archived(parser, last, by_date)
+    finally:
+        conn.close()
+    return lambda day: by_date.get(day.strftime("%Y-%m-%d"))
+
+
+def _parse_archived(parser, row, by_date):
+    try:
+        data = parser(iter_body(row["codec"], row["body"]))
+    except (FlowParseError, ValueError) as exc:
+        logging.error("归档响应解析失败 %s: %s", row["fetched_at"], exc)
+        return
+    if data.get("isSuccess"):
+        by_date[row["fetched_at"][:10]] = data["flow"]
+
+
+def _library_codes_from(db_path):
+    conn = _connect_readonly(db_path)
+    try:
+        return {
+            row["area_code"]: row["area_name"]
+            for row in conn.execute("SELECT area_code, area_name FROM traffic_areas ORDER BY area_code")
+        }
+    finally:
+        conn.close()
+
+
+def replay(
+    start_date,
+    end_date,
+    source="synthetic",
+    source_db=None,
+    library_codes=None,
+    db_path=":memory:",
+    daily_at="21:00",
+    holiday_config_path=None,
+    seed=0,
+):
+    """在 [start_date, end_date] 内逐日拨动时钟执行 run_once，返回 (消息列表, 统计)
+
+    数据库为临时库（默认内存），钉钉机器人为 NullChatbot；日报、周报、节假日报的判断与生产完全一致。
+    """
+    if source not in SOURCES:
+        raise ValueError(f"不支持的回放数据源: {source}")
+    if source != "synthetic" and not source_db:
+        raise ValueError("history/archive 回放需要指定源数据库")
+
+    if library_codes is None:
+        library_codes = _library_codes_from(source_db) if source_db else None
+    library_codes = library_codes or dict(DEFAULT_LIBRARY_CODES)
+
+    if source == "synthetic":
+        daily_source = synthetic_source(library_codes, seed)
+    elif source == "history":
+        daily_source = history_source(source_db, start_date, end_date)
+    else:
+        daily_source = archive_source(source_db, start_date, end_date, library_codes)
+
+    hour, minute = (int(x) for x in daily_at.split(":"))
+    clock = ReplayClock(datetime.combine(start_date, datetime.min.time()))
+    db = Database(path=db_path, now_func=clock)
+    chatbot = NullChatbot(now_func=clock)
+    monitor = LibraryFlowMonitor(
+        dingtalk_bot=chatbot,
+        db=db,
+        library_codes=library_codes,
+        holiday_config_path=holiday_config_path,
+        detect_anomalies=False,
+        now_func=clock,
+        api=ReplayAPI(daily_source, library_codes, clock),
+    )
+
+    stats = {"days": 0, "failed": 0, "messages": 0}
+    started = time.perf_counter()
+    try:
+        day = start_date
+        while day <= end_date:
+            clock.set(datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute))
+            if monitor.run_once() is None:
+                stats["failed"] += 1
+            stats["days"] += 1
+            day += timedelta(days=1)
+    finally:
+        monitor.close()
+        db.close()
+
+    stats["messages"] = len(chatbot.messages)
+    stats["elapsed"] = time.perf_counter() - started
+    return chatbot.messages, stats
@@ -0,0 +1,162 @@
+import logging
+import random
+import signal
+import threading
+from datetime import datetime, timedelta
+
+
+class DailyTrigger:
+    def __init__(self, at):
+        hour, minute = (int(x) for x in at.split(":", 1))
+        if not (0 <= hour < 24 and 0 <= minute < 60):
+            raise ValueError(f"无效的时间: {at}")
+        self.hour = hour
+        self.minute = minute
+
+    def previous(self, now):
+        fire_at = now.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if fire_at > now:
+            fire_at -= timedelta(days=1)
+        return fire_at
+
+    def next(self, now):
+        return self.previous(now) + timedelta(days=1)
+
+    def __str__(self):
+        return f"daily@{self.hour:02d}:{self.minute:02d}"
+
+
+class IntervalTrigger:
+    def __init__(self, minutes):
+        if minutes <= 0:
+            raise ValueError(f"无效的间隔: {minutes}")
+        self.interval = timedelta(minutes=minutes)
+
+    def previous(self, now):
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        steps = (now - midnight) // self.interval
+        return midnight + steps * self.interval
+
+    def next(self, now):
+        return self.previous(now) + self.interval
+
+    def __str__(self):
+        return f"every {int(self.interval.total_seconds() // 60)}min"
+
+
+class ScheduledJob:
+    def __init__(self, name, func, trigger, jitter=0, misfire_grace=3600, catch_up=True):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.jitter = jitter
+        self.misfire_grace = timedelta(seconds=misfire_grace)
+        self.catch_up = catch_up
+        self.scheduled_for = None
+        self.next_run = None
+
+    def plan(self, now):
+        self.scheduled_for = self.trigger.next(now)
+        offset = random.uniform(0, self.jitter) if self.jitter else 0
+        self.next_run = self.scheduled_for + timedelta(seconds=offset)
+
+
+class Scheduler:
+    """进程内调度器：按触发器依次执行任务，支持抖动、错过补跑与优雅退出"""
+
+    def __init__(self, state_store=None, now_func=None):
+        self.state_store = state_store
+        self.now_func = now_func or datetime.now
+        self._jobs = []
+        self._stop_event = threading.Event()
+
+    def add_job(self, name, func, trigger, jitter=0, misfire_grace=3600, catch_up=True):
+        job = ScheduledJob(
+            name=name,
+            func=func,
+            trigger=trigger,
+            jitter=jitter,
+            misfire_grace=misfire_grace,
+            catch_up=catch_up,
+        )
+        self._jobs.append(job)
+        logging.info("注册调度任务: %s (%s)", name, trigger)
+        return job
+
+    def stop(self, *_):
+        if not self._stop_event.is_set():
+            logging.info("收到停止信号，当前任务完成后退出")
+        self._stop_event.set()
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def install_signal_handlers(self):
+        for sig_name in ("SIGINT", "SIGTERM"):
+            sig = getattr(signal, sig_name, None)
+            if sig is not None:
+                signal.signal(sig, self.stop)
+
+    def _last_run(self, job):
+        if self.state_store is None:
+            return None
+        value = self.state_store.get_job_last_run(job.name)
+        if not value:
+            return None
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+
+    def _needs_catch_up(self, job, now):
+        if not job.catch_up:
+            return False
+        previous_fire = job.trigger.previous(now)
+        if now - previous_fire > job.misfire_grace:
+            return False
+        last_run = self._last_run(job)
+        return last_run is None or last_run < previous_fire
+
+    def _run_job(self, job, scheduled_for):
+        started = self.now_func()
+        logging.info("调度任务开始: %s 计划时间=%s", job.name, scheduled_for)
+        try:
+            job.func()
+        except Exception as exc:
+            logging.exception("调度任务异常: %s %s", job.name, exc)
+        finally:
+            if self.state_store is not None:
+                self.state_store.set_job_last_run(
+                    job.name, started.strftime("%Y-%m-%d %H:%M:%S")
+                )
+            elapsed = (self.now_func() - started).total_seconds()
+            logging.info("调度任务结束: %s 耗时=%.3fs", job.name, elapsed)
+
+    def run_forever(self):
+        now = self.now_func()
+        for job in self._jobs:
+            if self._needs_catch_up(job, now):
+                logging.info("补跑错过的调度任务: %s", job.name)
+                self._run_job(job, job.trigger.previous(now))
+                if self.stopped:
+                    return
+            job.plan(self.now_func())
+            logging.info("调度任务 %s 下次执行: %s", job.name, job.next_run)
+
+        while not self.stopped and self._jobs:
+            job = min(self._jobs, key=lambda x: x.next_run)
+            wait_seconds = (job.next_run - self.now_func()).total_seconds()
+            if wait_seconds > 0 and self._stop_event.wait(min(wait_seconds, 60)):
+                break
+            now = self.now_func()
+            if now < job.next_run:
+                continue
+
+            # 从加上抖动后的执行时间起算，抖动大于宽限时间时任务也不会被一直跳过
+            if now - job.next_run > job.misfire_grace:
+                logging.warning(
+                    "调度任务错过执行窗口，跳过: %s 计划时间=%s", job.name, job.scheduled_for
+                )
+            else:
+                self._run_job(job, job.scheduled_for)
+            job.plan(self.now_func())
+
+        logging.info("调度器已停止")
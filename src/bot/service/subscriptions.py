@@ -0,0 +1,79 @@
+import json
+import logging
+from pathlib import Path
+
+DEFAULT_CHANNEL = "default"
+ALL_REPORT_TYPES = ("daily", "weekly", "holiday")
+
+
+class Subscription:
+    def __init__(self, channel, chatbot, library_codes=None, report_types=ALL_REPORT_TYPES):
+        self.channel = channel
+        self.chatbot = chatbot
+        self.library_codes = frozenset(library_codes) if library_codes else None
+        self.report_types = frozenset(report_types)
+
+
+class SubscriptionRegistry:
+    """钉钉群订阅表：每个机器人可以只订阅部分报告类型与部分馆区"""
+
+    def __init__(self, subscriptions=()):
+        self._subscriptions = {}
+        for subscription in subscriptions:
+            self.add(subscription)
+
+    def add(self, subscription):
+        self._subscriptions[subscription.channel] = subscription
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    @classmethod
+    def load(cls, config_path, chatbot_factory, default_chatbot=None):
+        registry = cls()
+        if default_chatbot is not None:
+            registry.add(Subscription(DEFAULT_CHANNEL, default_chatbot))
+
+        config_path = Path(config_path)
+        if not config_path.exists():
+            return registry
+
+        try:
+            payload = json.loads(config_path.read_text(encoding="utf-8"))
+        except Exception as exc:
+            logging.exception("读取订阅配置失败: %s", exc)
+            return registry
+
+        robots = payload.get("robots", []) if isinstance(payload, dict) else []
+        for item in robots:
+            if not isinstance(item, dict) or not item.get("name") or not item.get("webhook"):
+                logging.warning("忽略无效的订阅配置: %s", item)
+                continue
+            try:
+                chatbot = chatbot_factory(item["webhook"], item.get("secret"))
+            except Exception as exc:
+                logging.error("初始化钉钉机器人失败 %s: %s", item["name"], exc)
+                continue
+            registry.add(
+                Subscription(
+                    item["name"],
+                    chatbot,
+                    library_codes=item.get("library_codes"),
+                    report_types=item.get("report_types") or ALL_REPORT_TYPES,
+                )
+            )
+
+        logging.info("订阅配置加载完成，机器人数=%s", len(registry))
+        return registry
+
+    def chatbots(self):
+        return {x.channel: x.chatbot for x in self._subscriptions.values()}
+
+    def variants(self, report_type):
+        """按馆区子集分组订阅者：同一子集的报告只渲染一次。键为 None 表示全部馆区"""
+        grouped = {}
+        for subscription in self._subscriptions.values():
+            if report_type not in subscription.report_types:
+                continue
+            grouped.setdefault(subscription.library_codes, []).append(subscription.channel)
+        return grouped
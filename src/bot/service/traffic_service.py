@@ -1,76 +1,242 @@
-import json
 import logging
+import time
+import zlib
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from pathlib import Path
 from uuid import uuid4
 
+from src.bot.api.archive import ResponseArchive, iter_body
+from src.bot.api.endpoint_health import EndpointHealthTracker
+from src.bot.api.flow_parser import FlowParseError, StreamingFlowParser, summarize_location
 from src.bot.api.traffic_api import TrafficAPI
+from src.bot.metrics import METRICS
+from src.bot.service.anomaly import KIND_LABELS, AnomalyDetector
+from src.bot.service.analytics import (
+    FlowSeries,
+    last_year_holiday,
+    ratio,
+    shift_months,
+    shift_years,
+)
+from src.bot.service.holiday_calendar import HolidayCalendar
+from src.bot.service.outbox import delivery_error
+from src.bot.service.subscriptions import DEFAULT_CHANNEL
+
+TREND_LOOKBACK_DAYS = 60
+TREND_RANKING_SIZE = 5
+
+DEFAULT_LIBRARY_CODES = {
+    "CN-ZJLIB_ZJ": "之江馆",
+    "CN-ZJLIB_BSGL": "曙光馆",
+    "CN-ZJLIB_BSL": "大学路馆",
+}
 
 
 class TrafficService:
-    def __init__(self, api: TrafficAPI, library_codes, db=None):
+    def __init__(
+        self,
+        api: TrafficAPI,
+        library_codes,
+        db=None,
+        batch_size=0,
+        max_workers=8,
+        batch_retries=1,
+        retry_delay=2,
+        collect_timeout=120,
+        detector=None,
+        now_func=None,
+    ):
         self.api = api
         self.library_codes = library_codes
         self.db = db
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.batch_retries = batch_retries
+        self.retry_delay = retry_delay
+        self.collect_timeout = collect_timeout
+        self.detector = detector
+        self.now_func = now_func or datetime.now
+        self.collected_at = None
+
+    def begin_collection(self):
+        """一次采集共用一个时间戳：归档的原始响应与写库快照的 fetched_at 相同"""
+        self.collected_at = self.now_func().strftime("%Y-%m-%d %H:%M:%S")
+        archive = getattr(self.api, "archive", None)
+        if archive is not None:
+            archive.collected_at = self.collected_at
+        return self.collected_at
 
     def fetch_and_parse_daily_flow(self):
         logging.info("开始获取人流数据")
+        self.begin_collection()
 
-        data = self.api.fetch_flow_data(use_backup=False)
-        if not data:
-            logging.warning("主接口失败，尝试备用接口")
-            data = self.api.fetch_flow_data(use_backup=True)
-
-        if not data:
-            logging.error("所有接口均失败")
-            return None
+        locations = list(self.api.payload.get("orgLocations", []))
+        if self.batch_size and len(locations) > self.batch_size:
+            flow_data = self._fetch_sharded(locations)
+        else:
+            data = self.api.fetch()
+            if not data:
+                logging.error("所有接口均失败")
+                return None
+            flow_data = self.parse_daily_flow(data)
 
-        flow_data = self.parse_daily_flow(data)
         if not flow_data:
             logging.error("解析人流数据失败")
             return None
 
         total_in = sum(int(v.get("daily_in", 0)) for v in flow_data.values())
         logging.info("人流数据获取完成，馆区数=%s，总进馆=%s", len(flow_data), total_in)
+        self.detect_anomalies(flow_data)
         return flow_data
 
+    def detect_anomalies(self, flow_data):
+        """把本次快照喂给异常检测器；检测失败只记日志，不影响采集与写库"""
+        if self.detector is None or not flow_data:
+            return []
+        try:
+            return self.detector.observe(flow_data, self.now_func())
+        except Exception as exc:
+            logging.exception("异常检测失败: %s", exc)
+            return []
+
+    def _fetch_batch(self, index, locations):
+        """单个分片：接口内部已按健康度主备切换，整体失败后再按 batch_retries 重试"""
+        payload = dict(self.api.payload, orgLocations=locations)
+        for attempt in range(self.batch_retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay * attempt)
+                logging.warning("分片 %s 第%s次重试", index, attempt)
+            flow_data = self.parse_daily_flow(self.api.fetch(payload=payload, flush=False))
+            if flow_data is not None:
+                return flow_data
+        return None
+
+    def _fetch_sharded(self, locations):
+        """按 batch_size 切分馆区并发请求，合并为一个 flow_summary；超时或失败的分片跳过，不影响其他分片"""
+        batches = [
+            locations[i:i + self.batch_size] for i in range(0, len(locations), self.batch_size)
+        ]
+        started = time.perf_counter()
+        executor = ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(batches)), thread_name_prefix="traffic-batch"
+        )
+        futures = {
+            executor.submit(self._fetch_batch, index, batch): index
+            for index, batch in enumerate(batches)
+        }
+        flow_summary = {}
+        failed = []
+        try:
+            done, not_done = wait(futures, timeout=self.collect_timeout)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    logging.exception("分片 %s 采集异常: %s", futures[future], exc)
+                    result = None
+                if result is None:
+                    failed.append(futures[future])
+                else:
+                    flow_summary.update(result)
+            for future in not_done:
+                failed.append(futures[future])
+                logging.error("分片 %s 超过 %ss 未返回，本次跳过", futures[future], self.collect_timeout)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.api.flush()
+
+        logging.info(
+            "分片采集完成，分片数=%s，失败=%s，馆区数=%s，耗时=%.2fs",
+            len(batches),
+            len(failed),
+            len(flow_summary),
+            time.perf_counter() - started,
+        )
+        if failed:
+            logging.warning(
+                "以下分片未取得数据: %s",
+                ",".join(str(x) for x in sorted(failed)),
+            )
+        return flow_summary
+
     def parse_daily_flow(self, data):
         if not data or not data.get("isSuccess"):
             logging.error("API 返回异常")
             return None
 
+        if "flow" in data:
+            # 流式解析器已在读取响应时过滤馆区并汇总计数，耗时由接口层记入 parse_daily_flow
+            return data["flow"]
+
         flow_summary = {}
-        for library in data.get("data", []):
-            org_location = library.get("orgLocation")
-            org_name = library.get("orgLocationName")
-            if org_location not in self.library_codes:
-                continue
+        with METRICS.timer("parse_daily_flow"):
+            for library in data.get("data", []):
+                org_location = library.get("orgLocation")
+                if org_location not in self.library_codes:
+                    continue
+                flow_summary[org_location] = summarize_location(
+                    library.get("orgLocationName"), library.get("fCount", [])
+                )
 
-            daily_in = 0
-            for count_data in library.get("fCount", []):
-                if count_data.get("countType") == "日" and count_data.get("dateType") == 0:
-                    daily_in = int(count_data.get("personCount", 0))
+        return flow_summary
 
-            flow_summary[org_location] = {
-                "name": org_name,
-                "daily_in": daily_in,
-                "daily_out": 0,
-            }
+    def reprocess_archive(self, start_date=None, end_date=None, batch_size=100):
+        """按采集时间顺序把归档的原始响应重新解析写库，厂商口径变化后用于重建派生表"""
+        if not self.db:
+            logging.warning("数据库未初始化，跳过重放")
+            return None
 
-        return flow_summary
+        parser = StreamingFlowParser(self.library_codes)
+        stats = {"responses": 0, "written": 0, "skipped": 0, "failed": 0}
+        last_digest = None
+        flow_data = None
+        for row in self.db.iter_archived_responses(start_date, end_date, batch_size):
+            stats["responses"] += 1
+            # 连续相同的响应只解析一次
+            if row["digest"] != last_digest:
+                last_digest = row["digest"]
+                try:
+                    flow_data = self.parse_daily_flow(parser(iter_body(row["codec"], row["body"])))
+                except (FlowParseError, ValueError, zlib.error) as exc:
+                    logging.error("归档响应解析失败 %s: %s", row["digest"][:12], exc)
+                    flow_data = None
+            if not flow_data:
+                stats["failed"] += 1
+                continue
 
-    def save_daily_flow(self, flow_data, date_str=None):
+            # 重放以归档数据为准直接覆盖，不经过增量写入的时间戳与内存计数判断
+            fetched_at = row["fetched_at"]
+            result = self.db.overwrite_daily_flow(fetched_at[:10], flow_data, fetched_at)
+            stats["written"] += result["written"]
+            stats["skipped"] += result["skipped"]
+
+        if stats["written"]:
+            self.db.rebuild_derived_tables()
+
+        logging.info(
+            "归档重放完成，响应数=%s，写入=%s，未变化=%s，失败=%s",
+            stats["responses"],
+            stats["written"],
+            stats["skipped"],
+            stats["failed"],
+        )
+        return stats
+
+    def save_daily_flow(self, flow_data, date_str=None, fetched_at=None):
         if not self.db or not flow_data:
             logging.info("跳过写库：db 或 flow_data 为空")
-            return
+            return None
 
         if date_str is None:
-            date_str = datetime.now().strftime("%Y-%m-%d")
+            date_str = self.now_func().strftime("%Y-%m-%d")
 
         try:
-            self.db.insert_daily_flow(date_str, flow_data)
+            return self.db.insert_daily_flow(date_str, flow_data, fetched_at=fetched_at)
         except Exception as exc:
             logging.exception("保存人流数据失败: %s", exc)
+            return None
 
 
 class LibraryFlowMonitor:
@@ -83,6 +249,15 @@ class LibraryFlowMonitor:
         org_locations=None,
         library_codes=None,
         holiday_config_path=None,
+        hedge=False,
+        outbox=None,
+        subscriptions=None,
+        batch_size=0,
+        max_workers=8,
+        detect_anomalies=True,
+        now_func=None,
+        api=None,
+        reader=None,
     ):
         primary_url = primary_url or (
             "http://10.18.222.30:5001/alvarainflow/api/WwStatisticsLog/GetBigFlowByLocations"
@@ -91,41 +266,222 @@ class LibraryFlowMonitor:
             "https://shujia.alva.com.cn/zhejiangshengtsg/alvarainflow/api/WwStatisticsLog/GetBigFlowByLocations"
         )
 
-        self.library_codes = library_codes or {
-            "CN-ZJLIB_ZJ": "之江馆",
-            "CN-ZJLIB_BSGL": "曙光馆",
-            "CN-ZJLIB_BSL": "大学路馆",
-        }
+        self.library_codes = library_codes or dict(DEFAULT_LIBRARY_CODES)
 
-        payload = {
-            "orgLocations": org_locations
-            or ["CN-ZJLIB_ZJ", "CN-ZJLIB_BSGL", "CN-ZJLIB_BSL"]
-        }
+        payload = {"orgLocations": org_locations or list(self.library_codes)}
 
         headers = {
             "Content-Type": "application/json",
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
         }
 
-        api = TrafficAPI(
+        self.now_func = now_func or datetime.now
+        api = api or TrafficAPI(
             primary_url=primary_url,
             backup_url=backup_url,
             payload=payload,
             headers=headers,
+            hedge=hedge,
+            health=EndpointHealthTracker(store=db),
+            pool_size=max(4, max_workers),
+            parser=StreamingFlowParser(self.library_codes),
+            archive=ResponseArchive(store=db, now_func=self.now_func),
+        )
+        self.service = TrafficService(
+            api=api,
+            library_codes=self.library_codes,
+            db=db,
+            batch_size=batch_size,
+            max_workers=max_workers,
+            now_func=self.now_func,
         )
-        self.service = TrafficService(api=api, library_codes=self.library_codes, db=db)
 
         self.dingtalk_bot = dingtalk_bot
         self.db = db
+        self.reader = reader
+        self.outbox = outbox
+        self.subscriptions = subscriptions
+        self.last_run_id = None
         self.holiday_config_path = Path(holiday_config_path or "config/holiday_ranges.json")
-
-    def _send_markdown(self, title, markdown_text):
+        self.holiday_calendar = HolidayCalendar(self.holiday_config_path)
+        self._synced_holiday_version = None
+        self.sync_holiday_rollups()
+        if detect_anomalies:
+            self.service.detector = AnomalyDetector(store=db, alert=self._send_anomaly_alert)
+
+    def close(self):
+        self.service.api.close()
+
+    @contextmanager
+    def _reading(self):
+        """报告读取用的连接：配置了只读连接池时从池中借出，否则直接用 db"""
+        if self.reader is None:
+            yield self.db
+            return
+        with self.reader() as db:
+            yield db
+
+    @METRICS.timed("send_markdown")
+    def _send_markdown(self, title, markdown_text, report_type="", start_date="", end_date=""):
+        """发送消息；配置了发件箱时只入队由后台线程发送。返回是否已同步确认送达"""
+        if self.dingtalk_bot and self.outbox and self.db:
+            self.db.enqueue_report(report_type, start_date, end_date, title, markdown_text)
+            self.outbox.notify()
+            logging.info("钉钉消息已入队: %s", title)
+            return False
         if self.dingtalk_bot:
-            self.dingtalk_bot.send_markdown(title=title, text=markdown_text, is_at_all=False)
+            result = self.dingtalk_bot.send_markdown(title=title, text=markdown_text, is_at_all=False)
+            # 钉钉拒绝时不抛异常，只在返回值中给出非 0 的 errcode
+            error = delivery_error(result)
+            if error:
+                logging.error("发送钉钉消息失败: %s %s", title, error)
+                return False
             logging.info("发送钉钉消息成功: %s", title)
+            return True
+
+        logging.warning("未配置钉钉机器人，输出到控制台: %s", title)
+        print(f"[{title}]\n{markdown_text}")
+        return False
+
+    def _send_anomaly_alert(self, anomalies):
+        observed_at = anomalies[0]["observed_at"]
+        lines = ["#### 人流数据异常告警", "", f"**采集时间**：{observed_at}", ""]
+        for item in anomalies:
+            lines.append(f"- **{item['area_name']}** {KIND_LABELS[item['kind']]}：{item['detail']}")
+        lines.extend(["", "请检查对应馆区的闸机与计数设备。"])
+        self._send_markdown(
+            "人流数据异常告警", "\n".join(lines), "anomaly", observed_at[:10], observed_at[:10]
+        )
+
+    def _publish(
+        self,
+        report_type,
+        start_date,
+        end_date,
+        flow_data,
+        holiday_name="",
+        comparison_flow_data=None,
+        series=None,
+        skip_channels=(),
+    ):
+        """按订阅分发报告：同一馆区子集只渲染一次，所有群的消息一次性写入发件箱。返回是否已同步确认送达
+
+        skip_channels 中的机器人已有待发或已送达的同一份报告，不再入队。
+        """
+        title = self._build_title(report_type, holiday_name=holiday_name)
+        if not (self.subscriptions and self.outbox and self.db):
+            markdown_text = self.format_output_for_dingtalk(
+                flow_data=flow_data,
+                report_type=report_type,
+                start_date=start_date,
+                end_date=end_date,
+                holiday_name=holiday_name,
+                comparison_flow_data=comparison_flow_data,
+                trend_lines=self._trend_lines(
+                    series, report_type, start_date, end_date, flow_data, holiday_name
+                ),
+            )
+            return self._send_markdown(title, markdown_text, report_type, start_date, end_date)
+
+        messages = []
+        for library_codes, channels in self.subscriptions.variants(report_type).items():
+            channels = [x for x in channels if x not in skip_channels]
+            if not channels:
+                continue
+            variant_flow = flow_data
+            variant_comparison = comparison_flow_data
+            if library_codes is not None:
+                variant_flow = {k: v for k, v in flow_data.items() if k in library_codes}
+                if comparison_flow_data is not None:
+                    variant_comparison = {
+                        k: v for k, v in comparison_flow_data.items() if k in library_codes
+                    }
+            if not variant_flow:
+                logging.info("订阅馆区无数据，跳过: %s -> %s", title, ",".join(channels))
+                continue
+            markdown_text = self.format_output_for_dingtalk(
+                flow_data=variant_flow,
+                report_type=report_type,
+                start_date=start_date,
+                end_date=end_date,
+                holiday_name=holiday_name,
+                comparison_flow_data=variant_comparison,
+                trend_lines=self._trend_lines(
+                    series, report_type, start_date, end_date, variant_flow, holiday_name
+                ),
+            )
+            for channel in channels:
+                messages.append(
+                    (channel, report_type, start_date, end_date, title, markdown_text)
+                )
+
+        if messages:
+            with METRICS.timer("send_markdown", "outbox"):
+                self.db.enqueue_reports(messages)
+            self.outbox.notify()
+            logging.info("钉钉消息已入队: %s，群数=%s", title, len(messages))
+        return False
+
+    def _load_series(self, db, start_date, end_date):
+        """趋势分析用：一次载入去年同期前后至今的日序列，之后的同比、均值、排名都在内存中计算"""
+        try:
+            return FlowSeries.load(
+                db,
+                shift_years(start_date, -1) - timedelta(days=TREND_LOOKBACK_DAYS),
+                end_date,
+            )
+        except Exception as exc:
+            logging.exception("载入趋势数据失败: %s", exc)
+            return None
+
+    def _trend_lines(self, series, report_type, start_date, end_date, flow_data, holiday_name=""):
+        if series is None or report_type not in ("weekly", "holiday"):
+            return None
+
+        codes = list(flow_data)
+        if not series.covers(shift_years(start_date, -1), end_date):
+            return None
+        key = series.merge(codes)
+        lines = ["---", "**趋势**", f"- 日均进馆：{series.average(key, start_date, end_date):,.0f}"]
+
+        previous_year = series.total(key, shift_years(start_date, -1), shift_years(end_date, -1))
+        if previous_year:
+            growth_text = self._colorize_ratio(
+                self._format_growth(series.yoy(key, start_date, end_date)), "同比"
+            )
+            lines.append(f"- 去年同期：{previous_year:,}（{growth_text}）")
+
+        previous_month = series.total(
+            key, shift_months(start_date, -1), shift_months(end_date, -1)
+        )
+        if previous_month:
+            growth_text = self._colorize_ratio(
+                self._format_growth(series.mom(key, start_date, end_date)), "环比"
+            )
+            lines.append(f"- 上月同期：{previous_month:,}（{growth_text}）")
+
+        if report_type == "holiday":
+            holiday = {"start_date": start_date, "end_date": end_date, "name": holiday_name}
+            holiday_ranges = self._load_holiday_ranges()
+            previous = last_year_holiday(holiday, holiday_ranges)
+            growth = series.holiday_yoy(key, holiday, holiday_ranges)
+            if previous is not None and growth is not None:
+                previous_total = series.total(key, previous["start_date"], previous["end_date"])
+                growth_text = self._colorize_ratio(self._format_growth(growth), "同比")
+                lines.append(f"- 去年{holiday_name}：{previous_total:,}（{growth_text}）")
         else:
-            logging.warning("未配置钉钉机器人，输出到控制台: %s", title)
-            print(f"[{title}]\n{markdown_text}")
+            four_weeks = series.moving_average(key, 28)[series.index(end_date)]
+            lines.append(f"- 近四周日均：{four_weeks:,.0f}")
+
+        if len(codes) > 1:
+            ranking = series.ranking(start_date, end_date, codes)[:TREND_RANKING_SIZE]
+            lines.append(
+                "- 馆区排名："
+                + " > ".join(
+                    f"{flow_data[code]['name']} {value:,}" for code, value in ranking
+                )
+            )
+        return lines
 
     def _build_title(self, report_type, holiday_name=""):
         if report_type == "daily":
@@ -144,21 +500,24 @@ class LibraryFlowMonitor:
                 return "0%"
             return "新增"
 
-        ratio = (current_value - previous_value) / previous_value * 100
-        ratio_text = f"{ratio:+.1f}%"
+        return self._format_growth(ratio(current_value, previous_value))
+
+    def _format_growth(self, growth):
+        ratio_text = f"{growth * 100:+.1f}%"
         if ratio_text.endswith(".0%"):
             ratio_text = ratio_text.replace(".0%", "%")
         return ratio_text
 
-    def _colorize_ratio(self, ratio_text):
+    def _colorize_ratio(self, ratio_text, label="环比"):
         if ratio_text == "新增":
-            return '<font color="red">环比新增</font>'
+            return f'<font color="red">{label}新增</font>'
         if ratio_text.startswith("+"):
-            return f'<font color="red">环比{ratio_text}</font>'
+            return f'<font color="red">{label}{ratio_text}</font>'
         if ratio_text.startswith("-"):
-            return f'<font color="green">环比{ratio_text}</font>'
-        return f"环比{ratio_text}"
+            return f'<font color="green">{label}{ratio_text}</font>'
+        return f"{label}{ratio_text}"
 
+    @METRICS.timed("format_output_for_dingtalk")
     def format_output_for_dingtalk(
         self,
         flow_data,
@@ -167,6 +526,7 @@ class LibraryFlowMonitor:
         end_date,
         holiday_name="",
         comparison_flow_data=None,
+        trend_lines=None,
     ):
         if not flow_data:
             return "无法获取人流数据"
@@ -211,6 +571,8 @@ class LibraryFlowMonitor:
             output_lines.append(f"- 总进馆人次：{total_in:,}（{total_ratio_text}）")
         else:
             output_lines.append(f"- 总进馆人次：{total_in:,}")
+        if trend_lines:
+            output_lines.extend(trend_lines)
         return "\n".join(output_lines)
 
     def _send_aggregated_report(
@@ -225,37 +587,57 @@ class LibraryFlowMonitor:
             logging.warning("数据库未初始化，跳过%s报告", report_type)
             return
 
-        if not force and self.db.has_report_sent(report_type, start_date, end_date):
-            logging.info("去重命中，跳过%s: %s ~ %s", report_type, start_date, end_date)
-            return
-
-        flow_data = self.db.get_flow_between(start_date, end_date)
-        if not flow_data:
-            logging.warning("%s区间无数据，跳过发送: %s ~ %s", report_type, start_date, end_date)
-            return
-
-        comparison_flow_data = None
-        if report_type == "weekly":
-            week_start = datetime.strptime(start_date, "%Y-%m-%d").date()
-            week_end = datetime.strptime(end_date, "%Y-%m-%d").date()
-            last_week_start = (week_start - timedelta(days=7)).strftime("%Y-%m-%d")
-            last_week_end = (week_end - timedelta(days=7)).strftime("%Y-%m-%d")
-            comparison_flow_data = self.db.get_flow_between(last_week_start, last_week_end)
-
-        title = self._build_title(report_type, holiday_name=holiday_name)
-        markdown_text = self.format_output_for_dingtalk(
-            flow_data=flow_data,
+        # 去重检查与报告数据都从只读连接读取，不占用写线程
+        with self._reading() as db:
+            queued = set()
+            if not force:
+                if db.has_report_sent(report_type, start_date, end_date):
+                    logging.info("去重命中，跳过%s: %s ~ %s", report_type, start_date, end_date)
+                    return
+                # 按机器人去重：某个群放弃发送后只给这个群重新入队
+                queued = db.queued_outbox_channels(report_type, start_date, end_date)
+                if queued and queued >= self._report_channels(report_type):
+                    logging.info("已在发件箱中，跳过%s: %s ~ %s", report_type, start_date, end_date)
+                    return
+
+            flow_data = db.get_flow_between(start_date, end_date)
+            if not flow_data:
+                logging.warning("%s区间无数据，跳过发送: %s ~ %s", report_type, start_date, end_date)
+                return
+
+            comparison_flow_data = None
+            if report_type == "weekly":
+                week_start = datetime.strptime(start_date, "%Y-%m-%d").date()
+                week_end = datetime.strptime(end_date, "%Y-%m-%d").date()
+                last_week_start = (week_start - timedelta(days=7)).strftime("%Y-%m-%d")
+                last_week_end = (week_end - timedelta(days=7)).strftime("%Y-%m-%d")
+                comparison_flow_data = db.get_range_totals(last_week_start, last_week_end)
+            series = self._load_series(db, start_date, end_date)
+
+        delivered = self._publish(
             report_type=report_type,
             start_date=start_date,
             end_date=end_date,
+            flow_data=flow_data,
             holiday_name=holiday_name,
             comparison_flow_data=comparison_flow_data,
+            series=series,
+            skip_channels=queued,
         )
-        self._send_markdown(title=title, markdown_text=markdown_text)
 
-        if self.dingtalk_bot:
+        if delivered:
             self.db.mark_report_sent(report_type, start_date, end_date)
 
+    def _report_channels(self, report_type):
+        """报告经发件箱送往的机器人；未配置订阅时只有默认机器人"""
+        if self.subscriptions and self.outbox:
+            return {
+                channel
+                for channels in self.subscriptions.variants(report_type).values()
+                for channel in channels
+            }
+        return {DEFAULT_CHANNEL}
+
     def _week_range(self, today):
         start = today - timedelta(days=today.weekday())
         end = start + timedelta(days=6)
@@ -265,64 +647,75 @@ class LibraryFlowMonitor:
         return today.weekday() == 6
 
     def _load_holiday_ranges(self):
-        if not self.holiday_config_path.exists():
-            logging.info("节假日配置文件不存在: %s", self.holiday_config_path)
-            return []
-
-        try:
-            payload = json.loads(self.holiday_config_path.read_text(encoding="utf-8"))
-        except Exception as exc:
-            logging.exception("读取节假日配置失败: %s", exc)
-            return []
-
-        ranges = payload.get("ranges", []) if isinstance(payload, dict) else []
-        valid = []
-        for item in ranges:
-            if not isinstance(item, dict):
-                continue
-            start_date = item.get("start_date")
-            end_date = item.get("end_date")
-            if not start_date or not end_date:
-                continue
-            valid.append(
-                {
-                    "start_date": start_date,
-                    "end_date": end_date,
-                    "name": item.get("name", ""),
-                }
-            )
+        return self.holiday_calendar.ranges()
 
-        logging.info("节假日配置加载完成，条数=%s", len(valid))
-        return valid
+    def sync_holiday_rollups(self):
+        """配置文件有修改时把节假日区间登记到库中，并补建对应的节假日汇总"""
+        self.holiday_calendar.refresh()
+        if not self.db or self._synced_holiday_version == self.holiday_calendar.version:
+            return
+        self.db.set_holiday_ranges(self.holiday_calendar.ranges())
+        self._synced_holiday_version = self.holiday_calendar.version
 
     def _holiday_ranges_ending_today(self, today):
-        today_str = today.strftime("%Y-%m-%d")
-        matched = [x for x in self._load_holiday_ranges() if x.get("end_date") == today_str]
+        self.sync_holiday_rollups()
+        matched = self.holiday_calendar.ranges_ending_on(today)
         if matched:
             logging.info("命中节假日结束日，条数=%s", len(matched))
         return matched
 
     def run_once(self):
-        run_id = uuid4().hex[:8]
+        run_id = self.last_run_id = uuid4().hex[:8]
         logging.info("任务开始 run_id=%s", run_id)
-
-        daily_flow = self.service.fetch_and_parse_daily_flow()
-        if not daily_flow:
-            logging.error("任务失败 run_id=%s，日报数据为空", run_id)
-            return None
-
-        today = datetime.now().date()
+        started = time.perf_counter()
+        try:
+            daily_flow = self.service.fetch_and_parse_daily_flow()
+            if not daily_flow:
+                logging.error("任务失败 run_id=%s，日报数据为空", run_id)
+                return None
+
+            today = self.now_func().date()
+            self.service.save_daily_flow(
+                daily_flow,
+                date_str=today.strftime("%Y-%m-%d"),
+                fetched_at=self.service.collected_at,
+            )
+            self.send_reports(today, daily_flow, run_id)
+            return daily_flow
+        finally:
+            METRICS.observe("run_once", time.perf_counter() - started)
+            self.record_metrics(run_id)
+
+    def record_metrics(self, run_id):
+        """把本次运行各阶段耗时写入 run_metrics 表，并刷新 Prometheus textfile"""
+        if not METRICS.enabled:
+            return
+        rows = METRICS.take_run()
+        if rows:
+            logging.info(
+                "阶段耗时 run_id=%s %s",
+                run_id,
+                " ".join(
+                    f"{x['stage']}{'@' + x['endpoint'] if x['endpoint'] else ''}"
+                    f"={x['total_seconds']:.3f}s/{x['count']}"
+                    for x in rows
+                ),
+            )
+            if self.db:
+                try:
+                    self.db.save_run_metrics(run_id, rows)
+                except Exception as exc:
+                    logging.exception("保存耗时统计失败: %s", exc)
+        if METRICS.textfile:
+            try:
+                METRICS.write_textfile()
+            except OSError as exc:
+                logging.error("写入指标文件失败 %s: %s", METRICS.textfile, exc)
+
+    def send_reports(self, today, daily_flow, run_id=""):
+        """发送日报，并按日期判断是否触发周报与节假日报"""
         today_str = today.strftime("%Y-%m-%d")
-        self.service.save_daily_flow(daily_flow, date_str=today_str)
-
-        daily_title = self._build_title("daily")
-        daily_text = self.format_output_for_dingtalk(
-            flow_data=daily_flow,
-            report_type="daily",
-            start_date=today_str,
-            end_date=today_str,
-        )
-        self._send_markdown(daily_title, daily_text)
+        self._publish("daily", today_str, today_str, daily_flow)
 
         if self._is_week_end(today):
             week_start, week_end = self._week_range(today)
@@ -355,7 +748,27 @@ class LibraryFlowMonitor:
             )
 
         logging.info("任务结束 run_id=%s", run_id)
-        return daily_flow
+
+    def collect_intraday(self):
+        # 每次日内采集单独记一次运行，耗时不会累积到下一次日报
+        run_id = uuid4().hex[:8]
+        started = time.perf_counter()
+        try:
+            flow_data = self.service.fetch_and_parse_daily_flow()
+            if not flow_data:
+                logging.warning("日内采集失败，本次跳过 run_id=%s", run_id)
+                return None
+
+            # 常驻采集进程也要跟上节假日配置的修改，否则新区间的汇总漏记日内写入
+            self.sync_holiday_rollups()
+            today_str = self.now_func().strftime("%Y-%m-%d")
+            self.service.save_daily_flow(
+                flow_data, date_str=today_str, fetched_at=self.service.collected_at
+            )
+            return flow_data
+        finally:
+            METRICS.observe("collect_intraday", time.perf_counter() - started)
+            self.record_metrics(run_id)
 
     def get_daily_flow(self):
         return self.run_once()
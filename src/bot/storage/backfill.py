@@ -0,0 +1,75 @@
+import csv
+import functools
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+
+# 表格与厂商导出的列名不统一，按顺序取第一个存在的列
+FIELD_ALIASES = {
+    "stat_date": ("stat_date", "date", "日期"),
+    "area_code": ("area_code", "orgLocation", "馆区代码"),
+    "area_name": ("area_name", "orgLocationName", "name", "馆区"),
+    "in_count": ("in_count", "daily_in", "personCount", "进馆人次"),
+    "fetched_at": ("fetched_at",),
+}
+
+
+def _pick(record, field):
+    for key in FIELD_ALIASES[field]:
+        value = record.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_date(value):
+    """同一日期会在每个馆区重复出现，缓存解析结果"""
+    for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%Y%m%d"):
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ValueError(f"无法识别的日期: {value}")
+
+
+def _normalize_date(value):
+    return _parse_date(str(value).strip())
+
+
+def _iter_raw(path, fmt):
+    with open(path, encoding="utf-8-sig", newline="") as handle:
+        if fmt == "csv":
+            yield from csv.DictReader(handle)
+            return
+        # JSONL 只产出原始行，在 read_records 中逐行解析，单行损坏不会中断导入
+        for line in handle:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def read_records(path, fmt=None, stats=None):
+    """逐行读取 CSV/JSONL，产出 (stat_date, area_code, area_name, in_count, fetched_at)；无效行记录告警后跳过"""
+    path = Path(path)
+    fmt = fmt or ("csv" if path.suffix.lower() == ".csv" else "jsonl")
+    stats = stats if stats is not None else {}
+    stats.setdefault("invalid", 0)
+
+    for line_no, record in enumerate(_iter_raw(path, fmt), start=1):
+        try:
+            if isinstance(record, str):
+                record = json.loads(record)
+            stat_date = _normalize_date(_pick(record, "stat_date"))
+            area_code = str(_pick(record, "area_code") or "").strip()
+            if not area_code:
+                raise ValueError("缺少馆区代码")
+            area_name = str(_pick(record, "area_name") or area_code).strip()
+            in_count = int(float(_pick(record, "in_count") or 0))
+            fetched_at = _pick(record, "fetched_at") or f"{stat_date} 23:59:59"
+        except (TypeError, ValueError, AttributeError) as exc:
+            stats["invalid"] += 1
+            logging.warning("跳过无效记录 %s:%s %s", path.name, line_no, exc)
+            continue
+        yield stat_date, area_code, area_name, in_count, fetched_at
@@ -0,0 +1,98 @@
+import copy
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """数据库读方法的进程内 LRU + TTL 缓存，按日期区间失效"""
+
+    def __init__(self, max_entries=256, ttl=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            value, expires_at, _, _, _ = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                self.misses += 1
+                self.evictions += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def put(self, key, value, tag, start_date, end_date):
+        with self._lock:
+            self._entries[key] = (value, self.clock() + self.ttl, tag, start_date, end_date)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, start_date, end_date, tags=None):
+        """删除日期区间与 [start_date, end_date] 重叠的缓存项，tags 为空表示不限方法"""
+        with self._lock:
+            stale = [
+                key
+                for key, (_, _, tag, entry_start, entry_end) in self._entries.items()
+                if (tags is None or tag in tags)
+                and entry_start <= end_date
+                and start_date <= entry_end
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+            }
+
+
+def cached_query(start_index, end_index):
+    """缓存 Database 读方法：以方法名和参数为键，start_index/end_index 指明日期区间参数位置"""
+
+    def decorator(method):
+        tag = method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            cache = getattr(self, "cache", None)
+            if cache is None or kwargs:
+                return method(self, *args, **kwargs)
+
+            key = (tag,) + args
+            hit, value = cache.get(key)
+            if not hit:
+                value = method(self, *args)
+                cache.put(key, value, tag, args[start_index], args[end_index])
+            return copy.deepcopy(value) if isinstance(value, dict) else value
+
+        return wrapper
+
+    return decorator
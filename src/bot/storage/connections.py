@@ -0,0 +1,102 @@
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from src.bot.storage.database import DB_PATH, Database
+from src.bot.storage.writer import DatabaseWriter
+
+
+def default_readers():
+    return min(os.cpu_count() or 1, 8)
+
+
+class ConnectionManager:
+    """进程内的数据库连接：写入经由唯一的写线程排队执行，读取从只读连接池借出
+
+    WAL 下只读连接与写线程互不阻塞，读取可随连接数扩展到多核；同一线程嵌套借用时复用已借出的连接。
+    """
+
+    def __init__(self, path=None, readers=None, now_func=None, cache_size=256):
+        self.path = DB_PATH if path is None else path
+        self.readers = readers or default_readers()
+        self.now_func = now_func
+        self.cache_size = cache_size
+        self._writer = None
+        self._pool = queue.Queue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def in_memory(self):
+        return str(self.path) == ":memory:"
+
+    @property
+    def writer(self):
+        """首次使用时启动写线程并完成迁移，只读的进程（如查询接口）不会打开读写连接"""
+        with self._lock:
+            if self._writer is None:
+                self._writer = DatabaseWriter(
+                    lambda: Database(
+                        path=self.path, cache_size=self.cache_size, now_func=self.now_func
+                    )
+                )
+            return self._writer
+
+    def db(self):
+        """写连接的代理：可在任意线程使用，调用在写线程内执行；关闭代理不会停止写线程"""
+        return self.writer.proxy(owner=False)
+
+    def _checkout(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.readers:
+                self._opened += 1
+                opened = True
+            else:
+                opened = False
+        if not opened:
+            return self._pool.get()
+        try:
+            # 只读连接无法失效查询缓存，读到的始终是最新提交
+            return Database(path=self.path, cache_size=0, readonly=True)
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    @contextmanager
+    def reader(self):
+        # 内存库无法被其他连接打开，读取也走写线程
+        if self.in_memory:
+            yield self.db()
+            return
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            yield db
+            return
+        db = self._checkout()
+        self._local.db = db
+        try:
+            yield db
+        finally:
+            self._local.db = None
+            self._pool.put(db)
+
+    def close(self, timeout=5):
+        closed = 0
+        while closed < self._opened:
+            try:
+                self._pool.get(timeout=timeout).close()
+            except queue.Empty:
+                logging.warning("仍有 %s 个只读连接未归还", self._opened - closed)
+                break
+            closed += 1
+        self._opened -= closed
+        if self._writer is not None:
+            self._writer.close()
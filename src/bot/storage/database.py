@@ -1,290 +1,630 @@
 import logging
 import sqlite3
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 
+from src.bot.metrics import METRICS
+from src.bot.storage import migrations
+from src.bot.storage.cache import QueryCache, cached_query
+from src.bot.storage.rollups import (
+    PERIOD_HOLIDAY,
+    calendar_periods,
+    cover_range,
+    holiday_key,
+    holiday_periods,
+)
+from src.bot.utils import chunked
+
 DB_PATH = Path("data/bot.db")
+LAST_COUNTS_MAX_DATES = 7
+SUMMARY_AREA_CODE = "ALL"
+FLOW_QUERY_TAGS = {"get_flow_between", "get_range_totals", "get_total_between"}
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE = 256 * 1024 * 1024
+PAGE_CACHE_KIB = 32 * 1024
+
+
+def connect(path, readonly=False, **kwargs):
+    """打开连接并设置 busy_timeout、mmap 与页缓存；只读连接以 mode=ro 打开，不改日志模式"""
+    if readonly:
+        # 路径中的 ?、#、% 需转义，否则会被当作 URI 的一部分
+        conn = sqlite3.connect(Path(path).resolve().as_uri() + "?mode=ro", uri=True, **kwargs)
+    else:
+        if str(path) != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, **kwargs)
+    # 写锁被占用时等待而不是立即报 database is locked
+    # 以下设置只对本连接有效，不写入数据库文件，每个连接都要设置
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{PAGE_CACHE_KIB}")
+    if not readonly:
+        # WAL 下报表读取不会阻塞日内采集写入；日志模式持久保存在文件中，已是 WAL 时不再切换
+        if conn.execute("PRAGMA journal_mode").fetchone()[0].lower() != "wal":
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
 
 
 class Database:
-    def __init__(self):
-        DB_PATH.parent.mkdir(exist_ok=True)
-        self.conn = sqlite3.connect(DB_PATH)
+    def __init__(
+        self,
+        auto_migrate=True,
+        cache_size=256,
+        cache_ttl=300,
+        path=None,
+        now_func=None,
+        readonly=False,
+    ):
+        self.path = DB_PATH if path is None else path
+        self.readonly = readonly
+        # 写入的时间戳都取自 now_func，回放时由回放时钟驱动
+        self.now_func = now_func or datetime.now
+        self.cache = QueryCache(max_entries=cache_size, ttl=cache_ttl) if cache_size else None
+        # 只读连接不建表，由连接池在线程间轮流使用
+        self.conn = connect(self.path, readonly, check_same_thread=not readonly)
         self.conn.row_factory = sqlite3.Row
-        self.create_tables()
+        self.schema_version = migrations.current_version(self.conn)
+        if auto_migrate and not readonly:
+            self.create_tables()
+        # 各统计日的最新计数在首次写入该日时才从库中载入
+        self._last_counts = OrderedDict()
 
     def create_tables(self):
-        cursor = self.conn.cursor()
+        if self.schema_version >= migrations.LATEST_VERSION:
+            return []
+        applied = migrations.apply_migrations(self.conn, self.schema_version)
+        self.schema_version = migrations.current_version(self.conn)
+        return applied
 
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                message_id TEXT UNIQUE,
-                content TEXT,
-                created_at TEXT
+    def pending_migrations(self):
+        return migrations.pending_migrations(self.conn, self.schema_version)
+
+    def insert_message(self, message_id, content, created_at):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(
+                """
+                INSERT INTO messages (message_id, content, created_at)
+                VALUES (?, ?, ?)
+                """,
+                (message_id, content, created_at),
             )
-            """
-        )
+            self.conn.commit()
+        except sqlite3.IntegrityError:
+            pass
+
+    def _load_last_counts(self, date_str):
+        counts = self._last_counts.get(date_str)
+        if counts is not None:
+            self._last_counts.move_to_end(date_str)
+            return counts
 
+        cursor = self.conn.cursor()
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS traffic_raw_snapshots (
-                stat_date TEXT NOT NULL,
-                area_code TEXT NOT NULL,
-                area_name TEXT NOT NULL,
-                in_count INTEGER NOT NULL,
-                out_count INTEGER NOT NULL,
-                fetched_at TEXT NOT NULL,
-                PRIMARY KEY (stat_date, area_code, fetched_at)
-            )
-            """
+            SELECT area_code, area_name, in_count, fetched_at
+            FROM traffic_daily_by_location
+            WHERE stat_date = ?
+            """,
+            (date_str,),
         )
+        counts = {
+            row["area_code"]: (row["area_name"], int(row["in_count"]), row["fetched_at"])
+            for row in cursor.fetchall()
+        }
+        self._last_counts[date_str] = counts
+        while len(self._last_counts) > LAST_COUNTS_MAX_DATES:
+            self._last_counts.popitem(last=False)
+        return counts
 
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS traffic_daily_by_location (
-                stat_date TEXT NOT NULL,
-                area_code TEXT NOT NULL,
-                area_name TEXT NOT NULL,
-                in_count INTEGER NOT NULL,
-                out_count INTEGER NOT NULL,
-                fetched_at TEXT NOT NULL,
-                PRIMARY KEY (stat_date, area_code)
+    def _stored_counts(self, cursor, date_str, area_codes):
+        """当前库中某日各馆区的 (area_name, in_count, fetched_at)"""
+        counts = {}
+        for chunk in chunked(area_codes, 500):
+            cursor.execute(
+                f"""
+                SELECT area_code, area_name, in_count, fetched_at
+                FROM traffic_daily_by_location
+                WHERE stat_date = ? AND area_code IN ({",".join("?" for _ in chunk)})
+                """,
+                [date_str] + list(chunk),
             )
-            """
+            for row in cursor.fetchall():
+                counts[row["area_code"]] = (row["area_name"], int(row["in_count"]), row["fetched_at"])
+        return counts
+
+    @METRICS.timed("insert_daily_flow")
+    def insert_daily_flow(self, date_str, flow_summary, fetched_at=None):
+        cursor = self.conn.cursor()
+        fetched_at = fetched_at or self.now_func().strftime("%Y-%m-%d %H:%M:%S")
+        last_counts = self._load_last_counts(date_str)
+
+        rows = []
+        applied = []
+        skipped = 0
+        total_in = 0
+        for org_location, info in flow_summary.items():
+            area_code = (org_location or "").strip() or "UNKNOWN"
+            area_name = (info.get("name") or area_code).strip()
+            in_count = int(info.get("daily_in", 0))
+            total_in += in_count
+
+            previous = last_counts.get(area_code)
+            if previous is not None and previous[:2] == (area_name, in_count):
+                skipped += 1
+                continue
+            rows.append((date_str, area_code, area_name, in_count, 0, fetched_at))
+
+        if rows:
+            rollup_deltas = []
+            # 快照只追加变化的馆区；按馆区日表取每个馆区最新一次快照，日汇总与周期汇总随之增量更新
+            try:
+                # 差值与节假日区间都以事务内读到的为准，其他进程（日内采集、补录、重放、登记节假日）
+                # 同时写入时汇总也不会漂移
+                if not self.conn.in_transaction:
+                    cursor.execute("BEGIN IMMEDIATE")
+                periods = self._rollup_periods(cursor, date_str)
+                stored = self._stored_counts(cursor, date_str, [row[1] for row in rows])
+                for row in rows:
+                    _, area_code, area_name, in_count, _, row_fetched_at = row
+                    previous = stored.get(area_code)
+                    if previous is not None and row_fetched_at < previous[2]:
+                        continue
+                    applied.append(row)
+                    delta = in_count - (previous[1] if previous is not None else 0)
+                    for period in periods:
+                        rollup_deltas.append(period + (area_code, area_name, delta))
+
+                cursor.executemany(
+                    """
+                    INSERT OR REPLACE INTO traffic_raw_snapshots
+                        (stat_date, area_code, area_name, in_count, out_count, fetched_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    rows,
+                )
+                if applied:
+                    cursor.executemany(
+                        """
+                        INSERT OR REPLACE INTO traffic_daily_by_location
+                            (stat_date, area_code, area_name, in_count, out_count, fetched_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        """,
+                        applied,
+                    )
+                    self._apply_rollup_deltas(cursor, rollup_deltas)
+                    for _, area_code, area_name, in_count, _, _ in applied:
+                        self._apply_prefix_value(cursor, area_code, date_str, in_count)
+                    cursor.executemany(
+                        """
+                        INSERT OR REPLACE INTO traffic_areas (area_code, area_name)
+                        VALUES (?, ?)
+                        """,
+                        [(row[1], row[2]) for row in applied],
+                    )
+                    self._refresh_daily_summary(cursor, date_str)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+            # 内存计数同步为库中的值，其他进程写入的也一并带上
+            last_counts.update(stored)
+            for _, area_code, area_name, in_count, _, row_fetched_at in applied:
+                last_counts[area_code] = (area_name, in_count, row_fetched_at)
+            if applied:
+                self._invalidate(date_str, date_str, FLOW_QUERY_TAGS)
+
+        # 早于库中已有快照的行只追加快照，不改日表，单独计为 stale
+        stale = len(rows) - len(applied)
+        logging.info(
+            "DB write success action=insert_daily_flow date=%s locations=%s "
+            "written=%s skipped=%s stale=%s total_in=%s",
+            date_str,
+            len(rows) + skipped,
+            len(applied),
+            skipped,
+            stale,
+            total_in,
         )
+        return {"written": len(applied), "skipped": skipped, "stale": stale}
 
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS traffic_daily_summary (
-                stat_date TEXT PRIMARY KEY,
-                area_code TEXT NOT NULL,
-                area_name TEXT NOT NULL,
-                in_count INTEGER NOT NULL,
-                out_count INTEGER NOT NULL,
-                fetched_at TEXT NOT NULL
-            )
-            """
+    def _invalidate(self, start_date, end_date, tags):
+        if self.cache is not None:
+            self.cache.invalidate(start_date, end_date, tags)
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else {}
+
+    def _rollup_periods(self, cursor, date_str):
+        return calendar_periods(date_str) + holiday_periods(
+            date_str, self._registered_holidays(cursor, date_str, date_str)
         )
 
+    def _registered_holidays(self, cursor, start_date, end_date):
+        """库中登记的、与 [start_date, end_date] 重叠的节假日区间；各进程共用这一份登记"""
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS report_send_log (
-                report_type TEXT NOT NULL,
-                start_date TEXT NOT NULL,
-                end_date TEXT NOT NULL,
-                sent_at TEXT NOT NULL,
-                PRIMARY KEY (report_type, start_date, end_date)
-            )
-            """
+            SELECT start_date, end_date, name
+            FROM holiday_ranges
+            WHERE start_date <= ? AND end_date >= ?
+            ORDER BY start_date, end_date
+            """,
+            (end_date, start_date),
         )
+        return [dict(row) for row in cursor.fetchall()]
 
-        self._migrate_legacy_tables()
-        self.conn.commit()
-
-    def _table_exists(self, table_name):
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
-            (table_name,),
+    def _apply_rollup_deltas(self, cursor, rollup_deltas):
+        cursor.executemany(
+            """
+            INSERT INTO traffic_rollups
+                (period_type, period_key, start_date, end_date, area_code, area_name, in_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (period_type, period_key, area_code) DO UPDATE SET
+                area_name = excluded.area_name,
+                in_count = traffic_rollups.in_count + excluded.in_count
+            """,
+            rollup_deltas,
         )
-        return cursor.fetchone() is not None
 
-    def _table_columns(self, table_name):
-        cursor = self.conn.cursor()
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        return {row[1] for row in cursor.fetchall()}
+    def bulk_load_daily_flow(self, records, chunk_size=5000):
+        """批量导入历史数据：每块一次事务 executemany，导入期间 synchronous=OFF，结束后统一重建派生表
 
-    def _rename_legacy_table(self, table_name):
-        legacy_name = f"{table_name}_legacy"
-        if not self._table_exists(table_name):
-            return
-        if self._table_exists(legacy_name):
-            return
+        records 为 (stat_date, area_code, area_name, in_count, fetched_at) 的可迭代对象，同一馆区同一天以后出现的为准。
+        """
         cursor = self.conn.cursor()
-        cursor.execute(f"ALTER TABLE {table_name} RENAME TO {legacy_name}")
-
-    def _migrate_legacy_tables(self):
-        cursor = self.conn.cursor()
-
-        if self._table_exists("traffic_daily_entries"):
-            cols = self._table_columns("traffic_daily_entries")
-            if {"stat_date", "area", "in_count", "fetched_at"}.issubset(cols):
-                cursor.execute(
+        loaded = 0
+        started = datetime.now()
+        self.conn.execute("PRAGMA synchronous=OFF")
+        try:
+            for chunk in chunked(records, chunk_size):
+                rows = [
+                    (stat_date, area_code, area_name, in_count, 0, fetched_at)
+                    for stat_date, area_code, area_name, in_count, fetched_at in chunk
+                ]
+                cursor.executemany(
                     """
-                    INSERT OR IGNORE INTO traffic_raw_snapshots
+                    INSERT OR REPLACE INTO traffic_raw_snapshots
                         (stat_date, area_code, area_name, in_count, out_count, fetched_at)
-                    SELECT stat_date, area, area, COALESCE(in_count, 0), 0, fetched_at
-                    FROM traffic_daily_entries
-                    """
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    rows,
                 )
-                cursor.execute(
+                cursor.executemany(
                     """
                     INSERT OR REPLACE INTO traffic_daily_by_location
                         (stat_date, area_code, area_name, in_count, out_count, fetched_at)
-                    SELECT stat_date, area, area, COALESCE(in_count, 0), 0, fetched_at
-                    FROM traffic_daily_entries
-                    """
-                )
-            self._rename_legacy_table("traffic_daily_entries")
-
-        if self._table_exists("traffic_daily_locations"):
-            cols = self._table_columns("traffic_daily_locations")
-            required = {
-                "date",
-                "org_location",
-                "org_name",
-                "daily_in",
-                "daily_out",
-                "created_at",
-            }
-            if required.issubset(cols):
-                cursor.execute(
-                    """
-                    INSERT OR IGNORE INTO traffic_raw_snapshots
-                        (stat_date, area_code, area_name, in_count, out_count, fetched_at)
-                    SELECT
-                        date,
-                        org_location,
-                        COALESCE(org_name, org_location),
-                        COALESCE(daily_in, 0),
-                        0,
-                        COALESCE(created_at, datetime('now'))
-                    FROM traffic_daily_locations
-                    """
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    rows,
                 )
-                cursor.execute(
+                self.conn.commit()
+                loaded += len(rows)
+                logging.info("批量导入进度 rows=%s", loaded)
+        except Exception:
+            self.conn.rollback()
+            # 中途失败时已提交的块仍留在日表中，派生表同样要重建；重建失败只记日志，抛出原始异常
+            try:
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+                self.rebuild_derived_tables()
+            except Exception as exc:
+                logging.exception("批量导入失败后重建派生表失败: %s", exc)
+            raise
+
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.rebuild_derived_tables()
+
+        logging.info(
+            "批量导入完成 rows=%s 耗时=%.2fs",
+            loaded,
+            (datetime.now() - started).total_seconds(),
+        )
+        return loaded
+
+    def overwrite_daily_flow(self, date_str, flow_summary, fetched_at):
+        """以给定数据覆盖按馆区日表，不追加快照、不更新派生表；供归档重放使用，结束后需调用 rebuild_derived_tables
+
+        返回 {"written": 实际改变的行数, "skipped": 与库中相同的行数}。
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT area_code, area_name, in_count FROM traffic_daily_by_location WHERE stat_date = ?",
+            (date_str,),
+        )
+        stored = {row["area_code"]: (row["area_name"], row["in_count"]) for row in cursor.fetchall()}
+
+        rows = []
+        for org_location, info in flow_summary.items():
+            area_code = (org_location or "").strip() or "UNKNOWN"
+            area_name = (info.get("name") or area_code).strip()
+            in_count = int(info.get("daily_in", 0))
+            if stored.get(area_code) == (area_name, in_count):
+                continue
+            rows.append((date_str, area_code, area_name, in_count, 0, fetched_at))
+
+        if rows:
+            try:
+                cursor.executemany(
                     """
                     INSERT OR REPLACE INTO traffic_daily_by_location
                         (stat_date, area_code, area_name, in_count, out_count, fetched_at)
-                    SELECT
-                        date,
-                        org_location,
-                        COALESCE(org_name, org_location),
-                        COALESCE(daily_in, 0),
-                        0,
-                        COALESCE(created_at, datetime('now'))
-                    FROM traffic_daily_locations
-                    """
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    rows,
                 )
-            self._rename_legacy_table("traffic_daily_locations")
+                self._bump_data_version(cursor)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return {"written": len(rows), "skipped": len(flow_summary) - len(rows)}
+
+    def _bump_data_version(self, cursor):
+        """覆盖或重建历史数据时不追加快照，查询接口靠这个计数得知数据已变化"""
+        cursor.execute("UPDATE data_meta SET value = value + 1 WHERE key = 'data_version'")
 
-        if self._table_exists("traffic_daily_totals"):
-            cols = self._table_columns("traffic_daily_totals")
-            required = {"date", "total_in", "total_out", "created_at"}
-            if required.issubset(cols):
+    def rebuild_derived_tables(self):
+        """全量重建日汇总、周期汇总、累计和与馆区表，并清空内存缓存"""
+        migrations.rebuild_derived_tables(self.conn)
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM traffic_rollups WHERE period_type = ?", (PERIOD_HOLIDAY,))
+        cursor.execute("SELECT start_date, end_date, name FROM holiday_ranges")
+        for holiday in [dict(row) for row in cursor.fetchall()]:
+            self._build_holiday_rollup(cursor, holiday)
+        self._bump_data_version(cursor)
+        self.conn.commit()
+        if self.cache is not None:
+            self.cache.clear()
+        self._last_counts.clear()
+
+    def set_holiday_ranges(self, holiday_ranges):
+        """登记节假日区间：写入 holiday_ranges 表，新增的区间从按馆区日表补建汇总，已移除的区间删除汇总
+
+        登记与补建在同一个写事务内完成，其他进程的写入在事务内读取登记表，不会漏记新区间。
+        """
+        wanted = {holiday_key(x): x for x in holiday_ranges}
+
+        cursor = self.conn.cursor()
+        try:
+            if not self.conn.in_transaction:
+                cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT period_key FROM holiday_ranges")
+            existing = {row["period_key"] for row in cursor.fetchall()}
+            stale = existing - set(wanted)
+            missing = [wanted[key] for key in wanted if key not in existing]
+
+            cursor.executemany(
+                "DELETE FROM holiday_ranges WHERE period_key = ?",
+                [(key,) for key in stale],
+            )
+            cursor.executemany(
+                "DELETE FROM traffic_rollups WHERE period_type = ? AND period_key = ?",
+                [(PERIOD_HOLIDAY, key) for key in stale],
+            )
+            for holiday in missing:
                 cursor.execute(
                     """
-                    INSERT OR REPLACE INTO traffic_daily_summary
-                        (stat_date, area_code, area_name, in_count, out_count, fetched_at)
-                    SELECT
-                        date,
-                        'ALL',
-                        '??',
-                        COALESCE(total_in, 0),
-                        0,
-                        COALESCE(created_at, datetime('now'))
-                    FROM traffic_daily_totals
-                    """
+                    INSERT INTO holiday_ranges (period_key, start_date, end_date, name)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    (
+                        holiday_key(holiday),
+                        holiday["start_date"],
+                        holiday["end_date"],
+                        holiday.get("name", ""),
+                    ),
                 )
-            self._rename_legacy_table("traffic_daily_totals")
+                self._build_holiday_rollup(cursor, holiday)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        if stale or missing:
+            logging.info("节假日汇总已同步 新增=%s 删除=%s", len(missing), len(stale))
 
+    def _build_holiday_rollup(self, cursor, holiday):
         cursor.execute(
             """
-            INSERT INTO traffic_daily_summary
-                (stat_date, area_code, area_name, in_count, out_count, fetched_at)
-            SELECT
-                l.stat_date,
-                'ALL',
-                '??',
-                COALESCE(SUM(l.in_count), 0),
-                0,
-                COALESCE(MAX(l.fetched_at), datetime('now'))
-            FROM traffic_daily_by_location l
-            LEFT JOIN traffic_daily_summary s
-                ON s.stat_date = l.stat_date
-            WHERE s.stat_date IS NULL
-            GROUP BY l.stat_date
+            INSERT OR REPLACE INTO traffic_rollups
+                (period_type, period_key, start_date, end_date,
+                 area_code, area_name, in_count)
+            SELECT ?, ?, ?, ?, area_code, MAX(area_name), SUM(in_count)
+            FROM traffic_daily_by_location
+            WHERE stat_date >= ? AND stat_date <= ?
+            GROUP BY area_code
+            """,
+            (
+                PERIOD_HOLIDAY,
+                holiday_key(holiday),
+                holiday["start_date"],
+                holiday["end_date"],
+                holiday["start_date"],
+                holiday["end_date"],
+            ),
+        )
+
+    def _refresh_daily_summary(self, cursor, date_str):
+        cursor.execute(
             """
+            INSERT OR REPLACE INTO traffic_daily_summary
+                (stat_date, area_code, area_name, in_count, out_count, fetched_at)
+            SELECT stat_date, 'ALL', '??', COALESCE(SUM(in_count), 0), 0, MAX(fetched_at)
+            FROM traffic_daily_by_location
+            WHERE stat_date = ?
+            GROUP BY stat_date
+            """,
+            (date_str,),
+        )
+        cursor.execute(
+            "SELECT in_count FROM traffic_daily_summary WHERE stat_date = ?",
+            (date_str,),
         )
+        row = cursor.fetchone()
+        if row:
+            self._apply_prefix_value(cursor, SUMMARY_AREA_CODE, date_str, int(row["in_count"]))
 
-    def insert_message(self, message_id, content, created_at):
-        cursor = self.conn.cursor()
-        try:
+    def _apply_prefix_value(self, cursor, area_code, date_str, in_count):
+        """写入某馆区某日的值：把差值加到该日及之后的累计和上，回溯修正只改写一次后缀"""
+        cursor.execute(
+            "SELECT in_count FROM traffic_prefix_sums WHERE area_code = ? AND stat_date = ?",
+            (area_code, date_str),
+        )
+        row = cursor.fetchone()
+        if row is None:
             cursor.execute(
                 """
-                INSERT INTO messages (message_id, content, created_at)
-                VALUES (?, ?, ?)
+                INSERT INTO traffic_prefix_sums (area_code, stat_date, in_count, cum_in)
+                VALUES (?, ?, 0, COALESCE((
+                    SELECT cum_in FROM traffic_prefix_sums
+                    WHERE area_code = ? AND stat_date < ?
+                    ORDER BY stat_date DESC
+                    LIMIT 1
+                ), 0))
                 """,
-                (message_id, content, created_at),
+                (area_code, date_str, area_code, date_str),
             )
-            self.conn.commit()
-        except sqlite3.IntegrityError:
-            pass
-
-    def insert_daily_flow(self, date_str, flow_summary, fetched_at=None):
-        cursor = self.conn.cursor()
-        fetched_at = fetched_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            previous = 0
+        else:
+            previous = int(row["in_count"])
 
-        total_in = 0
-        location_rows = 0
+        delta = in_count - previous
+        if delta == 0 and row is not None:
+            return
+        cursor.execute(
+            """
+            UPDATE traffic_prefix_sums
+            SET cum_in = cum_in + ?,
+                in_count = CASE WHEN stat_date = ? THEN ? ELSE in_count END
+            WHERE area_code = ? AND stat_date >= ?
+            """,
+            (delta, date_str, in_count, area_code, date_str),
+        )
 
-        for org_location, info in flow_summary.items():
-            area_code = (org_location or "").strip() or "UNKNOWN"
-            area_name = (info.get("name") or area_code).strip()
-            in_count = int(info.get("daily_in", 0))
-            out_count = 0
+    def get_daily_series(self, start_date, end_date):
+        """按日期顺序返回区间内每天每个馆区的进馆人次 (stat_date, area_code, area_name, in_count)"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT stat_date, area_code, area_name, in_count
+            FROM traffic_daily_by_location
+            WHERE stat_date >= ? AND stat_date <= ?
+            ORDER BY stat_date, area_code
+            """,
+            (start_date, end_date),
+        )
+        return [tuple(row) for row in cursor.fetchall()]
 
-            total_in += in_count
+    def get_latest_flow(self):
+        """最近一个统计日各馆区的最新数据：(stat_date, [(area_code, area_name, in_count, fetched_at)])"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT stat_date, area_code, area_name, in_count, fetched_at
+            FROM traffic_daily_by_location
+            WHERE stat_date = (SELECT MAX(stat_date) FROM traffic_daily_by_location)
+            ORDER BY area_code
+            """
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return None, []
+        return rows[0]["stat_date"], [tuple(row)[1:] for row in rows]
 
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO traffic_raw_snapshots
-                    (stat_date, area_code, area_name, in_count, out_count, fetched_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (date_str, area_code, area_name, in_count, out_count, fetched_at),
-            )
+    def get_ingest_marker(self):
+        """最近一次写入的快照与发送记录，以及覆盖/重建历史数据的版本计数：rowid 单调增长，取最大值不需要扫表"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT
+                (SELECT MAX(rowid) FROM traffic_raw_snapshots) AS snapshot_id,
+                (SELECT fetched_at FROM traffic_raw_snapshots ORDER BY rowid DESC LIMIT 1)
+                    AS last_ingest,
+                (SELECT MAX(rowid) FROM report_send_log) AS report_id,
+                (SELECT value FROM data_meta WHERE key = 'data_version') AS data_version
+            """
+        )
+        return dict(cursor.fetchone())
 
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO traffic_daily_by_location
-                    (stat_date, area_code, area_name, in_count, out_count, fetched_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (date_str, area_code, area_name, in_count, out_count, fetched_at),
-            )
-            location_rows += 1
+    def get_intraday_series(self, date_str, area_code=None):
+        cursor = self.conn.cursor()
+        sql = """
+            SELECT area_code, area_name, in_count, fetched_at
+            FROM traffic_raw_snapshots
+            WHERE stat_date = ?
+        """
+        params = [date_str]
+        if area_code:
+            sql += " AND area_code = ?"
+            params.append(area_code)
+        cursor.execute(sql + " ORDER BY area_code, fetched_at", params)
+        return [dict(row) for row in cursor.fetchall()]
 
+    def get_hourly_flow(self, date_str):
+        """按小时统计进馆增量：快照为当日累计值，取每小时最后读数相减"""
+        cursor = self.conn.cursor()
         cursor.execute(
             """
-            INSERT OR REPLACE INTO traffic_daily_summary
-                (stat_date, area_code, area_name, in_count, out_count, fetched_at)
-            VALUES (?, 'ALL', '??', ?, 0, ?)
+            SELECT
+                area_code,
+                MAX(area_name) AS area_name,
+                CAST(substr(fetched_at, 12, 2) AS INTEGER) AS hour,
+                MAX(in_count) AS in_count
+            FROM traffic_raw_snapshots
+            WHERE stat_date = ?
+            GROUP BY area_code, hour
+            ORDER BY area_code, hour
             """,
-            (date_str, total_in, fetched_at),
+            (date_str,),
         )
 
-        self.conn.commit()
-        logging.info(
-            "DB write success action=insert_daily_flow date=%s locations=%s total_in=%s",
-            date_str,
-            location_rows,
-            total_in,
-        )
+        hourly = {}
+        previous = {}
+        for row in cursor.fetchall():
+            area_code = row["area_code"]
+            entry = hourly.setdefault(
+                area_code, {"name": row["area_name"], "hours": {}, "peak_hour": None}
+            )
+            delta = max(0, int(row["in_count"]) - previous.get(area_code, 0))
+            previous[area_code] = int(row["in_count"])
+            entry["hours"][row["hour"]] = delta
+            if entry["peak_hour"] is None or delta > entry["hours"][entry["peak_hour"]]:
+                entry["peak_hour"] = row["hour"]
+        return hourly
 
+    @METRICS.timed("get_flow_between")
+    @cached_query(0, 1)
     def get_flow_between(self, start_date, end_date):
         cursor = self.conn.cursor()
+        holidays = self._registered_holidays(cursor, start_date, end_date)
+        periods, day_spans = cover_range(start_date, end_date, holidays)
+        parts = []
+        params = []
+        for period_type, period_key in periods:
+            parts.append(
+                "SELECT area_code, area_name, in_count FROM traffic_rollups "
+                "WHERE period_type = ? AND period_key = ?"
+            )
+            params.extend([period_type, period_key])
+        for span_start, span_end in day_spans:
+            parts.append(
+                "SELECT area_code, area_name, in_count FROM traffic_daily_by_location "
+                "WHERE stat_date >= ? AND stat_date <= ?"
+            )
+            params.extend([span_start, span_end])
+        if not parts:
+            return {}
+
         cursor.execute(
-            """
+            f"""
             SELECT
                 area_code,
-                area_name,
+                MAX(area_name) AS area_name,
                 COALESCE(SUM(in_count), 0) AS in_total
-            FROM traffic_daily_by_location
-            WHERE stat_date >= ? AND stat_date <= ?
-            GROUP BY area_code, area_name
+            FROM ({" UNION ALL ".join(parts)})
+            GROUP BY area_code
             ORDER BY
                 CASE area_code
                     WHEN 'CN-ZJLIB_ZJ' THEN 1
@@ -293,7 +633,7 @@ class Database:
                     ELSE 4
                 END
             """,
-            (start_date, end_date),
+            params,
         )
         rows = cursor.fetchall()
 
@@ -306,13 +646,15 @@ class Database:
             }
 
         logging.info(
-            "DB query success action=get_flow_between range=%s~%s locations=%s",
+            "DB query success action=get_flow_between range=%s~%s locations=%s rollups=%s",
             start_date,
             end_date,
             len(flow_summary),
+            len(periods),
         )
         return flow_summary
 
+    @cached_query(1, 2)
     def has_report_sent(self, report_type, start_date, end_date):
         cursor = self.conn.cursor()
         cursor.execute(
@@ -334,9 +676,19 @@ class Database:
         )
         return exists
 
+    def get_report_history(self, limit=50, report_type=None):
+        cursor = self.conn.cursor()
+        sql = "SELECT report_type, start_date, end_date, sent_at FROM report_send_log"
+        params = []
+        if report_type:
+            sql += " WHERE report_type = ?"
+            params.append(report_type)
+        cursor.execute(f"{sql} ORDER BY sent_at DESC LIMIT ?", params + [int(limit)])
+        return [dict(row) for row in cursor.fetchall()]
+
     def mark_report_sent(self, report_type, start_date, end_date, sent_at=None):
         cursor = self.conn.cursor()
-        sent_at = sent_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        sent_at = sent_at or self.now_func().strftime("%Y-%m-%d %H:%M:%S")
         cursor.execute(
             """
             INSERT OR REPLACE INTO report_send_log
@@ -346,6 +698,7 @@ class Database:
             (report_type, start_date, end_date, sent_at),
         )
         self.conn.commit()
+        self._invalidate(start_date, end_date, {"has_report_sent"})
         logging.info(
             "DB write success action=mark_report_sent type=%s range=%s~%s",
             report_type,
@@ -355,7 +708,7 @@ class Database:
 
     def insert_daily_traffic(self, date_str, total_in):
         cursor = self.conn.cursor()
-        fetched_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        fetched_at = self.now_func().strftime("%Y-%m-%d %H:%M:%S")
         cursor.execute(
             """
             INSERT OR REPLACE INTO traffic_daily_summary
@@ -364,21 +717,318 @@ class Database:
             """,
             (date_str, int(total_in), fetched_at),
         )
+        self._apply_prefix_value(cursor, SUMMARY_AREA_CODE, date_str, int(total_in))
         self.conn.commit()
+        self._invalidate(date_str, date_str, {"get_total_between"})
 
+    def _prefix_range_sql(self):
+        return """
+            COALESCE((
+                SELECT cum_in FROM traffic_prefix_sums
+                WHERE area_code = a.area_code AND stat_date <= :end_date
+                ORDER BY stat_date DESC
+                LIMIT 1
+            ), 0) - COALESCE((
+                SELECT cum_in FROM traffic_prefix_sums
+                WHERE area_code = a.area_code AND stat_date < :start_date
+                ORDER BY stat_date DESC
+                LIMIT 1
+            ), 0)
+        """
+
+    @cached_query(0, 1)
     def get_total_between(self, start_date, end_date):
         cursor = self.conn.cursor()
         cursor.execute(
-            """
-            SELECT COALESCE(SUM(in_count), 0) AS total_in
-            FROM traffic_daily_summary
-            WHERE stat_date >= ? AND stat_date <= ?
+            f"""
+            SELECT {self._prefix_range_sql()} AS total_in
+            FROM (SELECT :area_code AS area_code) a
             """,
-            (start_date, end_date),
+            {"area_code": SUMMARY_AREA_CODE, "start_date": start_date, "end_date": end_date},
         )
         row = cursor.fetchone()
         return row["total_in"] if row else 0
 
+    @cached_query(0, 1)
+    def get_range_totals(self, start_date, end_date):
+        """基于累计和索引的区间汇总：每个馆区两次索引查找，结构与 get_flow_between 相同"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT
+                a.area_code,
+                a.area_name,
+                {self._prefix_range_sql()} AS in_total
+            FROM traffic_areas a
+            WHERE EXISTS (
+                SELECT 1 FROM traffic_prefix_sums
+                WHERE area_code = a.area_code
+                    AND stat_date >= :start_date AND stat_date <= :end_date
+            )
+            ORDER BY
+                CASE a.area_code
+                    WHEN 'CN-ZJLIB_ZJ' THEN 1
+                    WHEN 'CN-ZJLIB_BSGL' THEN 2
+                    WHEN 'CN-ZJLIB_BSL' THEN 3
+                    ELSE 4
+                END
+            """,
+            {"start_date": start_date, "end_date": end_date},
+        )
+        flow_summary = {}
+        for row in cursor.fetchall():
+            flow_summary[row["area_code"]] = {
+                "name": row["area_name"],
+                "daily_in": int(row["in_total"]),
+                "daily_out": 0,
+            }
+
+        logging.info(
+            "DB query success action=get_range_totals range=%s~%s locations=%s",
+            start_date,
+            end_date,
+            len(flow_summary),
+        )
+        return flow_summary
+
+    def enqueue_report(self, report_type, start_date, end_date, title, text, channel="default"):
+        return self.enqueue_reports(
+            [(channel, report_type, start_date, end_date, title, text)]
+        )[0]
+
+    def enqueue_reports(self, messages):
+        """messages 为 (channel, report_type, start_date, end_date, title, text) 列表，一次提交"""
+        cursor = self.conn.cursor()
+        now = self.now_func().strftime("%Y-%m-%d %H:%M:%S")
+        ids = []
+        for channel, report_type, start_date, end_date, title, text in messages:
+            cursor.execute(
+                """
+                INSERT INTO report_outbox
+                    (channel, report_type, start_date, end_date, title, text, status,
+                     attempts, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'pending', 0, ?, ?)
+                """,
+                (channel, report_type, start_date, end_date, title, text, now, now),
+            )
+            ids.append(cursor.lastrowid)
+        self.conn.commit()
+        logging.info(
+            "DB write success action=enqueue_reports messages=%s channels=%s",
+            len(ids),
+            len({x[0] for x in messages}),
+        )
+        return ids
+
+    def queued_outbox_channels(self, report_type, start_date, end_date):
+        """某份报告已入队待发或已送达的机器人；只有放弃发送的机器人不在其中，可重新入队"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT DISTINCT channel
+            FROM report_outbox
+            WHERE report_type = ? AND start_date = ? AND end_date = ? AND status != 'failed'
+            """,
+            (report_type, start_date, end_date),
+        )
+        return {row["channel"] for row in cursor.fetchall()}
+
+    def count_undelivered_channels(self, report_type, start_date, end_date):
+        """某份报告尚无一条送达记录的机器人数；重新入队的报告以各机器人任一条送达为准"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT COUNT(*) AS undelivered
+            FROM (
+                SELECT channel
+                FROM report_outbox
+                WHERE report_type = ? AND start_date = ? AND end_date = ?
+                GROUP BY channel
+                HAVING SUM(status = 'sent') = 0
+            )
+            """,
+            (report_type, start_date, end_date),
+        )
+        return cursor.fetchone()["undelivered"]
+
+    def fetch_due_outbox(self, now, limit):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT id, channel, report_type, start_date, end_date, title, text, attempts
+            FROM report_outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY next_attempt_at, id
+            LIMIT ?
+            """,
+            (now, limit),
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def count_outbox_pending(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) AS pending FROM report_outbox WHERE status = 'pending'")
+        return cursor.fetchone()["pending"]
+
+    def mark_outbox_sent(self, outbox_id, sent_at):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            UPDATE report_outbox
+            SET status = 'sent', attempts = attempts + 1, sent_at = ?, last_error = NULL
+            WHERE id = ?
+            """,
+            (sent_at, outbox_id),
+        )
+        self.conn.commit()
+
+    def mark_outbox_retry(self, outbox_id, attempts, next_attempt_at, error, failed=False):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            UPDATE report_outbox
+            SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?
+            WHERE id = ?
+            """,
+            ("failed" if failed else "pending", attempts, next_attempt_at, error, outbox_id),
+        )
+        self.conn.commit()
+
+    def get_job_last_run(self, job_name):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT last_run_at FROM scheduler_job_runs WHERE job_name = ?",
+            (job_name,),
+        )
+        row = cursor.fetchone()
+        return row["last_run_at"] if row else None
+
+    def set_job_last_run(self, job_name, last_run_at):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            INSERT OR REPLACE INTO scheduler_job_runs (job_name, last_run_at)
+            VALUES (?, ?)
+            """,
+            (job_name, last_run_at),
+        )
+        self.conn.commit()
+
+    def load_endpoint_health(self):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT endpoint, state, consecutive_failures, opened_at, last_success_at, samples
+            FROM endpoint_health
+            """
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def save_endpoint_health(self, rows):
+        cursor = self.conn.cursor()
+        updated_at = self.now_func().strftime("%Y-%m-%d %H:%M:%S")
+        cursor.executemany(
+            """
+            INSERT OR REPLACE INTO endpoint_health
+                (endpoint, state, consecutive_failures, opened_at, last_success_at,
+                 samples, updated_at)
+            VALUES
+                (:endpoint, :state, :consecutive_failures, :opened_at, :last_success_at,
+                 :samples, :updated_at)
+            """,
+            [dict(row, updated_at=updated_at) for row in rows],
+        )
+        self.conn.commit()
+
+    def load_anomaly_state(self):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT area_code, area_name, stat_date, last_count, last_seen, samples, mean, var,
+                   seasonal, stuck_since, stuck_expected, alerted
+            FROM anomaly_state
+            """
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def save_anomaly_state(self, rows):
+        cursor = self.conn.cursor()
+        updated_at = self.now_func().strftime("%Y-%m-%d %H:%M:%S")
+        cursor.executemany(
+            """
+            INSERT OR REPLACE INTO anomaly_state
+                (area_code, area_name, stat_date, last_count, last_seen, samples, mean, var,
+                 seasonal, stuck_since, stuck_expected, alerted, updated_at)
+            VALUES
+                (:area_code, :area_name, :stat_date, :last_count, :last_seen, :samples, :mean,
+                 :var, :seasonal, :stuck_since, :stuck_expected, :alerted, :updated_at)
+            """,
+            [dict(row, updated_at=updated_at) for row in rows],
+        )
+        self.conn.commit()
+
+    def save_run_metrics(self, run_id, rows):
+        cursor = self.conn.cursor()
+        recorded_at = self.now_func().strftime("%Y-%m-%d %H:%M:%S")
+        cursor.executemany(
+            """
+            INSERT INTO run_metrics
+                (run_id, recorded_at, stage, endpoint, count, total_seconds, max_seconds, buckets)
+            VALUES
+                (:run_id, :recorded_at, :stage, :endpoint, :count, :total_seconds,
+                 :max_seconds, :buckets)
+            """,
+            [dict(row, run_id=run_id, recorded_at=recorded_at) for row in rows],
+        )
+        self.conn.commit()
+
+    def archive_responses(self, rows):
+        """rows 为 (fetched_at, endpoint, digest, codec, body, raw_size)，body 为空表示复用已有正文"""
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany(
+                """
+                INSERT OR IGNORE INTO raw_response_bodies
+                    (digest, codec, body, raw_size, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [
+                    (digest, codec, body, raw_size, fetched_at)
+                    for fetched_at, _, digest, codec, body, raw_size in rows
+                    if body is not None
+                ],
+            )
+            cursor.executemany(
+                """
+                INSERT INTO raw_response_log (fetched_at, endpoint, digest)
+                VALUES (?, ?, ?)
+                """,
+                [(fetched_at, endpoint, digest) for fetched_at, endpoint, digest, *_ in rows],
+            )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def iter_archived_responses(self, start_date=None, end_date=None, batch_size=100):
+        """按采集时间顺序逐批读出归档，start_date/end_date 为采集日期（含）"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT l.fetched_at, l.digest, b.codec, b.body
+            FROM raw_response_log l
+            JOIN raw_response_bodies b ON b.digest = l.digest
+            WHERE l.fetched_at >= ? AND l.fetched_at < ?
+            ORDER BY l.fetched_at, l.id
+            """,
+            (start_date or "", (end_date or "9999-12-31") + " 99"),
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+
     def debug_tables(self):
         cursor = self.conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
@@ -387,4 +1037,6 @@ class Database:
             print(table["name"])
 
     def close(self):
+        if self.cache is not None:
+            logging.info("DB cache stats %s", self.cache.stats())
         self.conn.close()
@@ -0,0 +1,199 @@
+import csv
+import json
+import struct
+import sys
+import zlib
+from array import array
+
+from src.bot.storage.database import connect
+from src.bot.storage.rollups import PERIOD_MONTH, PERIOD_WEEK, PERIOD_YEAR
+
+GRANULARITIES = ("snapshot", "day", PERIOD_WEEK, PERIOD_MONTH, PERIOD_YEAR)
+FORMATS = ("csv", "jsonl", "columnar")
+
+COLUMNAR_MAGIC = b"TFCOL1\n"
+
+_DAILY_COLUMNS = [
+    ("stat_date", "str"),
+    ("area_code", "str"),
+    ("area_name", "str"),
+    ("in_count", "int"),
+    ("fetched_at", "str"),
+]
+_ROLLUP_COLUMNS = [
+    ("period_key", "str"),
+    ("start_date", "str"),
+    ("end_date", "str"),
+    ("area_code", "str"),
+    ("area_name", "str"),
+    ("in_count", "int"),
+]
+
+
+def export_columns(granularity):
+    if granularity in ("snapshot", "day"):
+        return _DAILY_COLUMNS
+    return _ROLLUP_COLUMNS
+
+
+def _export_query(granularity, start_date, end_date, area_codes):
+    params = []
+    if granularity in ("snapshot", "day"):
+        table = "traffic_raw_snapshots" if granularity == "snapshot" else "traffic_daily_by_location"
+        sql = f"""
+            SELECT stat_date, area_code, area_name, in_count, fetched_at
+            FROM {table}
+            WHERE stat_date >= ? AND stat_date <= ?
+        """
+        params.extend([start_date or "", end_date or "9999-12-31"])
+        order = "ORDER BY stat_date, area_code, fetched_at"
+    else:
+        # 周期与 [start_date, end_date] 有重叠即导出
+        sql = """
+            SELECT period_key, start_date, end_date, area_code, area_name, in_count
+            FROM traffic_rollups
+            WHERE period_type = ? AND start_date <= ? AND end_date >= ?
+        """
+        params.extend([granularity, end_date or "9999-12-31", start_date or ""])
+        order = "ORDER BY start_date, area_code"
+
+    if area_codes:
+        sql += f" AND area_code IN ({','.join('?' for _ in area_codes)})"
+        params.extend(area_codes)
+    return f"{sql} {order}", params
+
+
+def iter_history(
+    db_path,
+    granularity="day",
+    start_date=None,
+    end_date=None,
+    area_codes=None,
+    batch_size=1000,
+):
+    """在只读连接的一个读事务（WAL 快照）内按 fetchmany 分批读出历史数据，不阻塞写入"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"不支持的粒度: {granularity}")
+
+    conn = connect(db_path, readonly=True, isolation_level=None)
+    try:
+        conn.execute("BEGIN")
+        cursor = conn.execute(*_export_query(granularity, start_date, end_date, area_codes))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+        conn.execute("ROLLBACK")
+    finally:
+        conn.close()
+
+
+def write_csv(batches, columns, handle):
+    writer = csv.writer(handle)
+    writer.writerow([name for name, _ in columns])
+    count = 0
+    for rows in batches:
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def write_jsonl(batches, columns, handle):
+    names = [name for name, _ in columns]
+    count = 0
+    for rows in batches:
+        handle.writelines(
+            json.dumps(dict(zip(names, row)), ensure_ascii=False) + "\n" for row in rows
+        )
+        count += len(rows)
+    return count
+
+
+def _int_block(values):
+    data = array("q", values)
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data.tobytes()
+
+
+def _str_block(values):
+    # 字典编码：日期、馆区代码高度重复，只存一次取值再存下标
+    dictionary = {}
+    indexes = array("I", (dictionary.setdefault(x, len(dictionary)) for x in values))
+    if sys.byteorder != "little":
+        indexes.byteswap()
+    encoded = json.dumps(list(dictionary), ensure_ascii=False).encode("utf-8")
+    return struct.pack("<I", len(encoded)) + encoded + indexes.tobytes()
+
+
+def write_columnar(batches, columns, handle, level=6):
+    """列式二进制：每批为一个行组，各列分别编码后 zlib 压缩
+
+    文件结构：魔数，随后每个行组为 <I 头长度> + JSON 头 {rows, sizes} + 各列压缩块。
+    """
+    handle.write(COLUMNAR_MAGIC)
+    handle.write(json.dumps({"columns": columns}).encode("utf-8") + b"\n")
+    count = 0
+    for rows in batches:
+        blocks = []
+        for index, (_, kind) in enumerate(columns):
+            values = [row[index] for row in rows]
+            raw = _int_block(values) if kind == "int" else _str_block(values)
+            blocks.append(zlib.compress(raw, level))
+        header = json.dumps({"rows": len(rows), "sizes": [len(x) for x in blocks]}).encode()
+        handle.write(struct.pack("<I", len(header)) + header)
+        for block in blocks:
+            handle.write(block)
+        count += len(rows)
+    return count
+
+
+def read_columnar(handle):
+    """逐行组读取 write_columnar 的输出，产出行元组列表"""
+    if handle.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("不是列式导出文件")
+    columns = json.loads(handle.readline())["columns"]
+    while True:
+        prefix = handle.read(4)
+        if not prefix:
+            return
+        header = json.loads(handle.read(struct.unpack("<I", prefix)[0]))
+        decoded = []
+        for (_, kind), size in zip(columns, header["sizes"]):
+            raw = zlib.decompress(handle.read(size))
+            if kind == "int":
+                values = array("q")
+                values.frombytes(raw)
+                if sys.byteorder != "little":
+                    values.byteswap()
+            else:
+                length = struct.unpack_from("<I", raw)[0]
+                dictionary = json.loads(raw[4:4 + length])
+                indexes = array("I")
+                indexes.frombytes(raw[4 + length:])
+                if sys.byteorder != "little":
+                    indexes.byteswap()
+                values = [dictionary[i] for i in indexes]
+            decoded.append(values)
+        yield list(zip(*decoded))
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "columnar": write_columnar}
+
+
+def export_history(
+    db_path,
+    handle,
+    fmt="csv",
+    granularity="day",
+    start_date=None,
+    end_date=None,
+    area_codes=None,
+    batch_size=1000,
+):
+    """导出历史数据到已打开的文件对象（columnar 需二进制模式），返回导出行数"""
+    if fmt not in WRITERS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    batches = iter_history(db_path, granularity, start_date, end_date, area_codes, batch_size)
+    return WRITERS[fmt](batches, export_columns(granularity), handle)
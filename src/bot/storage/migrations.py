@@ -0,0 +1,584 @@
+import logging
+from datetime import datetime
+
+from src.bot.storage.rollups import calendar_periods
+
+
+def _create_base_tables(conn):
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id TEXT UNIQUE,
+            content TEXT,
+            created_at TEXT
+        )
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS traffic_raw_snapshots (
+            stat_date TEXT NOT NULL,
+            area_code TEXT NOT NULL,
+            area_name TEXT NOT NULL,
+            in_count INTEGER NOT NULL,
+            out_count INTEGER NOT NULL,
+            fetched_at TEXT NOT NULL,
+            PRIMARY KEY (stat_date, area_code, fetched_at)
+        )
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS traffic_daily_by_location (
+            stat_date TEXT NOT NULL,
+            area_code TEXT NOT NULL,
+            area_name TEXT NOT NULL,
+            in_count INTEGER NOT NULL,
+            out_count INTEGER NOT NULL,
+            fetched_at TEXT NOT NULL,
+            PRIMARY KEY (stat_date, area_code)
+        )
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS traffic_daily_summary (
+            stat_date TEXT PRIMARY KEY,
+            area_code TEXT NOT NULL,
+            area_name TEXT NOT NULL,
+            in_count INTEGER NOT NULL,
+            out_count INTEGER NOT NULL,
+            fetched_at TEXT NOT NULL
+        )
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS report_send_log (
+            report_type TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            sent_at TEXT NOT NULL,
+            PRIMARY KEY (report_type, start_date, end_date)
+        )
+        """
+    )
+
+
+def _create_scheduler_job_runs(conn):
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scheduler_job_runs (
+            job_name TEXT PRIMARY KEY,
+            last_run_at TEXT NOT NULL
+        )
+        """
+    )
+
+
+def _create_endpoint_health(conn):
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS endpoint_health (
+            endpoint TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            consecutive_failures INTEGER NOT NULL,
+            opened_at REAL,
+            last_success_at REAL,
+            samples TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+
+
+def _create_rollups(conn):
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS traffic_rollups (
+            period_type TEXT NOT NULL,
+            period_key TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            area_code TEXT NOT NULL,
+            area_name TEXT NOT NULL,
+            in_count INTEGER NOT NULL,
+            PRIMARY KEY (period_type, period_key, area_code)
+        )
+        """
+    )
+
+    cursor.execute("DELETE FROM traffic_rollups WHERE period_type != 'holiday'")
+    totals = {}
+    periods_by_date = {}
+    for row in conn.execute(
+        """
+        SELECT stat_date, area_code, area_name, in_count
+        FROM traffic_daily_by_location
+        ORDER BY stat_date
+        """
+    ):
+        stat_date, area_code, area_name, in_count = tuple(row)
+        periods = periods_by_date.get(stat_date)
+        if periods is None:
+            periods = periods_by_date[stat_date] = calendar_periods(stat_date)
+        for period_type, period_key, start_date, end_date in periods:
+            key = (period_type, period_key, area_code)
+            entry = totals.get(key)
+            if entry is None:
+                totals[key] = [start_date, end_date, area_name, int(in_count)]
+            else:
+                entry[2] = area_name
+                entry[3] += int(in_count)
+
+    cursor.executemany(
+        """
+        INSERT INTO traffic_rollups
+            (period_type, period_key, start_date, end_date, area_code, area_name, in_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (period_type, period_key, start_date, end_date, area_code, area_name, in_count)
+            for (period_type, period_key, area_code), (
+                start_date,
+                end_date,
+                area_name,
+                in_count,
+            ) in totals.items()
+        ],
+    )
+
+
+def _create_prefix_sums(conn):
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS traffic_prefix_sums (
+            area_code TEXT NOT NULL,
+            stat_date TEXT NOT NULL,
+            in_count INTEGER NOT NULL,
+            cum_in INTEGER NOT NULL,
+            PRIMARY KEY (area_code, stat_date)
+        )
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS traffic_areas (
+            area_code TEXT PRIMARY KEY,
+            area_name TEXT NOT NULL
+        )
+        """
+    )
+
+    cursor.execute("DELETE FROM traffic_prefix_sums")
+    cursor.execute(
+        """
+        INSERT INTO traffic_prefix_sums (area_code, stat_date, in_count, cum_in)
+        SELECT
+            area_code,
+            stat_date,
+            in_count,
+            SUM(in_count) OVER (PARTITION BY area_code ORDER BY stat_date)
+        FROM traffic_daily_by_location
+        """
+    )
+    cursor.execute(
+        """
+        INSERT INTO traffic_prefix_sums (area_code, stat_date, in_count, cum_in)
+        SELECT
+            'ALL',
+            stat_date,
+            in_count,
+            SUM(in_count) OVER (ORDER BY stat_date)
+        FROM traffic_daily_summary
+        """
+    )
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO traffic_areas (area_code, area_name)
+        SELECT area_code, area_name
+        FROM traffic_daily_by_location l
+        WHERE stat_date = (
+            SELECT MAX(stat_date) FROM traffic_daily_by_location WHERE area_code = l.area_code
+        )
+        """
+    )
+
+
+def _create_report_outbox(conn):
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS report_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_type TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            title TEXT NOT NULL,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            sent_at TEXT
+        )
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_report_outbox_due
+        ON report_outbox (status, next_attempt_at)
+        """
+    )
+
+
+def _add_outbox_channel(conn):
+    if "channel" not in _table_columns(conn, "report_outbox"):
+        conn.execute(
+            "ALTER TABLE report_outbox ADD COLUMN channel TEXT NOT NULL DEFAULT 'default'"
+        )
+
+
+def _create_raw_response_archive(conn):
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS raw_response_bodies (
+            digest TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            body BLOB NOT NULL,
+            raw_size INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS raw_response_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fetched_at TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            digest TEXT NOT NULL
+        )
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_raw_response_log_fetched
+        ON raw_response_log (fetched_at)
+        """
+    )
+
+
+def _create_anomaly_state(conn):
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS anomaly_state (
+            area_code TEXT PRIMARY KEY,
+            area_name TEXT NOT NULL,
+            stat_date TEXT,
+            last_count INTEGER,
+            last_seen REAL,
+            samples INTEGER NOT NULL,
+            mean REAL NOT NULL,
+            var REAL NOT NULL,
+            seasonal TEXT NOT NULL,
+            stuck_since REAL,
+            stuck_expected REAL NOT NULL,
+            alerted TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+
+
+def _create_run_metrics(conn):
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS run_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT NOT NULL,
+            recorded_at TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            total_seconds REAL NOT NULL,
+            max_seconds REAL NOT NULL,
+            buckets TEXT NOT NULL
+        )
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_run_metrics_stage
+        ON run_metrics (stage, recorded_at)
+        """
+    )
+
+
+def _create_data_meta(conn):
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS data_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        """
+    )
+
+    cursor.execute("INSERT OR IGNORE INTO data_meta (key, value) VALUES ('data_version', 0)")
+
+
+def _create_holiday_ranges(conn):
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS holiday_ranges (
+            period_key TEXT PRIMARY KEY,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            name TEXT NOT NULL
+        )
+        """
+    )
+
+    # 已有节假日汇总的区间直接登记，period_key 为 "开始~结束|名称"
+    cursor.execute(
+        """
+        INSERT OR IGNORE INTO holiday_ranges (period_key, start_date, end_date, name)
+        SELECT DISTINCT
+            period_key, start_date, end_date, substr(period_key, instr(period_key, '|') + 1)
+        FROM traffic_rollups
+        WHERE period_type = 'holiday'
+        """
+    )
+
+
+def _table_exists(conn, table_name):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+        (table_name,),
+    )
+    return cursor.fetchone() is not None
+
+
+def _table_columns(conn, table_name):
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def _rename_legacy_table(conn, table_name):
+    legacy_name = f"{table_name}_legacy"
+    if not _table_exists(conn, table_name):
+        return
+    if _table_exists(conn, legacy_name):
+        return
+    cursor = conn.cursor()
+    cursor.execute(f"ALTER TABLE {table_name} RENAME TO {legacy_name}")
+
+
+def _migrate_legacy_tables(conn):
+    cursor = conn.cursor()
+
+    if _table_exists(conn, "traffic_daily_entries"):
+        cols = _table_columns(conn, "traffic_daily_entries")
+        if {"stat_date", "area", "in_count", "fetched_at"}.issubset(cols):
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO traffic_raw_snapshots
+                    (stat_date, area_code, area_name, in_count, out_count, fetched_at)
+                SELECT stat_date, area, area, COALESCE(in_count, 0), 0, fetched_at
+                FROM traffic_daily_entries
+                """
+            )
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO traffic_daily_by_location
+                    (stat_date, area_code, area_name, in_count, out_count, fetched_at)
+                SELECT stat_date, area, area, COALESCE(in_count, 0), 0, fetched_at
+                FROM traffic_daily_entries
+                """
+            )
+        _rename_legacy_table(conn, "traffic_daily_entries")
+
+    if _table_exists(conn, "traffic_daily_locations"):
+        cols = _table_columns(conn, "traffic_daily_locations")
+        required = {
+            "date",
+            "org_location",
+            "org_name",
+            "daily_in",
+            "daily_out",
+            "created_at",
+        }
+        if required.issubset(cols):
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO traffic_raw_snapshots
+                    (stat_date, area_code, area_name, in_count, out_count, fetched_at)
+                SELECT
+                    date,
+                    org_location,
+                    COALESCE(org_name, org_location),
+                    COALESCE(daily_in, 0),
+                    0,
+                    COALESCE(created_at, datetime('now'))
+                FROM traffic_daily_locations
+                """
+            )
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO traffic_daily_by_location
+                    (stat_date, area_code, area_name, in_count, out_count, fetched_at)
+                SELECT
+                    date,
+                    org_location,
+                    COALESCE(org_name, org_location),
+                    COALESCE(daily_in, 0),
+                    0,
+                    COALESCE(created_at, datetime('now'))
+                FROM traffic_daily_locations
+                """
+            )
+        _rename_legacy_table(conn, "traffic_daily_locations")
+
+    if _table_exists(conn, "traffic_daily_totals"):
+        cols = _table_columns(conn, "traffic_daily_totals")
+        required = {"date", "total_in", "total_out", "created_at"}
+        if required.issubset(cols):
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO traffic_daily_summary
+                    (stat_date, area_code, area_name, in_count, out_count, fetched_at)
+                SELECT
+                    date,
+                    'ALL',
+                    '??',
+                    COALESCE(total_in, 0),
+                    0,
+                    COALESCE(created_at, datetime('now'))
+                FROM traffic_daily_totals
+                """
+            )
+        _rename_legacy_table(conn, "traffic_daily_totals")
+
+    cursor.execute(
+        """
+        INSERT INTO traffic_daily_summary
+            (stat_date, area_code, area_name, in_count, out_count, fetched_at)
+        SELECT
+            l.stat_date,
+            'ALL',
+            '??',
+            COALESCE(SUM(l.in_count), 0),
+            0,
+            COALESCE(MAX(l.fetched_at), datetime('now'))
+        FROM traffic_daily_by_location l
+        LEFT JOIN traffic_daily_summary s
+            ON s.stat_date = l.stat_date
+        WHERE s.stat_date IS NULL
+        GROUP BY l.stat_date
+        """
+    )
+
+
+def _migration_base_schema(conn):
+    _create_base_tables(conn)
+    _migrate_legacy_tables(conn)
+
+
+def rebuild_derived_tables(conn):
+    """从按馆区日表全量重建日汇总、周期汇总（节假日除外）、累计和与馆区表，供批量导入后调用"""
+    # 只替换有按馆区数据的日期；旧版总量表迁入或 insert_daily_traffic 写入的仅汇总日期保留
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO traffic_daily_summary
+            (stat_date, area_code, area_name, in_count, out_count, fetched_at)
+        SELECT stat_date, 'ALL', '??', COALESCE(SUM(in_count), 0), 0, MAX(fetched_at)
+        FROM traffic_daily_by_location
+        GROUP BY stat_date
+        """
+    )
+    _create_rollups(conn)
+    _create_prefix_sums(conn)
+
+
+# 按版本号顺序执行，每一步都必须幂等：旧库 user_version 为 0 时会从第一步重放
+MIGRATIONS = [
+    (1, "基础表结构与旧版表数据迁移", _migration_base_schema),
+    (2, "常驻模式调度任务执行记录表", _create_scheduler_job_runs),
+    (3, "接口健康度与熔断状态表", _create_endpoint_health),
+    (4, "周/月/年/节假日汇总表", _create_rollups),
+    (5, "按馆区累计和索引表", _create_prefix_sums),
+    (6, "钉钉消息发件箱", _create_report_outbox),
+    (7, "发件箱按机器人分发", _add_outbox_channel),
+    (8, "原始响应归档", _create_raw_response_archive),
+    (9, "日内异常检测状态表", _create_anomaly_state),
+    (10, "运行阶段耗时统计表", _create_run_metrics),
+    (11, "数据版本计数", _create_data_meta),
+    (12, "节假日区间登记表", _create_holiday_ranges),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def pending_migrations(conn, version=None):
+    if version is None:
+        version = current_version(conn)
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def apply_migrations(conn, version=None):
+    applied = []
+    for target, description, step in pending_migrations(conn, version):
+        started = datetime.now()
+        conn.execute("BEGIN")
+        try:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {int(target)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logging.exception("数据库迁移失败 version=%s %s", target, description)
+            raise
+        elapsed = (datetime.now() - started).total_seconds()
+        logging.info(
+            "数据库迁移完成 version=%s %s 耗时=%.3fs", target, description, elapsed
+        )
+        applied.append((target, description))
+    return applied
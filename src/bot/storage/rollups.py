@@ -0,0 +1,102 @@
+import calendar
+from datetime import date, datetime, timedelta
+
+PERIOD_WEEK = "week"
+PERIOD_MONTH = "month"
+PERIOD_YEAR = "year"
+PERIOD_HOLIDAY = "holiday"
+
+
+def _to_date(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _fmt(value):
+    return value.strftime("%Y-%m-%d")
+
+
+def holiday_key(holiday):
+    return f"{holiday['start_date']}~{holiday['end_date']}|{holiday.get('name', '')}"
+
+
+def calendar_periods(day):
+    """返回某一天所属的 ISO 周、月、年汇总周期：(period_type, period_key, start_date, end_date)"""
+    day = _to_date(day)
+    iso_year, iso_week, iso_weekday = day.isocalendar()
+    week_start = day - timedelta(days=iso_weekday - 1)
+    month_end = day.replace(day=calendar.monthrange(day.year, day.month)[1])
+    return [
+        (
+            PERIOD_WEEK,
+            f"{iso_year}-W{iso_week:02d}",
+            _fmt(week_start),
+            _fmt(week_start + timedelta(days=6)),
+        ),
+        (PERIOD_MONTH, day.strftime("%Y-%m"), _fmt(day.replace(day=1)), _fmt(month_end)),
+        (
+            PERIOD_YEAR,
+            str(day.year),
+            _fmt(day.replace(month=1, day=1)),
+            _fmt(day.replace(month=12, day=31)),
+        ),
+    ]
+
+
+def holiday_periods(day, holiday_ranges):
+    day_str = _fmt(_to_date(day))
+    return [
+        (PERIOD_HOLIDAY, holiday_key(x), x["start_date"], x["end_date"])
+        for x in holiday_ranges
+        if x["start_date"] <= day_str <= x["end_date"]
+    ]
+
+
+def cover_range(start_date, end_date, holiday_ranges=()):
+    """用尽量粗的汇总周期精确覆盖 [start_date, end_date]
+
+    返回 (periods, day_spans)：periods 为 (period_type, period_key) 列表，
+    day_spans 为剩余无法被整周期覆盖的 (start, end) 日期区间。
+    """
+    start = _to_date(start_date)
+    end = _to_date(end_date)
+    if start > end:
+        return [], []
+
+    for holiday in holiday_ranges:
+        if holiday["start_date"] == _fmt(start) and holiday["end_date"] == _fmt(end):
+            return [(PERIOD_HOLIDAY, holiday_key(holiday))], []
+
+    periods = []
+    day_spans = []
+    cursor = start
+    while cursor <= end:
+        year_end = cursor.replace(month=12, day=31)
+        month_end = cursor.replace(day=calendar.monthrange(cursor.year, cursor.month)[1])
+        week_end = cursor + timedelta(days=6)
+        next_month_start = month_end + timedelta(days=1)
+        next_month_end = next_month_start.replace(
+            day=calendar.monthrange(next_month_start.year, next_month_start.month)[1]
+        )
+        # 跨月的整周会错开下个月的月汇总，下个月完整落在区间内时改为按天补齐到月底
+        week_blocks_month = week_end >= next_month_start and next_month_end <= end
+
+        if cursor.month == 1 and cursor.day == 1 and year_end <= end:
+            periods.append((PERIOD_YEAR, str(cursor.year)))
+            cursor = year_end + timedelta(days=1)
+        elif cursor.day == 1 and month_end <= end:
+            periods.append((PERIOD_MONTH, cursor.strftime("%Y-%m")))
+            cursor = month_end + timedelta(days=1)
+        elif cursor.weekday() == 0 and week_end <= end and not week_blocks_month:
+            iso_year, iso_week, _ = cursor.isocalendar()
+            periods.append((PERIOD_WEEK, f"{iso_year}-W{iso_week:02d}"))
+            cursor = week_end + timedelta(days=1)
+        else:
+            if day_spans and day_spans[-1][1] == _fmt(cursor - timedelta(days=1)):
+                day_spans[-1] = (day_spans[-1][0], _fmt(cursor))
+            else:
+                day_spans.append((_fmt(cursor), _fmt(cursor)))
+            cursor += timedelta(days=1)
+
+    return periods, day_spans
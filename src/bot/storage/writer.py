@@ -0,0 +1,88 @@
+import asyncio
+import functools
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class DatabaseWriter:
+    """独占一个 Database 连接的写线程：其他线程和协程把调用放入队列，SQLite 只在该线程内访问"""
+
+    def __init__(self, db_factory, maxsize=0):
+        self.db = None
+        self._db_factory = db_factory
+        self._queue = queue.Queue(maxsize)
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        try:
+            self.db = self._db_factory()
+        except Exception as exc:
+            self._error = exc
+            self._ready.set()
+            return
+        self._ready.set()
+
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, name, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(getattr(self.db, name)(*args, **kwargs))
+            except BaseException as exc:
+                future.set_exception(exc)
+        self.db.close()
+        logging.info("数据库写线程已停止")
+
+    def submit(self, name, *args, **kwargs):
+        future = Future()
+        self._queue.put((future, name, args, kwargs))
+        return future
+
+    def call(self, name, *args, **kwargs):
+        """同步调用；在写线程内部调用时直接执行，避免自己等待自己"""
+        if threading.current_thread() is self._thread:
+            return getattr(self.db, name)(*args, **kwargs)
+        return self.submit(name, *args, **kwargs).result()
+
+    async def acall(self, name, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(name, *args, **kwargs))
+
+    def proxy(self, owner=True):
+        return DatabaseProxy(self, owner)
+
+    def close(self, timeout=30):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+class DatabaseProxy:
+    """与 Database 同接口的代理，方法调用都转交给写线程执行，可在任意线程使用
+
+    owner 为 False 时 close() 不停止写线程，供共用同一写线程的各组件各自持有。
+    """
+
+    def __init__(self, writer, owner=True):
+        self._writer = writer
+        self._owner = owner
+
+    def __getattr__(self, name):
+        attr = getattr(self._writer.db, name)
+        if not callable(attr):
+            return attr
+        return functools.partial(self._writer.call, name)
+
+    def close(self):
+        if self._owner:
+            self._writer.close()
@@ -0,0 +1,119 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from src.bot.service.analytics import FlowSeries, ratio, shift_months, shift_years
+from src.bot.storage.database import SUMMARY_AREA_CODE, Database
+
+AREAS = {"A": "甲", "B": "乙", "C": "丙"}
+FIRST_DAY = date(2024, 1, 1)
+LAST_DAY = date(2026, 10, 11)
+HOLIDAYS = [
+    {"name": "国庆节", "start_date": "2025-10-01", "end_date": "2025-10-08"},
+    {"name": "国庆节", "start_date": "2026-10-01", "end_date": "2026-10-08"},
+]
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    rng = random.Random(19)
+    records = []
+    day = FIRST_DAY
+    while day <= LAST_DAY:
+        for code, name in AREAS.items():
+            # 留出空缺日，检验缺数据的日子按 0 计
+            if rng.random() < 0.05:
+                continue
+            records.append(
+                (day.isoformat(), code, name, rng.randint(0, 5000), f"{day} 21:00:00")
+            )
+        day += timedelta(days=1)
+    db = Database(path=tmp_path_factory.mktemp("analytics") / "bot.db")
+    db.bulk_load_daily_flow(records)
+    yield db
+    db.close()
+
+
+@pytest.fixture(scope="module")
+def series(db):
+    return FlowSeries.load(db, FIRST_DAY, LAST_DAY)
+
+
+def _sql_total(db, start, end, codes=tuple(AREAS)):
+    marks = ",".join("?" * len(codes))
+    row = db.conn.execute(
+        f"""
+        SELECT COALESCE(SUM(in_count), 0) FROM traffic_daily_by_location
+        WHERE stat_date BETWEEN ? AND ? AND area_code IN ({marks})
+        """,
+        (str(start), str(end), *codes),
+    ).fetchone()
+    return row[0]
+
+
+def _random_ranges(count=50):
+    rng = random.Random(7)
+    span = (LAST_DAY - FIRST_DAY).days
+    for _ in range(count):
+        start = FIRST_DAY + timedelta(days=rng.randrange(400, span))
+        yield start, min(start + timedelta(days=rng.randrange(0, 40)), LAST_DAY)
+
+
+def test_totals_match_sql(db, series):
+    assert sorted(series.areas()) == sorted(AREAS)
+    for start, end in _random_ranges():
+        for code in AREAS:
+            assert series.total(code, start, end) == _sql_total(db, start, end, (code,))
+        assert series.total(SUMMARY_AREA_CODE, start, end) == _sql_total(db, start, end)
+        days = (end - start).days + 1
+        assert series.average("A", start, end) == pytest.approx(
+            _sql_total(db, start, end, ("A",)) / days
+        )
+    # 超出载入范围的部分按 0 计
+    assert series.total("A", FIRST_DAY - timedelta(days=9), FIRST_DAY) == _sql_total(
+        db, FIRST_DAY, FIRST_DAY, ("A",)
+    )
+    assert series.covers(FIRST_DAY, LAST_DAY)
+    assert not series.covers(FIRST_DAY - timedelta(days=1), LAST_DAY)
+
+
+def test_ratios_match_sql(db, series):
+    for start, end in _random_ranges():
+        current = _sql_total(db, start, end, ("B",))
+        last_year = _sql_total(db, shift_years(start, -1), shift_years(end, -1), ("B",))
+        last_month = _sql_total(db, shift_months(start, -1), shift_months(end, -1), ("B",))
+        assert series.yoy("B", start, end) == ratio(current, last_year)
+        assert series.mom("B", start, end) == ratio(current, last_month)
+
+    current = _sql_total(db, "2026-10-01", "2026-10-08")
+    previous = _sql_total(db, "2025-10-01", "2025-10-08")
+    growth = series.holiday_yoy(SUMMARY_AREA_CODE, HOLIDAYS[1], HOLIDAYS)
+    assert growth == pytest.approx((current - previous) / previous)
+    assert series.holiday_yoy("A", dict(HOLIDAYS[1], name="元旦"), HOLIDAYS) is None
+
+
+def test_moving_average_and_ranking_match_sql(db, series):
+    averages = series.moving_average("C", 28)
+    for offset in (0, 5, 27, 300, series.days - 1):
+        end = FIRST_DAY + timedelta(days=offset)
+        start = max(end - timedelta(days=27), FIRST_DAY)
+        days = (end - start).days + 1
+        assert averages[offset] == pytest.approx(_sql_total(db, start, end, ("C",)) / days)
+
+    start, end = "2026-09-01", "2026-09-30"
+    expected = sorted(
+        ((code, _sql_total(db, start, end, (code,))) for code in AREAS),
+        key=lambda x: (-x[1], x[0]),
+    )
+    assert series.ranking(start, end) == expected
+
+
+def test_merged_column_is_the_subset_sum(db, series):
+    assert series.merge(list(AREAS)) == SUMMARY_AREA_CODE
+    key = series.merge(["C", "A"])
+    assert series.merge(["A", "C"]) == key
+    # 合并列不参与馆区列表与排名
+    assert sorted(series.areas()) == sorted(AREAS)
+    for start, end in _random_ranges(10):
+        assert series.total(key, start, end) == _sql_total(db, start, end, ("A", "C"))
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+from src.bot.service.anomaly import (
+    KIND_RESET,
+    KIND_SPIKE,
+    KIND_STUCK,
+    AnomalyDetector,
+    hour_of_week,
+)
+from src.bot.storage.database import Database
+
+START = datetime(2026, 10, 7, 9, 0)
+SLOT = hour_of_week(START)
+
+
+def _detector(**kwargs):
+    options = dict(warmup=3, seasonal_warmup=1, stuck_min_expected=60, spike_min_count=100)
+    options.update(kwargs)
+    return AnomalyDetector(**options)
+
+
+def _feed(detector, counts, start=START, step=5, area_code="A"):
+    """每 step 分钟喂一次累计计数，返回每次发现的异常类型"""
+    kinds = []
+    for index, count in enumerate(counts):
+        observed_at = start + timedelta(minutes=step * index)
+        anomalies = detector.observe({area_code: {"name": "甲", "daily_in": count}}, observed_at)
+        kinds.append([x["kind"] for x in anomalies])
+    return kinds
+
+
+def _steady(intervals, per_interval=50):
+    return [per_interval * i for i in range(intervals)]
+
+
+def test_steady_flow_raises_nothing():
+    detector = _detector()
+    assert not any(_feed(detector, _steady(12)))
+    state = detector.state("A")
+    assert state.samples == 11
+    assert abs(state.seasonal[SLOT] - 10) < 1e-6
+
+
+def test_stuck_counter_alert_is_rate_limited():
+    alerts = []
+    detector = _detector(alert=alerts.append)
+    counts = _steady(8) + [350] * 4
+    kinds = _feed(detector, counts)
+
+    # 往常每 5 分钟约 50 人次：第一次静止累计 50，第二次达到 100 ≥ 60 开始告警
+    assert kinds[8] == []
+    assert kinds[9] == [KIND_STUCK]
+    assert kinds[10] == [KIND_STUCK]
+    assert len(alerts) == 1
+    assert alerts[0][0]["count"] == 350
+    # 停滞期间不学习，基线不被拉低
+    assert detector.state("A").samples == 7
+
+
+def test_short_pause_is_folded_into_baseline():
+    detector = _detector()
+    _feed(detector, _steady(8) + [350, 400])
+    state = detector.state("A")
+    # 一次静止未达到阈值，恢复后按速率 0 补记，再加上恢复的那次
+    assert state.samples == 7 + 1 + 1
+    assert state.stuck_since is None
+
+
+def test_spike_is_reported_and_kept_out_of_baseline():
+    detector = _detector()
+    _feed(detector, _steady(8))
+    state = detector.state("A")
+    mean, samples = state.mean, state.samples
+    kinds = _feed(detector, [350 + 1000], start=START + timedelta(minutes=40))
+    assert kinds == [[KIND_SPIKE]]
+    assert (state.mean, state.samples) == (mean, samples)
+
+
+def test_spike_needs_warmup_and_minimum_count():
+    assert _feed(_detector(), [0, 1000])[-1] == []
+    assert _feed(_detector(spike_min_count=2000), _steady(8) + [1350])[-1] == []
+
+
+def test_reset_within_day_but_not_across_days():
+    detector = _detector()
+    kinds = _feed(detector, [100, 150, 20])
+    assert kinds[-1] == [KIND_RESET]
+
+    next_day = START + timedelta(days=1)
+    assert _feed(detector, [0], start=next_day) == [[]]
+
+
+def test_long_gap_restarts_rate_measurement():
+    detector = _detector(max_gap_minutes=60)
+    _feed(detector, _steady(8))
+    assert _feed(detector, [350], start=START + timedelta(hours=5)) == [[]]
+    assert detector.state("A").samples == 7
+
+
+def test_state_survives_restart(tmp_path):
+    db = Database(path=tmp_path / "bot.db")
+    try:
+        detector = _detector(store=db)
+        _feed(detector, _steady(8) + [350] * 3)
+        state = detector.state("A")
+
+        restored = _detector(store=db).state("A")
+        for field in ("stat_date", "last_count", "samples", "stuck_since", "alerted"):
+            assert getattr(restored, field) == getattr(state, field)
+        assert abs(restored.mean - state.mean) < 1e-9
+        assert abs(restored.seasonal[SLOT] - 10) < 1e-3
+    finally:
+        db.close()
@@ -0,0 +1,96 @@
+import json
+import sqlite3
+
+from src.bot.api.archive import ResponseArchive
+from src.bot.service.traffic_service import TrafficService
+from src.bot.storage.database import Database
+
+
+def _record(archive, body):
+    capture = archive.capture([body])
+    list(capture)
+    archive.record("primary", capture)
+
+
+def test_failed_flush_keeps_body_for_later_duplicates(tmp_path, monkeypatch):
+    db = Database(path=tmp_path / "bot.db")
+    archive = ResponseArchive(store=db)
+    archive.collected_at = "2026-10-07 10:00:00"
+    try:
+        _record(archive, b'{"isSuccess": true}')
+        write = db.archive_responses
+
+        def locked(rows):
+            raise sqlite3.OperationalError("database is locked")
+
+        monkeypatch.setattr(db, "archive_responses", locked)
+        archive.flush()
+        monkeypatch.setattr(db, "archive_responses", write)
+
+        # 相同响应在正文写入前不能只记引用
+        archive.collected_at = "2026-10-07 10:05:00"
+        _record(archive, b'{"isSuccess": true}')
+        archive.flush()
+        _record(archive, b'{"isSuccess": true}')
+        archive.flush()
+
+        rows = list(db.iter_archived_responses("2026-10-07", "2026-10-07"))
+        assert len(rows) == 3
+        assert len({row["digest"] for row in rows}) == 1
+    finally:
+        db.close()
+
+
+def _response(counts):
+    return json.dumps(
+        {
+            "isSuccess": True,
+            "data": [
+                {
+                    "orgLocation": code,
+                    "orgLocationName": code.lower(),
+                    "fCount": [{"countType": "日", "dateType": 0, "personCount": count}],
+                }
+                for code, count in counts.items()
+            ],
+        }
+    ).encode("utf-8")
+
+
+def test_reprocess_rewrites_daily_rows_from_archive(tmp_path, monkeypatch):
+    db = Database(path=tmp_path / "bot.db")
+    archive = ResponseArchive(store=db)
+    service = TrafficService(api=None, library_codes={"A": "a", "B": "b"}, db=db)
+    try:
+        for collected_at, body in (
+            ("2026-10-06 21:00:00", _response({"A": 30, "B": 5})),
+            ("2026-10-07 10:00:00", _response({"A": 40, "B": 6})),
+            ("2026-10-07 10:05:00", _response({"A": 40, "B": 6})),
+            ("2026-10-07 10:10:00", b'{"isSuccess": true, "data": ['),
+            ("2026-10-07 21:00:00", _response({"A": 90, "B": 7, "OTHER": 1})),
+        ):
+            archive.collected_at = collected_at
+            _record(archive, body)
+        archive.flush()
+
+        # 库中的值来自旧口径，与归档响应不一致
+        db.insert_daily_flow("2026-10-06", {"A": {"name": "a", "daily_in": 999}})
+        db.insert_daily_flow("2026-10-07", {"A": {"name": "a", "daily_in": 1}})
+
+        parse = service.parse_daily_flow
+        parsed = []
+        monkeypatch.setattr(service, "parse_daily_flow", lambda data: parsed.append(1) or parse(data))
+        stats = service.reprocess_archive()
+        assert stats == {"responses": 5, "written": 6, "skipped": 2, "failed": 1}
+        # 连续相同的响应只解析一次
+        assert len(parsed) == 3
+
+        flow = db.get_flow_between("2026-10-05", "2026-10-11")
+        assert {code: x["daily_in"] for code, x in flow.items()} == {"A": 120, "B": 12}
+        assert db.get_range_totals("2026-10-06", "2026-10-06")["A"]["daily_in"] == 30
+        assert "OTHER" not in db.get_flow_between("2026-10-07", "2026-10-07")
+
+        # 只重放区间内的归档
+        assert service.reprocess_archive("2026-10-06", "2026-10-06")["responses"] == 1
+    finally:
+        db.close()
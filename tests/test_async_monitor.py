@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from src.bot.service.async_monitor import AsyncLibraryFlowMonitor
+from src.bot.service.traffic_service import LibraryFlowMonitor
+from src.bot.storage.connections import ConnectionManager
+
+CODES = {f"L{i}": f"馆{i}" for i in range(6)}
+SUNDAY = datetime(2026, 10, 11, 21, 0, 0)
+
+
+class ShardApi:
+    """各分片必须同时在途才能通过屏障，串行请求会在屏障处超时失败"""
+
+    def __init__(self, shards, hanging=()):
+        self.payload = {"orgLocations": list(CODES)}
+        self.archive = None
+        self.barrier = threading.Barrier(shards)
+        self.hanging = set(hanging)
+        self.release = threading.Event()
+
+    def fetch(self, payload=None, flush=True):
+        locations = payload["orgLocations"]
+        if locations[0] in self.hanging:
+            self.release.wait(timeout=5)
+            return None
+        if not self.hanging:
+            self.barrier.wait(timeout=2)
+        return {
+            "isSuccess": True,
+            "flow": {code: {"name": CODES[code], "daily_in": 10} for code in locations},
+        }
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.release.set()
+
+
+@pytest.fixture
+def connections(tmp_path):
+    connections = ConnectionManager(tmp_path / "bot.db", readers=2, now_func=lambda: SUNDAY)
+    yield connections
+    connections.close()
+
+
+def _runner(connections, api, tmp_path, **kwargs):
+    monitor = LibraryFlowMonitor(
+        db=connections.db(),
+        reader=connections.reader,
+        api=api,
+        library_codes=CODES,
+        batch_size=2,
+        holiday_config_path=tmp_path / "holiday_ranges.json",
+        detect_anomalies=False,
+        now_func=lambda: SUNDAY,
+    )
+    for name, value in kwargs.items():
+        setattr(monitor.service, name, value)
+    return AsyncLibraryFlowMonitor(monitor, connections.writer, max_workers=4)
+
+
+def test_run_once_fetches_shards_concurrently_and_reports(connections, tmp_path, capsys):
+    runner = _runner(connections, ShardApi(shards=3), tmp_path)
+    try:
+        flow = asyncio.run(runner.run_once())
+    finally:
+        runner.close()
+
+    assert sorted(flow) == sorted(CODES)
+    with connections.reader() as db:
+        assert db.get_flow_between("2026-10-11", "2026-10-11")["L3"]["daily_in"] == 10
+        assert db.get_range_totals("2026-10-05", "2026-10-11")["L3"]["daily_in"] == 10
+    output = capsys.readouterr().out
+    # 周日同时出日报与周报
+    assert "[浙图人流日报]" in output
+    assert "[浙图人流周报]" in output
+
+
+def test_hanging_shard_does_not_hold_up_the_tick(connections, tmp_path):
+    api = ShardApi(shards=3, hanging=["L0"])
+    runner = _runner(connections, api, tmp_path, collect_timeout=0.3, batch_retries=0)
+    started = time.perf_counter()
+    try:
+        flow = asyncio.run(runner.collect_intraday())
+    finally:
+        runner.close()
+
+    assert time.perf_counter() - started < 2
+    assert sorted(flow) == ["L2", "L3", "L4", "L5"]
+    with connections.reader() as db:
+        assert len(db.get_intraday_series("2026-10-11")) == 4
+
+
+def test_failed_collection_skips_saving(connections, tmp_path):
+    api = ShardApi(shards=3, hanging=["L0", "L2", "L4"])
+    runner = _runner(connections, api, tmp_path, collect_timeout=0.2, batch_retries=0)
+    try:
+        assert asyncio.run(runner.collect_intraday()) is None
+    finally:
+        runner.close()
+    with connections.reader() as db:
+        assert db.get_intraday_series("2026-10-11") == []
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from src.bot.storage.backfill import read_records
+from src.bot.storage.database import Database
+
+DERIVED_TABLES = {
+    "traffic_daily_summary": "stat_date, area_code",
+    "traffic_rollups": "period_type, period_key, area_code",
+    "traffic_prefix_sums": "area_code, stat_date",
+    "traffic_areas": "area_code",
+}
+
+
+def _dump(db):
+    tables = {}
+    for table, order in DERIVED_TABLES.items():
+        rows = db.conn.execute(f"SELECT * FROM {table} ORDER BY {order}").fetchall()
+        tables[table] = [
+            {k: row[k] for k in row.keys() if k not in ("fetched_at", "updated_at")} for row in rows
+        ]
+    return tables
+
+
+def test_read_records_accepts_aliases_and_skips_bad_rows(tmp_path):
+    path = tmp_path / "history.csv"
+    path.write_text(
+        "﻿日期,馆区代码,馆区,进馆人次\n"
+        "2026/10/01,A,甲,12\n"
+        "20261002,A,,13.0\n"
+        "bad-date,A,甲,1\n"
+        "2026-10-03,,甲,1\n",
+        encoding="utf-8",
+    )
+    stats = {}
+    assert list(read_records(path, stats=stats)) == [
+        ("2026-10-01", "A", "甲", 12, "2026-10-01 23:59:59"),
+        ("2026-10-02", "A", "A", 13, "2026-10-02 23:59:59"),
+    ]
+    assert stats == {"invalid": 2}
+
+    path = tmp_path / "history.jsonl"
+    lines = [
+        json.dumps({"stat_date": "2026-10-01", "orgLocation": "B", "daily_in": 5}),
+        "{broken",
+        "",
+        json.dumps(
+            {"date": "2026-10-02", "area_code": "B", "in_count": 6, "fetched_at": "2026-10-02 09:00:00"}
+        ),
+    ]
+    path.write_text("\n".join(lines), encoding="utf-8")
+    stats = {}
+    assert [x[3] for x in read_records(path, stats=stats)] == [5, 6]
+    assert stats == {"invalid": 1}
+
+
+def _records(days=40):
+    for day in range(days):
+        stat_date = f"2026-{9 + day // 30:02d}-{day % 30 + 1:02d}"
+        for code in ("A", "B", "C"):
+            yield stat_date, code, code.lower(), day * 10 + ord(code), f"{stat_date} 21:00:00"
+
+
+def test_bulk_load_matches_incremental_inserts(tmp_path):
+    holiday = {"name": "国庆节", "start_date": "2026-10-01", "end_date": "2026-10-08"}
+    records = list(_records())
+    # 同一馆区同一天以后出现的为准
+    records.append(("2026-09-03", "A", "a", 7, "2026-09-03 22:00:00"))
+
+    bulk = Database(path=tmp_path / "bulk.db")
+    incremental = Database(path=tmp_path / "incremental.db")
+    try:
+        bulk.set_holiday_ranges([holiday])
+        assert bulk.bulk_load_daily_flow(iter(records), chunk_size=7) == len(records)
+
+        incremental.set_holiday_ranges([holiday])
+        for stat_date, code, name, count, fetched_at in records:
+            incremental.insert_daily_flow(
+                stat_date, {code: {"name": name, "daily_in": count}}, fetched_at=fetched_at
+            )
+
+        assert _dump(bulk) == _dump(incremental)
+        assert bulk.get_flow_between("2026-09-01", "2026-10-10")["A"]["daily_in"] == (
+            incremental.get_flow_between("2026-09-01", "2026-10-10")["A"]["daily_in"]
+        )
+        assert bulk.conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    finally:
+        bulk.close()
+        incremental.close()
+
+
+def test_failed_bulk_load_keeps_committed_chunks_consistent(tmp_path):
+    def records():
+        yield from _records(days=5)
+        raise ValueError("损坏的输入")
+
+    db = Database(path=tmp_path / "bot.db")
+    try:
+        with pytest.raises(ValueError, match="损坏的输入"):
+            db.bulk_load_daily_flow(records(), chunk_size=4)
+        # 已提交的块留在日表中，派生表随之重建
+        daily = db.conn.execute("SELECT COUNT(*) FROM traffic_daily_by_location").fetchone()[0]
+        assert daily == 12
+        total = db.conn.execute("SELECT SUM(in_count) FROM traffic_daily_by_location").fetchone()[0]
+        flow = db.get_flow_between("2026-09-01", "2026-09-30")
+        assert sum(x["daily_in"] for x in flow.values()) == total
+        assert db.conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    finally:
+        db.close()
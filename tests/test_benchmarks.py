@@ -0,0 +1,109 @@
+import json
+from datetime import date, datetime
+
+import pytest
+
+from benchmarks.mock_api import MockFlowAPI, build_response, location_codes
+from benchmarks.run import compare, measure
+from benchmarks.synthetic import generate_history, iter_history
+from src.bot.api.flow_parser import StreamingFlowParser
+from src.bot.api.traffic_api import TrafficAPI
+from src.bot.storage.database import Database
+
+
+def _api(mock, **kwargs):
+    codes = list(mock.locations)[:3]
+    return TrafficAPI(
+        mock.url,
+        mock.url + "?backup",
+        {"orgLocations": codes},
+        {},
+        parser=StreamingFlowParser(dict.fromkeys(codes, "")),
+        **kwargs,
+    )
+
+
+def test_mock_api_serves_only_requested_locations():
+    with MockFlowAPI(locations=20) as mock:
+        api = _api(mock)
+        try:
+            data = api.fetch_flow_data()
+        finally:
+            api.close()
+    assert data["isSuccess"]
+    assert sorted(data["flow"]) == ["BENCH-0000", "BENCH-0001", "BENCH-0002"]
+    assert mock.stats == {"requests": 1, "errors": 0, "invalid": 0, "timeouts": 0}
+
+
+@pytest.mark.parametrize(
+    "fault, expected",
+    [
+        (dict(error_rate=1), {"errors": 1}),
+        (dict(invalid_rate=1), {"invalid": 1}),
+        (dict(timeout_rate=1, hang_seconds=2), {"timeouts": 1}),
+    ],
+)
+def test_mock_api_injects_faults(fault, expected):
+    with MockFlowAPI(locations=5, **fault) as mock:
+        api = _api(mock, timeout=0.3)
+        try:
+            data = api.fetch_flow_data()
+        finally:
+            api.close()
+    assert not (data and data.get("isSuccess"))
+    assert api.health.stats(mock.url)["consecutive_failures"] == 1
+    assert {k: v for k, v in mock.stats.items() if v and k != "requests"} == expected
+
+
+def test_fault_sequence_is_reproducible():
+    outcomes = []
+    for _ in range(2):
+        with MockFlowAPI(locations=1, error_rate=0.3, invalid_rate=0.3, seed=7) as mock:
+            outcomes.append([mock._decide()[0] for _ in range(50)])
+    assert outcomes[0] == outcomes[1]
+    assert {"errors", "invalid", None} <= set(outcomes[0])
+
+
+def test_streaming_parser_matches_json_on_large_response():
+    locations = location_codes(500)
+    body = json.dumps(
+        build_response(locations, moment=datetime(2026, 10, 7, 15, 30)), ensure_ascii=False
+    ).encode("utf-8")
+    flow = StreamingFlowParser(locations).parse([body[i:i + 4096] for i in range(0, len(body), 4096)])
+    assert len(flow["flow"]) == 500
+    record = json.loads(body)["data"][123]
+    day = next(x for x in record["fCount"] if x["countType"] == "日" and x["dateType"] == 0)
+    assert flow["flow"][record["orgLocation"]]["daily_in"] == day["personCount"]
+
+
+def test_synthetic_history_is_deterministic(tmp_path):
+    locations = location_codes(4)
+    first = list(iter_history(locations, date(2024, 2, 28), date(2024, 3, 1), seed=3))
+    assert first == list(iter_history(locations, date(2024, 2, 28), date(2024, 3, 1), seed=3))
+    assert len(first) == 3 * 4
+    assert [x[0] for x in first[::4]] == ["2024-02-28", "2024-02-29", "2024-03-01"]
+
+    db = Database(path=tmp_path / "bot.db")
+    try:
+        loaded, codes, (start, end) = generate_history(
+            db, years=1, locations=3, end_date=date(2025, 12, 31)
+        )
+        assert (start, end) == (date(2025, 1, 1), date(2025, 12, 31))
+        assert loaded == 365 * 3
+        totals = db.get_flow_between("2025-01-01", "2025-12-31")
+        assert set(totals) == set(codes)
+    finally:
+        db.close()
+
+
+def test_measure_and_compare(capsys):
+    calls = []
+    stats = measure(lambda: calls.append(1), repeat=3, warmup=2)
+    assert len(calls) == 5
+    assert stats["runs"] == 3
+    assert stats["min"] <= stats["median"] <= stats["max"]
+
+    results = {"fast": {"median": 1.0}, "slow": {"median": 1.5}, "new": {"median": 0.1}}
+    baseline = {"fast": {"median": 1.0}, "slow": {"median": 1.0}}
+    assert compare(results, baseline, threshold=0.2) == ["slow"]
+    assert "new" in capsys.readouterr().out
@@ -0,0 +1,53 @@
+from src.bot.storage.cache import QueryCache
+from src.bot.storage.database import Database
+
+
+def test_invalidate_drops_only_overlapping_entries_of_given_tags():
+    cache = QueryCache()
+    cache.put(("flow", "a"), 1, "get_flow_between", "2026-10-01", "2026-10-07")
+    cache.put(("flow", "b"), 2, "get_flow_between", "2026-10-08", "2026-10-14")
+    cache.put(("sent", "a"), 3, "has_report_sent", "2026-10-01", "2026-10-07")
+
+    assert cache.invalidate("2026-10-07", "2026-10-07", {"get_flow_between"}) == 1
+    assert cache.get(("flow", "a")) == (False, None)
+    assert cache.get(("flow", "b")) == (True, 2)
+    assert cache.get(("sent", "a")) == (True, 3)
+
+
+def test_entries_expire_and_lru_evicts():
+    now = {"value": 0.0}
+    cache = QueryCache(max_entries=2, ttl=10, clock=lambda: now["value"])
+    cache.put("a", 1, "t", "2026-10-01", "2026-10-01")
+    cache.put("b", 2, "t", "2026-10-01", "2026-10-01")
+    assert cache.get("a") == (True, 1)
+    cache.put("c", 3, "t", "2026-10-01", "2026-10-01")
+    # b 最久未用，被挤出
+    assert cache.get("b") == (False, None)
+
+    now["value"] = 10
+    assert cache.get("a") == (False, None)
+    assert cache.stats()["evictions"] == 2
+
+
+def test_writes_invalidate_cached_reads(tmp_path):
+    db = Database(path=tmp_path / "bot.db")
+    try:
+        db.insert_daily_flow("2026-10-07", {"A": {"name": "甲", "daily_in": 10}})
+        assert db.get_flow_between("2026-10-05", "2026-10-11")["A"]["daily_in"] == 10
+        assert db.get_range_totals("2026-10-12", "2026-10-18") == {}
+        hits = db.cache_stats()["hits"]
+        # 命中返回的是副本，调用方修改不影响缓存
+        db.get_flow_between("2026-10-05", "2026-10-11")["A"]["daily_in"] = -1
+        assert db.get_flow_between("2026-10-05", "2026-10-11")["A"]["daily_in"] == 10
+        assert db.cache_stats()["hits"] == hits + 2
+
+        db.insert_daily_flow("2026-10-07", {"A": {"name": "甲", "daily_in": 15}})
+        assert db.get_flow_between("2026-10-05", "2026-10-11")["A"]["daily_in"] == 15
+        db.insert_daily_flow("2026-10-13", {"A": {"name": "甲", "daily_in": 4}})
+        assert db.get_range_totals("2026-10-12", "2026-10-18")["A"]["daily_in"] == 4
+
+        assert not db.has_report_sent("weekly", "2026-10-05", "2026-10-11")
+        db.mark_report_sent("weekly", "2026-10-05", "2026-10-11")
+        assert db.has_report_sent("weekly", "2026-10-05", "2026-10-11")
+    finally:
+        db.close()
@@ -0,0 +1,123 @@
+
+import pytest
+
+from src.bot.service.scheduler import IntervalTrigger
+from src.bot.storage.database import Database
+
+DAY = "2026-10-07"
+
+
+def _flow(**counts):
+    return {code: {"name": code.lower(), "daily_in": count} for code, count in counts.items()}
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(path=tmp_path / "bot.db")
+    yield db
+    db.close()
+
+
+def _tick(db, time, **counts):
+    return db.insert_daily_flow(DAY, _flow(**counts), fetched_at=f"{DAY} {time}")
+
+
+def _daily(db):
+    return {
+        row["area_code"]: (row["in_count"], row["fetched_at"][11:])
+        for row in db.conn.execute(
+            "SELECT area_code, in_count, fetched_at FROM traffic_daily_by_location WHERE stat_date = ?",
+            (DAY,),
+        )
+    }
+
+
+def test_ticks_append_changed_snapshots_and_derive_daily_from_latest(db):
+    _tick(db, "09:00:00", A=10, B=5)
+    _tick(db, "09:05:00", A=40, B=5)
+    _tick(db, "10:10:00", A=90, B=25)
+
+    series = [(x["area_code"], x["in_count"]) for x in db.get_intraday_series(DAY)]
+    # 计数未变化的馆区不追加快照
+    assert series == [("A", 10), ("A", 40), ("A", 90), ("B", 5), ("B", 25)]
+    assert _daily(db) == {"A": (90, "10:10:00"), "B": (25, "10:10:00")}
+    summary = db.conn.execute(
+        "SELECT in_count FROM traffic_daily_summary WHERE stat_date = ?", (DAY,)
+    ).fetchone()
+    assert summary[0] == 115
+    assert db.get_flow_between(DAY, DAY)["A"]["daily_in"] == 90
+
+    hourly = db.get_hourly_flow(DAY)
+    assert hourly["A"]["hours"] == {9: 40, 10: 50}
+    assert hourly["A"]["peak_hour"] == 10
+    assert hourly["B"]["hours"] == {9: 5, 10: 20}
+
+
+def test_late_snapshot_is_kept_but_does_not_replace_latest(db):
+    _tick(db, "10:00:00", A=90)
+    result = _tick(db, "09:30:00", A=60)
+    assert result == {"written": 0, "skipped": 0, "stale": 1}
+    assert [x["in_count"] for x in db.get_intraday_series(DAY, "A")] == [60, 90]
+    assert _daily(db) == {"A": (90, "10:00:00")}
+
+
+def test_each_tick_is_one_transaction(db):
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    _tick(db, "09:00:00", **{f"L{i}": i for i in range(30)})
+    db.conn.set_trace_callback(None)
+
+    transaction = [x for x in statements if x in ("BEGIN IMMEDIATE", "COMMIT")]
+    assert transaction == ["BEGIN IMMEDIATE", "COMMIT"]
+    assert len(db.get_intraday_series(DAY)) == 30
+
+
+def test_readers_see_only_committed_ticks(db, tmp_path):
+    _tick(db, "09:00:00", A=10)
+    reader = Database(path=tmp_path / "bot.db", readonly=True, cache_size=0)
+    try:
+        db.conn.execute("BEGIN IMMEDIATE")
+        try:
+            db.conn.execute(
+                "UPDATE traffic_daily_by_location SET in_count = 999 WHERE area_code = 'A'"
+            )
+            # WAL：写事务未提交时读取不阻塞，读到的是上一次提交
+            assert reader.get_flow_between(DAY, DAY)["A"]["daily_in"] == 10
+        finally:
+            db.conn.rollback()
+    finally:
+        reader.close()
+    assert db.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+class RecordingScheduler:
+    instances = []
+
+    def __init__(self, state_store=None):
+        self.jobs = {}
+        RecordingScheduler.instances.append(self)
+
+    def add_job(self, name, func, trigger, **kwargs):
+        self.jobs[name] = (func, trigger, kwargs)
+
+    def install_signal_handlers(self):
+        pass
+
+    def run_forever(self):
+        pass
+
+
+def test_collector_mode_schedules_only_intraday_polling(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from src.bot import main
+
+    monkeypatch.setattr(main, "Scheduler", RecordingScheduler)
+    args = main.build_arg_parser().parse_args(["--collector"])
+    main.run_daemon(lambda: None, lambda: None, None, args)
+
+    jobs = RecordingScheduler.instances[-1].jobs
+    assert list(jobs) == ["intraday_poll"]
+    _, trigger, options = jobs["intraday_poll"]
+    assert isinstance(trigger, IntervalTrigger)
+    assert str(trigger) == "every 5min"
+    assert options["catch_up"] is False
@@ -0,0 +1,151 @@
+import asyncio
+import threading
+from datetime import datetime
+
+import pytest
+
+from src.bot.service.outbox import OutboxSender
+from src.bot.storage.connections import ConnectionManager
+from src.bot.storage.writer import DatabaseWriter
+
+NOW = datetime(2026, 10, 11, 20, 0, 0)
+
+
+class RecordingDb:
+    """记录调用顺序与执行线程，代替 Database"""
+
+    def __init__(self):
+        self.calls = []
+        self.closed = False
+
+    def record(self, value):
+        self.calls.append((value, threading.current_thread().name))
+        return value
+
+    def fail(self):
+        raise ValueError("boom")
+
+    def close(self):
+        self.closed = True
+
+
+def test_writer_runs_calls_in_order_on_its_own_thread():
+    db = RecordingDb()
+    writer = DatabaseWriter(lambda: db)
+    try:
+        futures = [writer.submit("record", i) for i in range(50)]
+        assert [f.result() for f in futures] == list(range(50))
+        assert writer.call("record", "sync") == "sync"
+        assert asyncio.run(writer.acall("record", "async")) == "async"
+        assert [x[0] for x in db.calls] == list(range(50)) + ["sync", "async"]
+        assert {x[1] for x in db.calls} == {"db-writer"}
+    finally:
+        writer.close()
+
+
+def test_writer_propagates_exceptions_and_keeps_running():
+    writer = DatabaseWriter(RecordingDb)
+    try:
+        with pytest.raises(ValueError, match="boom"):
+            writer.call("fail")
+        with pytest.raises(ValueError):
+            asyncio.run(writer.acall("fail"))
+        assert writer.proxy().record(1) == 1
+    finally:
+        writer.close()
+
+
+def test_writer_close_drains_queue_then_closes_db():
+    db = RecordingDb()
+    writer = DatabaseWriter(lambda: db)
+    futures = [writer.submit("record", i) for i in range(10)]
+    writer.proxy(owner=False).close()
+    assert not db.closed
+
+    writer.close()
+    assert [f.result() for f in futures] == list(range(10))
+    assert db.closed
+    assert not writer._thread.is_alive()
+
+
+def test_writer_factory_failure_is_raised():
+    def factory():
+        raise RuntimeError("cannot open")
+
+    with pytest.raises(RuntimeError, match="cannot open"):
+        DatabaseWriter(factory)
+
+
+def test_reader_pool_reuses_connections(tmp_path):
+    connections = ConnectionManager(tmp_path / "bot.db", readers=2)
+    try:
+        connections.db().insert_daily_flow("2026-10-07", {"A": {"name": "甲", "daily_in": 10}})
+
+        with connections.reader() as first:
+            # 同一线程嵌套借用复用同一个连接
+            with connections.reader() as nested:
+                assert nested is first
+            assert first.get_flow_between("2026-10-07", "2026-10-07")["A"]["daily_in"] == 10
+
+            second_borrowed = threading.Event()
+            release = threading.Event()
+            borrowed = {}
+
+            def borrow(name, done):
+                with connections.reader() as db:
+                    borrowed[name] = db
+                    done.set()
+                    release.wait(timeout=5)
+
+            third_borrowed = threading.Event()
+            second = threading.Thread(target=borrow, args=("second", second_borrowed))
+            second.start()
+            assert second_borrowed.wait(timeout=5)
+            assert borrowed["second"] is not first
+
+            # 池已满：第三个线程要等有连接归还
+            third = threading.Thread(target=borrow, args=("third", third_borrowed))
+            third.start()
+            assert not third_borrowed.wait(timeout=0.2)
+
+        assert third_borrowed.wait(timeout=5)
+        assert borrowed["third"] is first
+        release.set()
+        second.join(timeout=5)
+        third.join(timeout=5)
+        assert connections._opened == 2
+
+        # 写线程提交后只读连接立即可见
+        connections.db().insert_daily_flow("2026-10-08", {"A": {"name": "甲", "daily_in": 5}})
+        with connections.reader() as db:
+            assert db.get_flow_between("2026-10-07", "2026-10-08")["A"]["daily_in"] == 15
+    finally:
+        connections.close()
+    assert connections._opened == 0
+
+
+def test_outbox_polls_through_reader_pool(tmp_path):
+    class Chatbot:
+        def send_markdown(self, title, text, is_at_all=False):
+            return {"errcode": 0}
+
+    connections = ConnectionManager(tmp_path / "bot.db", readers=1, now_func=lambda: NOW)
+    borrows = []
+
+    def reader():
+        borrows.append(threading.current_thread().name)
+        return connections.reader()
+
+    db = connections.db()
+    sender = OutboxSender(
+        Chatbot(), db_factory=connections.db, reader=reader, now_func=lambda: NOW
+    )
+    try:
+        db.enqueue_report("weekly", "2026-10-05", "2026-10-11", "浙图人流周报", "text")
+        assert sender.drain(db) == 0
+        assert db.has_report_sent("weekly", "2026-10-05", "2026-10-11")
+        assert borrows
+        assert "db-writer" not in borrows
+    finally:
+        sender.stop()
+        connections.close()
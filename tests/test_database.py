@@ -0,0 +1,118 @@
+import sqlite3
+
+from src.bot.storage import database
+from src.bot.storage.database import Database
+
+
+def test_rollups_follow_stored_counts_across_connections(tmp_path):
+    path = tmp_path / "bot.db"
+    first = Database(path=path)
+    second = Database(path=path)
+    try:
+        # 两个连接交替写同一馆区同一天，各自的内存计数都会过期
+        for db, count in ((first, 50), (second, 110), (first, 160)):
+            db.insert_daily_flow("2026-10-07", {"A": {"name": "甲", "daily_in": count}})
+
+        for db in (first, second):
+            assert db.get_flow_between("2026-10-05", "2026-10-11")["A"]["daily_in"] == 160
+            assert db.get_flow_between("2026-10-01", "2026-10-31")["A"]["daily_in"] == 160
+            assert db.get_range_totals("2026-10-05", "2026-10-11")["A"]["daily_in"] == 160
+    finally:
+        first.close()
+        second.close()
+
+
+def test_insert_daily_flow_counts_stale_rows_separately(tmp_path):
+    db = Database(path=tmp_path / "bot.db")
+    try:
+        first = db.insert_daily_flow(
+            "2026-10-07", {"A": {"name": "甲", "daily_in": 50}}, fetched_at="2026-10-07 12:00:00"
+        )
+        assert first == {"written": 1, "skipped": 0, "stale": 0}
+
+        # 晚到的旧快照不覆盖日表，不计入 written
+        db._last_counts.clear()
+        late = db.insert_daily_flow(
+            "2026-10-07", {"A": {"name": "甲", "daily_in": 30}}, fetched_at="2026-10-07 11:00:00"
+        )
+        assert late == {"written": 0, "skipped": 0, "stale": 1}
+        assert db.get_flow_between("2026-10-07", "2026-10-07")["A"]["daily_in"] == 50
+
+        same = db.insert_daily_flow("2026-10-07", {"A": {"name": "甲", "daily_in": 50}})
+        assert same == {"written": 0, "skipped": 1, "stale": 0}
+    finally:
+        db.close()
+
+
+def test_range_totals_follow_backdated_inserts(tmp_path):
+    db = Database(path=tmp_path / "bot.db")
+    try:
+        # 乱序写入：后写的早日期要修正其后所有累计和
+        for day, count in (("2026-10-05", 10), ("2026-10-09", 40), ("2026-10-07", 25)):
+            db.insert_daily_flow(day, {"A": {"name": "甲", "daily_in": count}})
+        db.insert_daily_flow("2026-10-07", {"A": {"name": "甲", "daily_in": 30}})
+        db.insert_daily_flow("2026-10-08", {"B": {"name": "乙", "daily_in": 7}})
+
+        totals = db.get_range_totals("2026-10-06", "2026-10-09")
+        assert {code: item["daily_in"] for code, item in totals.items()} == {"A": 70, "B": 7}
+        assert db.get_range_totals("2026-10-01", "2026-10-05")["A"]["daily_in"] == 10
+        # 区间内没有数据的馆区不出现
+        assert "B" not in db.get_range_totals("2026-10-09", "2026-10-31")
+        assert db.get_total_between("2026-10-05", "2026-10-09") == 87
+        assert db.get_total_between("2026-10-08", "2026-10-08") == 7
+        assert db.get_total_between("2026-11-01", "2026-11-30") == 0
+    finally:
+        db.close()
+
+
+def test_summary_only_days_count_in_totals_after_rebuild(tmp_path):
+    db = Database(path=tmp_path / "bot.db")
+    try:
+        db.insert_daily_traffic("2026-10-01", 500)
+        db.insert_daily_flow("2026-10-02", {"A": {"name": "甲", "daily_in": 20}})
+        assert db.get_total_between("2026-10-01", "2026-10-02") == 520
+
+        db.rebuild_derived_tables()
+        assert db.get_total_between("2026-10-01", "2026-10-02") == 520
+        assert db.get_range_totals("2026-10-01", "2026-10-02")["A"]["daily_in"] == 20
+    finally:
+        db.close()
+
+
+def _traced_open(monkeypatch, **kwargs):
+    statements = []
+    real_connect = sqlite3.connect
+
+    def connect(*args, **connect_kwargs):
+        conn = real_connect(*args, **connect_kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(database.sqlite3, "connect", connect)
+    return Database(**kwargs), statements
+
+
+def test_reopening_current_database_runs_only_connection_pragmas(tmp_path, monkeypatch):
+    path = tmp_path / "bot.db"
+    db = Database(path=path)
+    db.insert_daily_flow("2026-10-07", {"A": {"name": "甲", "daily_in": 50}})
+    db.close()
+
+    db, statements = _traced_open(monkeypatch, path=path)
+    try:
+        assert all(x.startswith("PRAGMA ") for x in statements)
+        assert "PRAGMA journal_mode=WAL" not in statements
+        assert "PRAGMA user_version" in statements
+
+        # 最新计数在首次写入该日时才载入，未变化的计数仍被跳过
+        result = db.insert_daily_flow("2026-10-07", {"A": {"name": "甲", "daily_in": 50}})
+        assert result["skipped"] == 1
+    finally:
+        db.close()
+
+    readonly, statements = _traced_open(monkeypatch, path=path, readonly=True, cache_size=0)
+    try:
+        assert not any("journal_mode" in x or "synchronous" in x for x in statements)
+        assert all(x.startswith("PRAGMA ") for x in statements)
+    finally:
+        readonly.close()
@@ -0,0 +1,82 @@
+import pytest
+
+from src.bot.api import endpoint_health
+from src.bot.api.endpoint_health import STATE_CLOSED, STATE_OPEN, EndpointHealthTracker
+from src.bot.storage.database import Database
+
+PRIMARY = "http://primary"
+BACKUP = "http://backup"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"value": 1000.0}
+    monkeypatch.setattr(endpoint_health.time, "time", lambda: now["value"])
+    return now
+
+
+def test_breaker_opens_probes_once_and_recovers(clock):
+    tracker = EndpointHealthTracker(failure_threshold=3, open_seconds=300)
+    for _ in range(2):
+        tracker.record_failure(PRIMARY, 1.0)
+    assert tracker.stats(PRIMARY)["state"] == STATE_CLOSED
+
+    tracker.record_failure(PRIMARY, 1.0)
+    assert tracker.stats(PRIMARY)["state"] == STATE_OPEN
+    assert not tracker.is_available(PRIMARY)
+    assert not tracker.allow_request(PRIMARY)
+
+    # 冷却结束后半开，只放行一个探测请求
+    clock["value"] += 300
+    assert tracker.is_available(PRIMARY)
+    assert tracker.allow_request(PRIMARY)
+    assert tracker.is_probing(PRIMARY)
+    assert not tracker.allow_request(PRIMARY)
+
+    tracker.record_success(PRIMARY, 0.2)
+    stats = tracker.stats(PRIMARY)
+    assert stats["state"] == STATE_CLOSED
+    assert stats["consecutive_failures"] == 0
+    assert stats["last_success_at"] == clock["value"]
+
+
+def test_failed_probe_reopens_breaker(clock):
+    tracker = EndpointHealthTracker(failure_threshold=1, open_seconds=60)
+    tracker.record_failure(PRIMARY, 1.0)
+    clock["value"] += 60
+    assert tracker.allow_request(PRIMARY)
+
+    tracker.record_failure(PRIMARY, 1.0)
+    assert tracker.stats(PRIMARY)["state"] == STATE_OPEN
+    assert not tracker.allow_request(PRIMARY)
+
+
+def test_rank_prefers_fast_endpoints_and_puts_open_ones_last(clock):
+    tracker = EndpointHealthTracker(failure_threshold=1)
+    for latency in (0.9, 1.0, 1.1):
+        tracker.record_success(PRIMARY, latency)
+    tracker.record_success(BACKUP, 0.1)
+    assert tracker.rank([PRIMARY, BACKUP]) == [BACKUP, PRIMARY]
+
+    tracker.record_failure(BACKUP, 5.0)
+    assert tracker.rank([PRIMARY, BACKUP]) == [PRIMARY, BACKUP]
+    # 没有耗时样本的接口排在有样本的之后
+    assert tracker.rank(["http://new", PRIMARY]) == [PRIMARY, "http://new"]
+
+
+def test_state_survives_restart_and_half_open_restores_as_open(clock, tmp_path):
+    db = Database(path=tmp_path / "bot.db")
+    try:
+        tracker = EndpointHealthTracker(store=db, failure_threshold=1, open_seconds=60)
+        tracker.record_success(BACKUP, 0.3)
+        tracker.record_failure(PRIMARY, 1.0)
+        clock["value"] += 60
+        assert tracker.allow_request(PRIMARY)
+        tracker.flush()
+
+        restored = EndpointHealthTracker(store=db, failure_threshold=1, open_seconds=60)
+        assert restored.stats(PRIMARY)["state"] == STATE_OPEN
+        assert restored.stats(BACKUP)["p50"] == 0.3
+        assert restored.allow_request(PRIMARY)
+    finally:
+        db.close()
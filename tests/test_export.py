@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+import sqlite3
+
+import pytest
+
+from src.bot.storage.database import Database
+from src.bot.storage.export import export_history, iter_history, read_columnar
+
+
+def _flow(count, name="甲"):
+    return {"A": {"name": name, "daily_in": count}, "B": {"name": "乙", "daily_in": count * 2}}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "bot.db"
+    db = Database(path=path)
+    for day in range(1, 21):
+        db.insert_daily_flow(f"2026-09-{day:02d}", _flow(day * 10, name="甲, \"东门\""))
+    db.close()
+    return path
+
+
+def _sql_rows(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return [tuple(row) for row in conn.execute(sql)]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("granularity", ["snapshot", "day", "week", "month"])
+def test_columnar_round_trip(db_path, granularity):
+    handle = io.BytesIO()
+    count = export_history(
+        db_path, handle, fmt="columnar", granularity=granularity, batch_size=7
+    )
+    handle.seek(0)
+    groups = list(read_columnar(handle))
+    rows = [row for group in groups for row in group]
+
+    expected = [tuple(x) for batch in iter_history(db_path, granularity) for x in batch]
+    assert count == len(rows) == len(expected) > 0
+    assert rows == expected
+    assert max(len(group) for group in groups) <= 7
+
+
+def test_text_formats_match_columnar(db_path):
+    text = io.StringIO()
+    assert export_history(db_path, text, fmt="csv", start_date="2026-09-05", area_codes=["A"]) == 16
+    text.seek(0)
+    csv_rows = list(csv.reader(text))
+    assert csv_rows[0] == ["stat_date", "area_code", "area_name", "in_count", "fetched_at"]
+    assert csv_rows[1][:4] == ["2026-09-05", "A", "甲, \"东门\"", "50"]
+
+    text = io.StringIO()
+    export_history(db_path, text, fmt="jsonl", granularity="week", end_date="2026-09-07")
+    weeks = [json.loads(line) for line in text.getvalue().splitlines()]
+    expected = _sql_rows(
+        db_path,
+        """
+        SELECT area_code, in_count FROM traffic_rollups
+        WHERE period_type = 'week' AND start_date <= '2026-09-07'
+        ORDER BY start_date, area_code
+        """,
+    )
+    assert [(x["area_code"], x["in_count"]) for x in weeks] == expected
+
+
+def test_export_reads_one_snapshot_while_writer_is_active(db_path):
+    batches = iter_history(db_path, "day", batch_size=5)
+    first = next(batches)
+    # 读事务已开始：导出过程中写入的新数据与改写都不可见，写入也不被阻塞
+    writer = Database(path=db_path)
+    try:
+        writer.insert_daily_flow("2026-09-21", _flow(999))
+        writer.overwrite_daily_flow("2026-09-01", _flow(5), "2026-09-21 12:00:00")
+    finally:
+        writer.close()
+    rows = first + [row for batch in batches for row in batch]
+
+    assert len(rows) == 40
+    assert max(row[0] for row in rows) == "2026-09-20"
+    assert rows[0][3] == 10
+    latest = [tuple(x) for batch in iter_history(db_path, "day") for x in batch]
+    assert len(latest) == 42
+    assert latest[0][3] == 5
+
+
+def test_run_export_is_read_only(tmp_path, db_path, monkeypatch):
+    # 导入 main 会在当前目录创建日志目录
+    monkeypatch.chdir(tmp_path)
+    from src.bot.main import main
+
+    missing = tmp_path / "missing" / "bot.db"
+    with pytest.raises(SystemExit, match="数据库不存在"):
+        main(["--db-path", str(missing), "export"])
+    assert not missing.parent.exists()
+
+    old = tmp_path / "old.db"
+    conn = sqlite3.connect(old)
+    conn.execute("PRAGMA user_version=1")
+    conn.close()
+    with pytest.raises(SystemExit, match="请先执行 migrate"):
+        main(["--db-path", str(old), "export"])
+    conn = sqlite3.connect(old)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    conn.close()
+
+    output = tmp_path / "day.tfc"
+    main(["--db-path", str(db_path), "export", "--format", "columnar", "--output", str(output)])
+    with open(output, "rb") as handle:
+        assert sum(len(group) for group in read_columnar(handle)) == 40
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from src.bot.api.flow_parser import FlowParseError, StreamingFlowParser, summarize_location
+
+WANTED = {"CN-ZJLIB_ZJ": "之江馆", "CN-ZJLIB_BSL": "大学路馆"}
+
+RESPONSE = {
+    "message": 'ok "quoted" {not an object} [nor an array] \\ 中文',
+    "isSuccess": True,
+    "data": [
+        {
+            # 不需要的馆区：字段中的括号、引号与转义都不能打乱跳过
+            "orgLocation": "CN-OTHER",
+            "orgLocationName": 'x{"]}\\"',
+            "fCount": [{"countType": "日", "dateType": 0, "personCount": 999}],
+            "extra": {"nested": [[{"a": "}"}], "\\\\"]},
+        },
+        {
+            # orgLocation 出现在 fCount 之后
+            "orgLocationName": "大学路馆 \"东门\"",
+            "fCount": [
+                {"countType": "日", "dateType": 0, "personCount": 12},
+                {"countType": "周", "dateType": 0, "personCount": 345},
+                {"countType": "总", "dateType": 1, "personCount": 6789012},
+                "broken",
+            ],
+            "remark": None,
+            "orgLocation": "CN-ZJLIB_BSL",
+        },
+        {
+            "orgLocation": "CN-ZJLIB_ZJ",
+            "orgLocationName": "之江馆",
+            "fCount": [
+                {"countType": "日", "dateType": 0, "personCount": 1234},
+                {"countType": "月", "dateType": 0, "personCount": 56789},
+                {"countType": "年", "dateType": 0, "personCount": -1.5e3},
+            ],
+        },
+        "not an object",
+    ],
+    "total": 3,
+}
+
+
+def _expected():
+    flow = {}
+    for library in RESPONSE["data"]:
+        if isinstance(library, dict) and library.get("orgLocation") in WANTED:
+            counts = [x for x in library["fCount"] if isinstance(x, dict)]
+            flow[library["orgLocation"]] = summarize_location(library["orgLocationName"], counts)
+    return {"isSuccess": True, "flow": flow}
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_every_chunk_split_gives_the_same_result(indent):
+    # 按字节切分会把多字节字符、转义序列与字符串拆到两块中
+    raw = json.dumps(RESPONSE, ensure_ascii=False, indent=indent).encode("utf-8")
+    expected = _expected()
+    parser = StreamingFlowParser(WANTED)
+    for size in range(1, 80):
+        assert parser.parse(_chunks(raw, size)) == expected, size
+    assert parser.parse([raw]) == expected
+    assert parser.parse(_chunks(raw.decode("utf-8"), 7)) == expected
+
+
+def test_without_filter_parses_every_location():
+    raw = json.dumps(RESPONSE).encode("utf-8")
+    flow = StreamingFlowParser().parse(_chunks(raw, 5))["flow"]
+    assert set(flow) == {"CN-OTHER", "CN-ZJLIB_BSL", "CN-ZJLIB_ZJ"}
+    assert flow["CN-OTHER"]["daily_in"] == 999
+
+
+def test_failed_response_reports_not_successful():
+    raw = json.dumps({"isSuccess": False, "data": None}).encode("utf-8")
+    assert StreamingFlowParser(WANTED).parse(_chunks(raw, 3)) == {"isSuccess": False, "flow": {}}
+
+
+@pytest.mark.parametrize("cut", [1, 40, 200, -2])
+def test_truncated_response_raises(cut):
+    raw = json.dumps(RESPONSE, ensure_ascii=False).encode("utf-8")[:cut]
+    with pytest.raises(FlowParseError):
+        StreamingFlowParser(WANTED).parse(_chunks(raw, 16))
@@ -0,0 +1,71 @@
+import json
+import os
+from datetime import date
+
+from src.bot.service.holiday_calendar import HolidayCalendar
+
+
+def _write(path, ranges, mtime_ns=None):
+    path.write_text(json.dumps({"ranges": ranges}, ensure_ascii=False), encoding="utf-8")
+    if mtime_ns is not None:
+        # 同一时间粒度内连续写入时 mtime 可能不变，显式设置
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_lookup_handles_overlapping_and_invalid_ranges(tmp_path):
+    path = tmp_path / "holiday_ranges.json"
+    _write(
+        path,
+        [
+            {"name": "国庆节", "start_date": "2026-10-01", "end_date": "2026-10-08"},
+            {"name": "调休", "start_date": "2026-10-03", "end_date": "2026-10-04"},
+            {"name": "春节", "start_date": "2026-02-15", "end_date": "2026-02-23"},
+            {"name": "倒置", "start_date": "2026-05-05", "end_date": "2026-05-01"},
+            {"name": "格式错误", "start_date": "2026/06/01", "end_date": "2026-06-02"},
+            {"name": "缺结束日", "start_date": "2026-07-01"},
+        ],
+    )
+    calendar = HolidayCalendar(path)
+
+    assert [x["name"] for x in calendar.ranges()] == ["春节", "国庆节", "调休"]
+    assert [x["name"] for x in calendar.ranges_containing("2026-10-03")] == ["国庆节", "调休"]
+    assert calendar.holiday_containing(date(2026, 10, 5))["name"] == "国庆节"
+    assert calendar.is_holiday("2026-02-15")
+    assert not calendar.is_holiday("2026-02-24")
+    assert not calendar.is_holiday("2026-05-03")
+    assert [x["name"] for x in calendar.ranges_ending_on(date(2026, 10, 4))] == ["调休"]
+    assert calendar.ranges_ending_on("2026-10-05") == []
+
+
+def test_reloads_only_when_file_changes(tmp_path):
+    path = tmp_path / "holiday_ranges.json"
+    _write(
+        path,
+        [{"name": "元旦", "start_date": "2026-01-01", "end_date": "2026-01-03"}],
+        mtime_ns=1_000_000_000,
+    )
+    calendar = HolidayCalendar(path)
+    assert calendar.refresh()
+    version = calendar.version
+    assert not calendar.refresh()
+    assert calendar.version == version
+
+    _write(
+        path,
+        [{"name": "劳动节", "start_date": "2026-05-01", "end_date": "2026-05-05"}],
+        mtime_ns=2_000_000_000,
+    )
+    assert calendar.is_holiday("2026-05-03")
+    assert not calendar.is_holiday("2026-01-02")
+    assert calendar.version == version + 1
+
+    path.unlink()
+    assert calendar.ranges() == []
+
+
+def test_unreadable_config_yields_no_ranges(tmp_path):
+    path = tmp_path / "holiday_ranges.json"
+    path.write_text("{not json", encoding="utf-8")
+    calendar = HolidayCalendar(path)
+    assert calendar.ranges() == []
+    assert HolidayCalendar(tmp_path / "missing.json").ranges() == []
@@ -0,0 +1,140 @@
+import json
+import re
+import time
+
+import pytest
+
+from src.bot.api.flow_parser import StreamingFlowParser
+from src.bot.api.traffic_api import TrafficAPI
+from src.bot.metrics import METRIC_NAME, METRICS, StageMetrics
+
+PRIMARY = "http://primary/api"
+BACKUP = "http://backup/api"
+
+
+def test_disabled_metrics_pass_through():
+    metrics = StageMetrics()
+
+    @metrics.timed("stage")
+    def work(value):
+        return value * 2
+
+    assert work(3) == 6
+    with metrics.timer("stage"):
+        pass
+    metrics.observe("stage", 1.0)
+    assert metrics.take_run() == []
+    assert f"{METRIC_NAME}_count" not in metrics.render()
+
+
+def test_take_run_drains_only_the_run_histograms():
+    metrics = StageMetrics(enabled=True, buckets=(0.1, 1))
+    metrics.observe("fetch_flow_data", 0.05, "primary")
+    metrics.observe("fetch_flow_data", 0.5, "primary")
+    metrics.observe("fetch_flow_data", 3, "primary")
+
+    [row] = metrics.take_run()
+    assert row["stage"] == "fetch_flow_data"
+    assert row["endpoint"] == "primary"
+    assert row["count"] == 3
+    assert row["total_seconds"] == pytest.approx(3.55)
+    assert row["max_seconds"] == 3
+    assert json.loads(row["buckets"]) == [1, 1, 1]
+    assert metrics.take_run() == []
+
+    # 累计直方图不随运行清空
+    assert f'{METRIC_NAME}_count{{stage="fetch_flow_data",endpoint="primary"}} 3' in metrics.render()
+
+
+def test_render_uses_prometheus_text_format():
+    metrics = StageMetrics(enabled=True, buckets=(0.1, 1))
+    metrics.observe("webhook", 0.05, 'a"b\\c')
+    metrics.observe("webhook", 0.5, 'a"b\\c')
+    metrics.observe("run_once", 2)
+
+    lines = metrics.render().splitlines()
+    assert lines[:2] == [
+        f"# HELP {METRIC_NAME} 各阶段耗时（秒）",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    labels = 'stage="webhook",endpoint="a\\"b\\\\c"'
+    assert f'{METRIC_NAME}_bucket{{{labels},le="0.1"}} 1' in lines
+    assert f'{METRIC_NAME}_bucket{{{labels},le="1"}} 2' in lines
+    assert f'{METRIC_NAME}_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f"{METRIC_NAME}_sum{{{labels}}} 0.550000" in lines
+    assert f'{METRIC_NAME}_bucket{{stage="run_once",endpoint="",le="1"}} 0' in lines
+    sample = re.compile(rf'^{METRIC_NAME}_(bucket|sum|count)\{{[^}}]*\}} [0-9.]+$')
+    assert all(sample.match(line) for line in lines[2:])
+
+
+def test_write_textfile_replaces_file(tmp_path):
+    metrics = StageMetrics(enabled=True, textfile=tmp_path / "prom" / "flow.prom")
+    metrics.observe("run_once", 1)
+    metrics.write_textfile()
+    assert (tmp_path / "prom" / "flow.prom").read_text(encoding="utf-8") == metrics.render()
+    assert [x.name for x in (tmp_path / "prom").iterdir()] == ["flow.prom"]
+
+
+class SlowResponse:
+    """每块之间等待 delay 秒，模拟慢速上游"""
+
+    def __init__(self, body, delay):
+        self.body = body
+        self.delay = delay
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            time.sleep(self.delay)
+            yield self.body[i:i + chunk_size]
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+
+    def post(self, url, json=None, timeout=None, stream=False):
+        return self.response
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    monkeypatch.setattr(METRICS, "enabled", True)
+    monkeypatch.setattr(METRICS, "_totals", {})
+    monkeypatch.setattr(METRICS, "_run", {})
+    return METRICS
+
+
+def test_streaming_parse_time_excludes_network_wait(metrics):
+    body = json.dumps(
+        {
+            "isSuccess": True,
+            "data": [
+                {
+                    "orgLocation": "A",
+                    "orgLocationName": "甲",
+                    "fCount": [{"countType": "日", "dateType": 0, "personCount": 12}],
+                }
+            ],
+        }
+    ).encode("utf-8")
+    api = TrafficAPI(
+        PRIMARY, BACKUP, {}, {}, parser=StreamingFlowParser({"A": "甲"}), chunk_size=16
+    )
+    chunks = -(-len(body) // 16)
+    api._sessions[PRIMARY] = FakeSession(SlowResponse(body, delay=0.01))
+
+    assert api._fetch_url(PRIMARY)["flow"]["A"]["daily_in"] == 12
+    rows = {(x["stage"], x["endpoint"]): x for x in metrics.take_run()}
+    fetch = rows[("fetch_flow_data", "primary")]
+    parse = rows[("parse_daily_flow", "primary")]
+    assert fetch["total_seconds"] >= 0.01 * chunks
+    assert 0 <= parse["total_seconds"] < 0.01
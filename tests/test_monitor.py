@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.bot.service.outbox import OutboxSender
+from src.bot.service.subscriptions import Subscription, SubscriptionRegistry
+from src.bot.service.traffic_service import LibraryFlowMonitor
+from src.bot.storage.connections import ConnectionManager
+from src.bot.storage.database import Database
+
+NOW = datetime(2026, 10, 2, 10, 0, 0)
+
+
+class FakeApi:
+    """按顺序返回预置的 flow，代替 TrafficAPI"""
+
+    def __init__(self, flows=()):
+        self.flows = list(flows)
+        self.payload = {"orgLocations": ["A"]}
+        self.archive = None
+
+    def fetch(self, payload=None, flush=True):
+        if not self.flows:
+            return None
+        return {"isSuccess": True, "flow": self.flows.pop(0)}
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _flow(count):
+    return {"A": {"name": "甲", "daily_in": count}}
+
+
+def _write_holidays(path, ranges, mtime_ns):
+    path.write_text(json.dumps({"ranges": ranges}, ensure_ascii=False), encoding="utf-8")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(path=tmp_path / "bot.db", now_func=lambda: NOW)
+    yield db
+    db.close()
+
+
+def _monitor(db, api, tmp_path, **kwargs):
+    return LibraryFlowMonitor(
+        db=db,
+        api=api,
+        holiday_config_path=tmp_path / "holiday_ranges.json",
+        detect_anomalies=False,
+        now_func=lambda: NOW,
+        **kwargs,
+    )
+
+
+def test_intraday_collection_picks_up_new_holiday_config(db, tmp_path):
+    db.insert_daily_flow("2026-10-01", _flow(50))
+    api = FakeApi([_flow(10), _flow(860)])
+    monitor = _monitor(db, api, tmp_path)
+    assert monitor.collect_intraday() == _flow(10)
+
+    # 常驻进程运行中新增节假日配置，不重启
+    holiday = {"name": "国庆节", "start_date": "2026-10-01", "end_date": "2026-10-08"}
+    _write_holidays(tmp_path / "holiday_ranges.json", [holiday], 2_000_000_000)
+    assert monitor.collect_intraday() == _flow(860)
+
+    row = db.conn.execute(
+        "SELECT in_count FROM traffic_rollups WHERE period_type = 'holiday' AND area_code = 'A'"
+    ).fetchone()
+    assert row["in_count"] == 910
+    assert db.get_flow_between("2026-10-01", "2026-10-08")["A"]["daily_in"] == 910
+
+
+class FakeChatbot:
+    def __init__(self, errcode=0):
+        self.errcode = errcode
+        self.sent = []
+
+    def send_markdown(self, title, text, is_at_all=False):
+        self.sent.append(title)
+        return {"errcode": self.errcode, "errmsg": "rejected" if self.errcode else "ok"}
+
+
+def _outbox(db):
+    return [
+        (row["channel"], row["status"])
+        for row in db.conn.execute("SELECT channel, status FROM report_outbox ORDER BY id")
+    ]
+
+
+def test_failed_channel_is_re_enqueued_alone(db, tmp_path):
+    for day in range(5, 12):
+        db.insert_daily_flow(f"2026-10-{day:02d}", _flow(day))
+    ok, failing = FakeChatbot(), FakeChatbot(errcode=310000)
+    subscriptions = SubscriptionRegistry([Subscription("a", ok), Subscription("b", failing)])
+    sender = OutboxSender(
+        subscriptions.chatbots(), db_factory=lambda: db, max_attempts=1, now_func=lambda: NOW
+    )
+    monitor = _monitor(db, FakeApi(), tmp_path, outbox=sender, subscriptions=subscriptions)
+    week = ("weekly", "2026-10-05", "2026-10-11")
+    try:
+        monitor._send_aggregated_report(*week)
+        # 两个群都已入队，再次触发不重复入队
+        monitor._send_aggregated_report(*week)
+        assert _outbox(db) == [("a", "pending"), ("b", "pending")]
+
+        assert sender.process_due(db) == 2
+        assert _outbox(db) == [("a", "sent"), ("b", "failed")]
+        assert not db.has_report_sent(*week)
+
+        failing.errcode = 0
+        monitor._send_aggregated_report(*week)
+        assert _outbox(db) == [("a", "sent"), ("b", "failed"), ("b", "pending")]
+        assert sender.process_due(db) == 1
+        assert db.has_report_sent(*week)
+        assert len(ok.sent) == 1
+    finally:
+        sender.stop()
+
+
+def test_report_reads_go_through_reader(tmp_path, capsys):
+    connections = ConnectionManager(tmp_path / "bot.db", readers=1, now_func=lambda: NOW)
+    borrows = []
+
+    def reader():
+        borrows.append(threading.current_thread().name)
+        return connections.reader()
+
+    try:
+        db = connections.db()
+        for day in range(5, 12):
+            db.insert_daily_flow(f"2026-10-{day:02d}", _flow(day))
+        monitor = _monitor(db, FakeApi(), tmp_path, reader=reader)
+        monitor._send_aggregated_report("weekly", "2026-10-05", "2026-10-11")
+        assert borrows == ["MainThread"]
+        assert "浙图人流周报" in capsys.readouterr().out
+    finally:
+        connections.close()
+
+
+def test_trend_section_follows_subscribed_areas(db, tmp_path):
+    day = datetime(2025, 8, 1).date()
+    while day <= NOW.date():
+        db.insert_daily_flow(
+            day.isoformat(),
+            {
+                "A": {"name": "甲", "daily_in": 100 if day.year == 2026 else 50},
+                "B": {"name": "乙", "daily_in": 300},
+            },
+        )
+        day += timedelta(days=1)
+    monitor = _monitor(db, FakeApi(), tmp_path)
+    series = monitor._load_series(db, "2026-09-21", "2026-09-27")
+
+    flow = {"A": {"name": "甲", "daily_in": 700}}
+    lines = monitor._trend_lines(series, "weekly", "2026-09-21", "2026-09-27", flow)
+    assert lines == [
+        "---",
+        "**趋势**",
+        "- 日均进馆：100",
+        '- 去年同期：350（<font color="red">同比+100%</font>）',
+        '- 上月同期：700（<font color="red">环比+0%</font>）',
+        "- 近四周日均：100",
+    ]
+
+    flow["B"] = {"name": "乙", "daily_in": 2100}
+    lines = monitor._trend_lines(series, "weekly", "2026-09-21", "2026-09-27", flow)
+    assert lines[2] == "- 日均进馆：400"
+    assert lines[3] == '- 去年同期：2,450（<font color="red">同比+14.3%</font>）'
+    assert lines[-1] == "- 馆区排名：乙 2,100 > 甲 700"
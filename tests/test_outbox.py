@@ -0,0 +1,152 @@
+from datetime import datetime
+
+import pytest
+
+from src.bot.service.outbox import OutboxSender, SlidingWindowLimiter
+from src.bot.storage.database import Database
+
+NOW = datetime(2026, 10, 11, 20, 0, 0)
+
+
+class FakeChatbot:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = []
+
+    def send_markdown(self, title, text, is_at_all=False):
+        self.sent.append(title)
+        if self.errors:
+            error = self.errors.pop(0)
+            if isinstance(error, Exception):
+                raise error
+            return {"errcode": error, "errmsg": "rejected"}
+        return {"errcode": 0}
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(path=tmp_path / "bot.db", now_func=lambda: NOW)
+    yield db
+    db.close()
+
+
+def _sender(chatbots, db, **kwargs):
+    return OutboxSender(chatbots, db_factory=lambda: db, now_func=lambda: NOW, **kwargs)
+
+
+def test_fanned_out_report_is_sent_only_after_every_channel(db):
+    ok, failing = FakeChatbot(), FakeChatbot(errors=[310000])
+    sender = _sender({"a": ok, "b": failing}, db, base_delay=0)
+    db.enqueue_reports(
+        [
+            (channel, "weekly", "2026-10-05", "2026-10-11", "浙图人流周报", "text")
+            for channel in ("a", "b")
+        ]
+    )
+    try:
+        assert sender.process_due(db) == 2
+        assert not db.has_report_sent("weekly", "2026-10-05", "2026-10-11")
+        assert db.count_undelivered_channels("weekly", "2026-10-05", "2026-10-11") == 1
+
+        assert sender.process_due(db) == 1
+        assert db.has_report_sent("weekly", "2026-10-05", "2026-10-11")
+        assert len(ok.sent) == 1
+    finally:
+        sender.stop()
+
+
+def _outbox_rows(db):
+    return [
+        dict(row)
+        for row in db.conn.execute(
+            "SELECT id, status, attempts, next_attempt_at, last_error FROM report_outbox ORDER BY id"
+        )
+    ]
+
+
+def test_failures_back_off_exponentially_then_dead_letter(db):
+    chatbot = FakeChatbot(errors=[RuntimeError("timeout"), 130101, 130101])
+    sender = _sender(chatbot, db, base_delay=5, max_attempts=3)
+    db.enqueue_report("weekly", "2026-10-05", "2026-10-11", "浙图人流周报", "text")
+    try:
+        assert sender.process_due(db) == 1
+        row = _outbox_rows(db)[0]
+        assert (row["status"], row["attempts"]) == ("pending", 1)
+        assert row["next_attempt_at"] == "2026-10-11 20:00:05"
+        assert row["last_error"] == "timeout"
+
+        # 未到重试时间不会再发
+        assert sender.process_due(db) == 0
+
+        sender.now_func = lambda: datetime(2026, 10, 11, 20, 0, 5)
+        assert sender.process_due(db) == 1
+        row = _outbox_rows(db)[0]
+        assert row["attempts"] == 2
+        assert row["next_attempt_at"] == "2026-10-11 20:00:15"
+        assert row["last_error"].startswith("errcode=130101")
+
+        sender.now_func = lambda: datetime(2026, 10, 11, 20, 0, 15)
+        assert sender.process_due(db) == 1
+        assert _outbox_rows(db)[0]["status"] == "failed"
+        assert sender.process_due(db) == 0
+        assert not db.has_report_sent("weekly", "2026-10-05", "2026-10-11")
+        # 已放弃的消息不再拦截重新入队
+        assert db.queued_outbox_channels("weekly", "2026-10-05", "2026-10-11") == set()
+    finally:
+        sender.stop()
+
+
+def test_successful_sends_are_recorded(db):
+    chatbot = FakeChatbot()
+    sender = _sender(chatbot, db)
+    db.enqueue_report("daily", "2026-10-11", "2026-10-11", "浙图人流日报", "text")
+    db.enqueue_report("weekly", "2026-10-05", "2026-10-11", "浙图人流周报", "text")
+    try:
+        assert sender.drain(db) == 0
+        assert [row["status"] for row in _outbox_rows(db)] == ["sent", "sent"]
+        assert chatbot.sent == ["浙图人流日报", "浙图人流周报"]
+        assert db.has_report_sent("weekly", "2026-10-05", "2026-10-11")
+        # 日报不参与去重，不写发送记录
+        assert not db.has_report_sent("daily", "2026-10-11", "2026-10-11")
+    finally:
+        sender.stop()
+
+
+def test_unknown_channel_is_retried_not_sent(db):
+    sender = _sender({"a": FakeChatbot()}, db)
+    db.enqueue_report("weekly", "2026-10-05", "2026-10-11", "浙图人流周报", "text", channel="b")
+    try:
+        assert sender.process_due(db) == 1
+        row = _outbox_rows(db)[0]
+        assert (row["status"], row["last_error"]) == ("pending", "未配置机器人: b")
+    finally:
+        sender.stop()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_no_sixty_second_window_exceeds_the_limit():
+    clock = FakeClock()
+    limiter = SlidingWindowLimiter(rate_per_minute=20, clock=clock)
+    sent = []
+    # 一直有消息待发：取不到时按返回的等待时间推进时钟
+    while clock.now < 300:
+        wait_seconds = limiter.try_acquire()
+        if wait_seconds == 0:
+            sent.append(clock.now)
+        else:
+            assert wait_seconds > 0
+            clock.now += wait_seconds
+
+    assert len(sent) == 20 * 5
+    for index, started in enumerate(sent):
+        in_window = [x for x in sent[index:] if x - started < 60]
+        assert len(in_window) <= 20
+    # 前 60 秒内最多 20 条，第 21 条要等第一条移出窗口
+    assert sent[20] == 60
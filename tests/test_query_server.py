@@ -0,0 +1,118 @@
+import json
+import threading
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from src.bot.service.query_server import QueryServer, QueryService
+from src.bot.storage.database import Database
+
+
+def test_reprocess_changes_etag_and_body(tmp_path):
+    path = tmp_path / "bot.db"
+    db = Database(path=path)
+    service = QueryService(db_path=path, readers=1, check_interval=0)
+    try:
+        db.insert_daily_flow("2026-10-07", {"A": {"name": "甲", "daily_in": 10}})
+        target = "/api/flow?start=2026-10-07&end=2026-10-07"
+        status, headers, body = service.handle(target)
+        assert status == 200
+        assert json.loads(body)["total_in"] == 10
+
+        # 归档重放只覆盖日表并重建派生表，不追加快照
+        db.overwrite_daily_flow(
+            "2026-10-07", {"A": {"name": "甲", "daily_in": 99}}, "2026-10-07 12:00:00"
+        )
+        db.rebuild_derived_tables()
+
+        status, new_headers, body = service.handle(target, headers["ETag"])
+        assert status == 200
+        assert new_headers["ETag"] != headers["ETag"]
+        assert json.loads(body)["total_in"] == 99
+    finally:
+        service.close()
+        db.close()
+
+
+@pytest.fixture
+def service(tmp_path):
+    path = tmp_path / "bot.db"
+    db = Database(path=path)
+    db.insert_daily_flow(
+        "2026-10-07", {"A": {"name": "甲", "daily_in": 10}, "B": {"name": "乙", "daily_in": 5}}
+    )
+    db.close()
+    service = QueryService(db_path=path, readers=2, check_interval=0)
+    yield service
+    service.close()
+
+
+def test_unchanged_data_answers_304_until_a_write(service):
+    target = "/api/flow?start=2026-10-01&end=2026-10-31&area=A"
+    status, headers, body = service.handle(target)
+    assert status == 200
+    assert json.loads(body)["areas"] == [{"area_code": "A", "name": "甲", "in_count": 10}]
+    assert headers["X-Last-Ingest"]
+
+    status, _, body = service.handle(target, f'"other", {headers["ETag"]}')
+    assert (status, body) == (304, b"")
+    status, _, _ = service.handle(target)
+    assert status == 200
+    assert service.stats == {"hits": 1, "misses": 1, "not_modified": 1}
+
+    # 参数相同顺序不同视为同一个键，不同参数 ETag 不同
+    same = service.handle("/api/flow?area=A&end=2026-10-31&start=2026-10-01")[1]["ETag"]
+    assert same == headers["ETag"]
+    assert service.handle("/api/latest")[1]["ETag"] != headers["ETag"]
+
+    db = Database(path=service.connections.path)
+    try:
+        db.insert_daily_flow("2026-10-08", {"A": {"name": "甲", "daily_in": 7}})
+    finally:
+        db.close()
+    status, new_headers, body = service.handle(target, headers["ETag"])
+    assert status == 200
+    assert new_headers["ETag"] != headers["ETag"]
+    assert json.loads(body)["total_in"] == 17
+
+
+def test_version_is_checked_at_most_once_per_interval(service):
+    service.check_interval = 3600
+    version, _ = service.version()
+    db = Database(path=service.connections.path)
+    try:
+        db.mark_report_sent("weekly", "2026-10-05", "2026-10-11")
+    finally:
+        db.close()
+    assert service.version()[0] == version
+    service.check_interval = 0
+    assert service.version()[0] != version
+
+
+def test_bad_requests_are_not_cached(service):
+    assert service.handle("/api/nope")[0] == 404
+    assert service.handle("/api/flow?start=2026-10-09&end=2026-10-01")[0] == 400
+    assert service.handle("/api/series?start=2026-13-01&end=2026-10-01")[0] == 400
+    assert service.handle("/api/reports?limit=x")[0] == 400
+    assert service._cache == {}
+    assert service._key_locks == {}
+
+
+def test_http_server_sends_etag_and_304(service):
+    server = QueryServer(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/api/series?start=2026-10-07&end=2026-10-07"
+    try:
+        with urlopen(url) as response:
+            etag = response.headers["ETag"]
+            payload = json.loads(response.read())
+        assert payload["areas"]["B"] == {"name": "乙", "dates": ["2026-10-07"], "counts": [5]}
+
+        with pytest.raises(HTTPError) as excinfo:
+            urlopen(Request(url, headers={"If-None-Match": etag}))
+        assert excinfo.value.code == 304
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,113 @@
+import json
+from datetime import date, datetime
+
+import pytest
+
+from src.bot.service.replay import ReplayClock, replay
+from src.bot.storage.database import Database
+
+LIBRARIES = {"A": "甲", "B": "乙"}
+
+
+@pytest.fixture
+def holidays(tmp_path):
+    path = tmp_path / "holiday_ranges.json"
+    path.write_text(
+        json.dumps(
+            {"ranges": [{"name": "国庆节", "start_date": "2026-10-01", "end_date": "2026-10-07"}]},
+            ensure_ascii=False,
+        ),
+        encoding="utf-8",
+    )
+    return path
+
+
+def test_clock_is_moved_only_by_hand():
+    clock = ReplayClock(datetime(2026, 10, 4, 21, 0))
+    assert clock() == datetime(2026, 10, 4, 21, 0)
+    assert clock.advance(hours=3) == datetime(2026, 10, 5, 0, 0)
+    assert clock.set(datetime(2026, 1, 1)) == clock()
+
+
+def test_synthetic_replay_triggers_reports_on_schedule(holidays):
+    messages, stats = replay(
+        date(2026, 9, 28),
+        date(2026, 10, 12),
+        library_codes=LIBRARIES,
+        holiday_config_path=holidays,
+        seed=1,
+    )
+    assert (stats["days"], stats["failed"], stats["messages"]) == (15, 0, 18)
+    # 每条消息的时间取自回放时钟，而不是真实时间
+    assert all(x["sent_at"].endswith(" 21:00:00") for x in messages)
+    others = [(x["sent_at"][:10], x["title"]) for x in messages if x["title"] != "浙图人流日报"]
+    assert others == [
+        ("2026-10-04", "浙图人流周报"),
+        ("2026-10-07", "浙图人流节假日报（国庆节）"),
+        ("2026-10-11", "浙图人流周报"),
+    ]
+
+    again, _ = replay(
+        date(2026, 9, 28),
+        date(2026, 10, 12),
+        library_codes=LIBRARIES,
+        holiday_config_path=holidays,
+        seed=1,
+    )
+    assert again == messages
+    changed, _ = replay(
+        date(2026, 9, 28),
+        date(2026, 10, 12),
+        library_codes=LIBRARIES,
+        holiday_config_path=holidays,
+        seed=2,
+    )
+    assert [x["text"] for x in changed] != [x["text"] for x in messages]
+
+
+def test_history_replay_reads_source_without_writing(tmp_path, holidays):
+    source = tmp_path / "source.db"
+    db = Database(path=source)
+    try:
+        for day, count in (("2026-10-05", 1234), ("2026-10-06", 4321)):
+            db.insert_daily_flow(day, {"A": {"name": "甲", "daily_in": count}})
+    finally:
+        db.close()
+    before = source.read_bytes()
+
+    messages, stats = replay(
+        date(2026, 10, 5),
+        date(2026, 10, 7),
+        source="history",
+        source_db=source,
+        holiday_config_path=holidays,
+    )
+    # 源库中没有的日期视为接口无数据
+    assert (stats["days"], stats["failed"]) == (3, 1)
+    assert [x["sent_at"][:10] for x in messages] == ["2026-10-05", "2026-10-06"]
+    assert "1,234" in messages[0]["text"]
+    assert source.read_bytes() == before
+
+    with pytest.raises(ValueError):
+        replay(date(2026, 10, 5), date(2026, 10, 5), source="history")
+
+
+def test_replay_command_writes_messages_and_refuses_production_db(tmp_path, monkeypatch, capsys):
+    # 导入 main 会在当前目录创建日志目录
+    monkeypatch.chdir(tmp_path)
+    from src.bot.main import main
+
+    production = tmp_path / "bot.db"
+    with pytest.raises(SystemExit, match="回放不能写入正式库"):
+        main(["--db-path", str(production), "replay", "--start", "2026-10-05",
+              "--end", "2026-10-11", "--db", str(production)])
+    assert not production.exists()
+
+    output = tmp_path / "messages.jsonl"
+    main(["--db-path", str(production), "replay", "--start", "2026-10-05",
+          "--end", "2026-10-11", "--output", str(output)])
+    lines = [json.loads(x) for x in output.read_text(encoding="utf-8").splitlines()]
+    assert [x["title"] for x in lines].count("浙图人流周报") == 1
+    assert len(lines) == 8
+    assert "回放 7 天，失败 0 天，消息 8 条" in capsys.readouterr().out
+    assert not production.exists()
@@ -0,0 +1,128 @@
+import random
+from datetime import date, timedelta
+
+from src.bot.storage.database import Database
+from src.bot.storage.rollups import (
+    PERIOD_HOLIDAY,
+    PERIOD_MONTH,
+    PERIOD_WEEK,
+    PERIOD_YEAR,
+    calendar_periods,
+    cover_range,
+    holiday_key,
+)
+
+HOLIDAY = {"start_date": "2026-10-01", "end_date": "2026-10-08", "name": "国庆节"}
+
+
+def _days(start, end):
+    day = date.fromisoformat(start)
+    while day <= date.fromisoformat(end):
+        yield day.isoformat()
+        day += timedelta(days=1)
+
+
+def _period_bounds(start_date, end_date):
+    bounds = {}
+    for day in _days(start_date, end_date):
+        for period_type, period_key, start, end in calendar_periods(day):
+            bounds[(period_type, period_key)] = (start, end)
+    return bounds
+
+
+def _covered_days(start_date, end_date, bounds):
+    """把 cover_range 的结果展开为日期列表，用于检查不重不漏"""
+    periods, day_spans = cover_range(start_date, end_date)
+    days = []
+    for period in periods:
+        days.extend(_days(*bounds[period]))
+    for span in day_spans:
+        days.extend(_days(*span))
+    return sorted(days)
+
+
+def test_cover_range_uses_coarsest_periods():
+    assert cover_range("2025-01-01", "2025-12-31") == ([(PERIOD_YEAR, "2025")], [])
+    assert cover_range("2026-10-01", "2026-10-31") == ([(PERIOD_MONTH, "2026-10")], [])
+    assert cover_range("2026-10-05", "2026-10-11") == ([(PERIOD_WEEK, "2026-W41")], [])
+    assert cover_range("2026-10-07", "2026-10-09") == ([], [("2026-10-07", "2026-10-09")])
+    assert cover_range("2026-10-09", "2026-10-07") == ([], [])
+
+
+def test_cover_range_prefers_month_over_week_crossing_into_it():
+    # 2026-09-28 所在周跨入十月，十月完整落在区间内时该周按天补齐
+    periods, day_spans = cover_range("2026-09-28", "2026-10-31")
+    assert periods == [(PERIOD_MONTH, "2026-10")]
+    assert day_spans == [("2026-09-28", "2026-09-30")]
+
+
+def test_cover_range_matches_exact_holiday():
+    assert cover_range("2026-10-01", "2026-10-08", [HOLIDAY]) == (
+        [(PERIOD_HOLIDAY, holiday_key(HOLIDAY))],
+        [],
+    )
+
+
+def test_cover_range_covers_every_day_exactly_once():
+    bounds = _period_bounds("2024-01-01", "2027-12-31")
+    rng = random.Random(7)
+    base = date(2024, 1, 1)
+    for _ in range(200):
+        start = base + timedelta(days=rng.randrange(0, 1000))
+        end = start + timedelta(days=rng.randrange(0, 400))
+        expected = list(_days(start.isoformat(), end.isoformat()))
+        assert _covered_days(start.isoformat(), end.isoformat(), bounds) == expected
+
+
+def test_flow_between_matches_daily_sums(tmp_path):
+    db = Database(path=tmp_path / "bot.db")
+    try:
+        db.set_holiday_ranges([HOLIDAY])
+        rng = random.Random(11)
+        counts = {}
+        for day in _days("2025-12-01", "2026-11-30"):
+            flow = {}
+            for code in ("A", "B"):
+                counts[(day, code)] = rng.randrange(0, 1000)
+                flow[code] = {"name": code, "daily_in": counts[(day, code)]}
+            db.insert_daily_flow(day, flow)
+        # 回溯修正已汇总的日期
+        db.insert_daily_flow("2026-10-03", {"A": {"name": "A", "daily_in": 5000}})
+        counts[("2026-10-03", "A")] = 5000
+
+        for start, end in (
+            ("2026-01-01", "2026-06-30"),
+            ("2025-12-15", "2026-02-03"),
+            ("2026-10-01", "2026-10-08"),
+            ("2026-09-28", "2026-11-30"),
+        ):
+            flow = db.get_flow_between(start, end)
+            for code in ("A", "B"):
+                expected = sum(counts[(day, code)] for day in _days(start, end))
+                assert flow[code]["daily_in"] == expected
+    finally:
+        db.close()
+
+
+def test_holiday_registered_by_another_process_reaches_collector_writes(tmp_path):
+    path = tmp_path / "bot.db"
+    collector = Database(path=path)
+    cron = Database(path=path)
+    try:
+        collector.insert_daily_flow("2026-10-01", {"A": {"name": "A", "daily_in": 50}})
+        collector.insert_daily_flow("2026-10-02", {"A": {"name": "A", "daily_in": 10}})
+        # 常驻采集进程启动后，定时任务进程才登记新的节假日
+        cron.set_holiday_ranges([HOLIDAY])
+        collector.insert_daily_flow("2026-10-02", {"A": {"name": "A", "daily_in": 860}})
+        collector.insert_daily_flow("2026-10-09", {"A": {"name": "A", "daily_in": 3}})
+
+        for db in (cron, collector):
+            assert db.get_flow_between("2026-10-01", "2026-10-08")["A"]["daily_in"] == 910
+
+        # 移除登记后区间按日表拼出，结果不变
+        cron.set_holiday_ranges([])
+        collector.rebuild_derived_tables()
+        assert cron.get_flow_between("2026-10-01", "2026-10-09")["A"]["daily_in"] == 913
+    finally:
+        collector.close()
+        cron.close()
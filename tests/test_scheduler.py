@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from src.bot.service import scheduler as scheduler_module
+from src.bot.service.scheduler import DailyTrigger, Scheduler
+
+
+def test_jitter_larger_than_misfire_grace_still_runs(monkeypatch):
+    monkeypatch.setattr(scheduler_module.random, "uniform", lambda low, high: high)
+    times = iter(
+        [datetime(2026, 10, 7, 7, 59)] * 2  # 启动：补跑判断与首次排期
+        + [datetime(2026, 10, 7, 8, 2, 30)] * 4  # 抖动后的执行时间已过 30 秒
+    )
+    runs = []
+    scheduler = None
+
+    def now_func():
+        # 时钟走完后停止调度器，任务被跳过时测试也不会挂起
+        value = next(times, None)
+        if value is None:
+            scheduler.stop()
+            return datetime(2026, 10, 7, 8, 2, 30)
+        return value
+
+    scheduler = Scheduler(now_func=now_func)
+    scheduler.add_job(
+        "daily_report",
+        lambda: runs.append(now_func()),
+        DailyTrigger("08:00"),
+        jitter=120,
+        misfire_grace=60,
+        catch_up=False,
+    )
+    scheduler.run_forever()
+
+    assert runs == [datetime(2026, 10, 7, 8, 2, 30)]
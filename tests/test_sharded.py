@@ -0,0 +1,93 @@
+import threading
+import time
+
+from src.bot.service.traffic_service import TrafficService
+
+CODES = {f"L{i:02d}": f"馆{i}" for i in range(10)}
+
+
+class ShardApi:
+    """按请求的馆区返回计数；可指定某些分片失败或挂起"""
+
+    def __init__(self, failing=(), hanging=(), flaky=()):
+        self.payload = {"orgLocations": list(CODES)}
+        self.archive = None
+        self.failing = set(failing)
+        self.hanging = set(hanging)
+        self.flaky = set(flaky)
+        self.calls = []
+        self.flushes = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def fetch(self, payload=None, flush=True):
+        locations = tuple((payload or self.payload)["orgLocations"])
+        with self._lock:
+            self.calls.append((locations, flush, threading.current_thread().name))
+            first_try = locations in self.flaky
+            self.flaky.discard(locations)
+        if locations[0] in self.hanging:
+            self.release.wait(timeout=5)
+            return None
+        if locations[0] in self.failing or first_try:
+            return None
+        return {
+            "isSuccess": True,
+            "data": [
+                {
+                    "orgLocation": code,
+                    "orgLocationName": CODES[code],
+                    "fCount": [{"countType": "日", "dateType": 0, "personCount": int(code[1:])}],
+                }
+                for code in locations
+            ],
+        }
+
+    def flush(self):
+        self.flushes += 1
+
+
+def _service(api, **kwargs):
+    options = dict(batch_size=3, max_workers=4, retry_delay=0, collect_timeout=5)
+    options.update(kwargs)
+    return TrafficService(api=api, library_codes=CODES, **options)
+
+
+def test_shards_are_fetched_concurrently_and_merged():
+    api = ShardApi()
+    flow = _service(api).fetch_and_parse_daily_flow()
+    assert sorted(flow) == sorted(CODES)
+    assert flow["L07"]["daily_in"] == 7
+    assert sorted(len(x[0]) for x in api.calls) == [1, 3, 3, 3]
+    # 请求线程不写库，全部分片结束后统一 flush 一次
+    assert all(flush is False for _, flush, _ in api.calls)
+    assert all(name.startswith("traffic-batch") for _, _, name in api.calls)
+    assert api.flushes == 1
+
+
+def test_failed_shard_is_retried_then_skipped():
+    api = ShardApi(failing=["L03"], flaky=[("L06", "L07", "L08")])
+    flow = _service(api, batch_retries=1).fetch_and_parse_daily_flow()
+    assert sorted(flow) == sorted(set(CODES) - {"L03", "L04", "L05"})
+    calls = [x[0] for x in api.calls]
+    assert calls.count(("L03", "L04", "L05")) == 2
+    assert calls.count(("L06", "L07", "L08")) == 2
+
+
+def test_hanging_shard_times_out_without_blocking_others():
+    api = ShardApi(hanging=["L00"])
+    started = time.perf_counter()
+    try:
+        flow = _service(api, collect_timeout=0.3, batch_retries=0).fetch_and_parse_daily_flow()
+    finally:
+        api.release.set()
+    assert time.perf_counter() - started < 2
+    assert sorted(flow) == sorted(set(CODES) - {"L00", "L01", "L02"})
+    assert api.flushes == 1
+
+
+def test_small_location_list_is_not_sharded():
+    api = ShardApi()
+    flow = _service(api, batch_size=20).fetch_and_parse_daily_flow()
+    assert len(flow) == 10
+    assert [(len(x[0]), x[1]) for x in api.calls] == [(10, True)]
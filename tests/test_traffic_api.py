@@ -0,0 +1,190 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from src.bot.api.endpoint_health import STATE_CLOSED, STATE_OPEN, EndpointHealthTracker
+from src.bot.api.traffic_api import TrafficAPI
+
+PRIMARY = "http://primary/api"
+BACKUP = "http://backup/api"
+VALID = {"isSuccess": True, "data": []}
+INVALID = {"isSuccess": False, "data": None}
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+        self.content = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class Endpoint:
+    """可控的上游接口：按顺序返回预置结果，gate 未放行时请求挂起"""
+
+    def __init__(self, *results, blocked=False):
+        self.results = list(results)
+        self.gate = threading.Event()
+        if not blocked:
+            self.gate.set()
+        self.calls = 0
+        self.finished = threading.Event()
+
+    def post(self, url, json=None, timeout=None, stream=False):
+        self.calls += 1
+        try:
+            if not self.gate.wait(timeout=5):
+                raise requests.exceptions.Timeout("gate")
+            result = self.results.pop(0) if len(self.results) > 1 else self.results[0]
+            if isinstance(result, Exception):
+                raise result
+            return FakeResponse(result)
+        finally:
+            self.finished.set()
+
+    def close(self):
+        self.gate.set()
+
+
+def _api(primary, backup, health=None, **kwargs):
+    api = TrafficAPI(
+        PRIMARY, BACKUP, {"orgLocations": []}, {}, health=health or EndpointHealthTracker(), **kwargs
+    )
+    api._sessions = {PRIMARY: primary, BACKUP: backup}
+    return api
+
+
+def test_fast_primary_is_not_hedged():
+    primary, backup = Endpoint(VALID), Endpoint(VALID)
+    api = _api(primary, backup, hedge=True, hedge_delay=1)
+    try:
+        assert api.fetch() == VALID
+        assert (primary.calls, backup.calls) == (1, 0)
+    finally:
+        api.close()
+
+
+def test_slow_primary_is_hedged_and_not_waited_for():
+    primary, backup = Endpoint(dict(VALID, source="primary"), blocked=True), Endpoint(VALID)
+    api = _api(primary, backup, hedge=True, hedge_delay=0.05)
+    try:
+        started = time.perf_counter()
+        assert api.fetch() == VALID
+        # 备用接口先返回即结束，不等挂起的主接口
+        assert time.perf_counter() - started < 1
+        assert backup.calls == 1
+        assert not primary.finished.is_set()
+
+        # 主接口晚到的结果只记入健康度，不影响已返回的数据
+        primary.gate.set()
+        assert primary.finished.wait(timeout=5)
+        deadline = time.monotonic() + 5
+        while api.health.sample_count(PRIMARY) == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert api.health.sample_count(PRIMARY) == 1
+    finally:
+        api.close()
+
+
+def test_hedge_falls_back_to_primary_when_backup_is_invalid():
+    primary = Endpoint(VALID, blocked=True)
+    backup = Endpoint(INVALID)
+    api = _api(primary, backup, hedge=True, hedge_delay=0.05)
+    try:
+        threading.Timer(0.2, primary.gate.set).start()
+        assert api.fetch() == VALID
+        assert api.health.stats(BACKUP)["consecutive_failures"] == 1
+    finally:
+        api.close()
+
+
+def test_invalid_primary_switches_to_backup_within_budget():
+    primary, backup = Endpoint(INVALID), Endpoint(VALID)
+    api = _api(primary, backup, hedge=True, hedge_delay=1)
+    try:
+        assert api.fetch() == VALID
+        assert (primary.calls, backup.calls) == (1, 1)
+    finally:
+        api.close()
+
+
+def test_open_backup_breaker_disables_hedging():
+    health = EndpointHealthTracker(failure_threshold=1)
+    health.record_success(PRIMARY, 0.1)
+    health.record_failure(BACKUP, 1.0)
+    assert health.stats(BACKUP)["state"] == STATE_OPEN
+
+    primary, backup = Endpoint(VALID, blocked=True), Endpoint(VALID)
+    api = _api(primary, backup, health=health, hedge=True, hedge_delay=0.05)
+    try:
+        threading.Timer(0.2, primary.gate.set).start()
+        assert api.fetch() == VALID
+        # 熔断中的备用接口不参与对冲，只能等主接口
+        assert backup.calls == 0
+    finally:
+        api.close()
+
+
+def test_breaker_skips_failing_primary_until_probe(monkeypatch):
+    health = EndpointHealthTracker(failure_threshold=2, open_seconds=60)
+    # 主接口历史耗时更短，排在备用接口之前
+    health.record_success(PRIMARY, 0.0)
+    for _ in range(3):
+        health.record_success(BACKUP, 1.0)
+    primary = Endpoint(requests.exceptions.ConnectionError("down"))
+    backup = Endpoint(VALID)
+    api = _api(primary, backup, health=health)
+    try:
+        for _ in range(2):
+            assert api.fetch() == VALID
+        assert health.stats(PRIMARY)["state"] == STATE_OPEN
+        # 熔断期间只请求备用接口
+        assert api.fetch() == VALID
+        assert primary.calls == 2
+
+        # 冷却结束后主接口半开探测一次，成功即关闭熔断
+        now = time.time() + 60
+        monkeypatch.setattr("src.bot.api.endpoint_health.time.time", lambda: now)
+        primary.results = [VALID]
+        assert api.fetch() == VALID
+        assert primary.calls == 3
+        assert health.stats(PRIMARY)["state"] == STATE_CLOSED
+    finally:
+        api.close()
+
+
+def test_all_breakers_open_forces_a_probe():
+    health = EndpointHealthTracker(failure_threshold=1, open_seconds=600)
+    health.record_failure(PRIMARY, 1.0)
+    health.record_failure(BACKUP, 1.0)
+    primary, backup = Endpoint(VALID), Endpoint(VALID)
+    api = _api(primary, backup, health=health, probe_timeout=3)
+    try:
+        assert api.fetch() == VALID
+        # 最早熔断的接口被强制探测
+        assert (primary.calls, backup.calls) == (1, 0)
+    finally:
+        api.close()
+
+
+def test_hedge_budget_tracks_primary_latency():
+    health = EndpointHealthTracker()
+    api = _api(Endpoint(VALID), Endpoint(VALID), health=health, hedge_delay=2.0)
+    assert api.hedge_budget() == 2.0
+    for latency in (0.1, 0.2, 0.3, 0.4, 0.5, 3.0):
+        health.record_success(PRIMARY, latency)
+    assert api.hedge_budget() == pytest.approx(3.0)
+    api.hedge_percentile = 0.5
+    assert api.hedge_budget() == pytest.approx(0.3)